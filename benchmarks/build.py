@@ -0,0 +1,155 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+# Benchmark the build pipeline on synthetic configurations of increasing
+# size (each layer with its own data files), reporting the wall time, peak
+# memory and files written of each step and how its per-layer cost scales,
+# e.g.:
+#
+#   python3 benchmarks/build.py --layers 100 --layers 1000 --layers 5000
+
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import click
+
+from synthetic import get_env, synthesize_config
+
+# build steps: (name, geomet-climate command, whether it supports --jobs)
+STEPS = [
+    ('vrt', ['vrt', 'generate'], False),
+    ('tileindex', ['tileindex', 'generate'], True),
+    ('legend', ['legend', 'generate'], False),
+    ('mapfile-WMS', ['mapfile', 'generate', '--service', 'WMS'], True),
+    ('mapfile-WCS', ['mapfile', 'generate', '--service', 'WCS'], True)
+]
+
+
+def get_files_written(basedir, since):
+    """
+    :param basedir: build directory
+    :param since: start time of step (seconds since epoch)
+
+    :returns: tuple of number and size (bytes) of files written since then
+    """
+
+    num_files = 0
+    size = 0
+
+    for dirpath, dirnames, filenames in os.walk(basedir):
+        for filename in filenames:
+            stat = os.lstat(os.path.join(dirpath, filename))
+            if stat.st_mtime >= since:
+                num_files += 1
+                size += stat.st_size
+
+    return num_files, size
+
+
+def run_step(command, env):
+    """
+    run a geomet-climate command
+
+    :returns: tuple of wall time (seconds) and peak RSS (MiB) of the
+              largest process of the command (including its workers)
+    """
+
+    start = time.monotonic()
+    process = subprocess.Popen(['geomet-climate'] + command, env=env)
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall = time.monotonic() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode != 0:
+        raise click.ClickException('{} failed'.format(' '.join(command)))
+
+    # ru_maxrss is in KiB on Linux
+    return wall, rusage.ru_maxrss / 1024
+
+
+@click.command()
+@click.option('--layers', '-l', 'num_layers', type=int, multiple=True,
+              default=[100, 500, 2000],
+              help='number of synthetic layers (repeatable)')
+@click.option('--jobs', '-j', type=int, default=1,
+              help='number of parallel processes of tileindex and mapfile')
+@click.option('--output', '-o', type=click.Path(),
+              help='write results as JSON')
+def benchmark(num_layers, jobs, output):
+    """benchmark the build pipeline at several configuration sizes"""
+
+    tmpdir = tempfile.mkdtemp(prefix='geomet-climate-bench-')
+    results = []
+
+    for num_layers_ in sorted(num_layers):
+        basedir = os.path.join(tmpdir, 'build-{}'.format(num_layers_))
+        datadir = os.path.join(tmpdir, 'data-{}'.format(num_layers_))
+        config = os.path.join(tmpdir, 'geomet-climate-{}.yml'.format(
+            num_layers_))
+
+        synthesize_config(num_layers_, config, datadir=datadir)
+        env = get_env(basedir, config, datadir)
+
+        for name, command, parallel in STEPS:
+            if parallel:
+                command = command + ['--jobs', str(jobs)]
+
+            since = time.time()
+            wall, rss = run_step(command, env)
+            num_files, size = get_files_written(basedir, since)
+
+            results.append({
+                'layers': num_layers_,
+                'step': name,
+                'wall': wall,
+                'peak_rss_mb': round(rss, 1),
+                'files': num_files,
+                'bytes': size
+            })
+
+    # per layer cost relative to the smallest configuration: values well
+    # above 1 at larger sizes show super-linear scaling
+    baseline = {r['step']: r['wall'] / r['layers'] for r in results
+                if r['layers'] == min(num_layers)}
+
+    click.echo('{:<12} {:>7} {:>9} {:>9} {:>8} {:>12} {:>10}'.format(
+        'step', 'layers', 'wall (s)', 'RSS (MB)', 'files', 'bytes',
+        'per layer'))
+    for r in results:
+        r['per_layer_ratio'] = round(
+            r['wall'] / r['layers'] / baseline[r['step']], 2)
+        r['wall'] = round(r['wall'], 3)
+        click.echo('{:<12} {:>7} {:>9.2f} {:>9.1f} {:>8} {:>12} {:>9.2f}x'
+                   .format(r['step'], r['layers'], r['wall'],
+                           r['peak_rss_mb'], r['files'], r['bytes'],
+                           r['per_layer_ratio']))
+
+    if output is not None:
+        with io.open(output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+    click.echo('outputs in {}'.format(tmpdir))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,98 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+# Benchmark serial vs. parallel `geomet-climate mapfile generate`
+# on a synthetic configuration, e.g.:
+#
+#   python3 benchmarks/mapfile_generate.py --layers 3000 --jobs 1 --jobs 8
+
+import io
+import os
+import subprocess
+import tempfile
+import time
+
+import click
+
+from synthetic import get_env, synthesize_config
+
+
+def read_mapfile(filepath, basedir):
+    """
+    read a mapfile, ignoring the build directory and the (time based)
+    update sequence
+    """
+
+    with io.open(filepath) as fh:
+        return [line.replace(basedir, '$BASEDIR') for line in fh
+                if 'ows_updatesequence' not in line]
+
+
+@click.command()
+@click.option('--layers', '-l', 'num_layers', type=int, default=3000,
+              help='number of synthetic layers')
+@click.option('--jobs', '-j', type=int, multiple=True, default=[1, 4],
+              help='number of parallel processes (repeatable)')
+@click.option('--service', '-s', type=click.Choice(['WMS', 'WCS']),
+              default='WMS', help='service')
+def benchmark(num_layers, jobs, service):
+    """benchmark mapfile generation"""
+
+    tmpdir = tempfile.mkdtemp(prefix='geomet-climate-bench-')
+    config = os.path.join(tmpdir, 'geomet-climate.yml')
+    synthesize_config(num_layers, config)
+
+    timings = {}
+    reference = None
+
+    for jobs_ in jobs:
+        basedir = os.path.join(tmpdir, 'build-j{}'.format(jobs_))
+        env = get_env(basedir, config)
+
+        start = time.monotonic()
+        subprocess.check_call(['geomet-climate', 'mapfile', 'generate',
+                               '--service', service, '--jobs', str(jobs_)],
+                              env=env)
+        timings[jobs_] = time.monotonic() - start
+
+        if reference is None:
+            reference = basedir
+            continue
+
+        mismatch = 0
+        for f in os.listdir(os.path.join(reference, 'mapfile')):
+            if f.endswith('.map'):
+                ref = read_mapfile(
+                    os.path.join(reference, 'mapfile', f), reference)
+                new = read_mapfile(
+                    os.path.join(basedir, 'mapfile', f), basedir)
+                mismatch += ref != new
+        click.echo('jobs={}: mapfiles differing from jobs={}: {}'.format(
+            jobs_, jobs[0], mismatch))
+
+    click.echo('\n{} layers, {}'.format(num_layers, service))
+    for jobs_, elapsed in timings.items():
+        click.echo('jobs={:<3} {:8.2f}s  speedup x{:.2f}'.format(
+            jobs_, elapsed, timings[jobs[0]] / elapsed))
+
+    click.echo('outputs in {}'.format(tmpdir))
+
+
+if __name__ == '__main__':
+    benchmark()
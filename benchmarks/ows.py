@@ -0,0 +1,320 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+# Load test the OWS endpoint: build the test configuration, replay a
+# recorded mix of requests through the WSGI application in worker
+# processes and report throughput, latency percentiles and RSS per worker
+# as JSON, optionally comparing with the results of a previous run, e.g.:
+#
+#   python3 benchmarks/ows.py --workers 4 --output ows-1.17.json
+#   python3 benchmarks/ows.py --workers 4 --compare ows-1.17.json
+
+from datetime import datetime, timezone
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+from urllib.parse import parse_qsl
+
+import click
+import yaml
+from yaml import CLoader
+
+from synthetic import TEST_CONFIG, build
+
+GETCAPABILITIES = 'service={}&version={}&request=GetCapabilities&lang={}'
+LAYER_GETCAPABILITIES = ('service=WMS&version=1.3.0&request=GetCapabilities&'
+                         'layer={}')
+GETMAP = ('service=WMS&version=1.3.0&request=GetMap&layers={}&styles=&'
+          'crs=EPSG:4326&bbox=40,-100,60,-60&width=256&height=256&'
+          'format=image/png')
+GETLEGENDGRAPHIC = ('service=WMS&version=1.3.0&request=GetLegendGraphic&'
+                    'layer={}&format=image/png&sld_version=1.1.0')
+GETCOVERAGE = ('service=WCS&version=2.0.1&request=GetCoverage&'
+               'coverageid={}&format=image/tiff')
+
+# number of TIME values requested per layer (most recent time steps)
+TIME_STEPS = 2
+
+
+def record_workload(cfg):
+    """
+    query strings of a mix of GetCapabilities, GetMap (with and without
+    TIME), GetLegendGraphic and WCS GetCoverage requests on every layer
+
+    :param cfg: configuration
+
+    :returns: `list` of query strings
+    """
+
+    from geomet_climate.seed import get_times
+
+    workload = []
+
+    for service, version in [('WMS', '1.3.0'), ('WCS', '2.0.1')]:
+        for lang in ['en', 'fr']:
+            workload.append(GETCAPABILITIES.format(service, version, lang))
+
+    for key, layer_info in cfg['layers'].items():
+        workload.append(LAYER_GETCAPABILITIES.format(key))
+        workload.append(GETMAP.format(key))
+        for time_ in get_times(layer_info, TIME_STEPS)[1:]:
+            workload.append('{}&time={}'.format(GETMAP.format(key), time_))
+
+        if layer_info['type'] == 'RASTER':
+            workload.append(GETLEGENDGRAPHIC.format(key))
+            workload.append(GETCOVERAGE.format(key))
+
+    return workload
+
+
+def get_kind(query_string):
+    """
+    :param query_string: query string of request
+
+    :returns: `str` of request kind (i.e. WMS GetMap+TIME)
+    """
+
+    params = {key.upper(): value for key, value in parse_qsl(query_string)}
+
+    kind = '{} {}'.format(params.get('SERVICE'), params.get('REQUEST'))
+    if 'LAYER' in params and params.get('REQUEST') == 'GetCapabilities':
+        kind += '+LAYER'
+    if 'TIME' in params:
+        kind += '+TIME'
+
+    return kind
+
+
+def call(application, query_string):
+    """
+    run a request through the WSGI application
+
+    :returns: `bool` of whether the request succeeded
+    """
+
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+
+    content = b''.join(application({'QUERY_STRING': query_string,
+                                    'REQUEST_METHOD': 'GET'},
+                                   start_response))
+
+    return (response['status'] == '200 OK' and
+            b'ExceptionReport' not in content[:1024])
+
+
+def run_worker(worker, workload, passes, seed, barrier, results):
+    """
+    replay the workload in a worker process, once untimed (warm up) then
+    timed passes in a shuffled order, and report (kind, latency, success)
+    of each request and the peak RSS of the worker
+    """
+
+    # geomet_climate reads its environment at import time
+    from geomet_climate.wsgi import application
+
+    for query_string in workload:
+        call(application, query_string)
+
+    rng = random.Random(seed + worker)
+    samples = []
+
+    barrier.wait()
+
+    for i in range(passes):
+        order = list(workload)
+        rng.shuffle(order)
+        for query_string in order:
+            start = time.perf_counter()
+            success = call(application, query_string)
+            samples.append((get_kind(query_string),
+                            time.perf_counter() - start, success))
+
+    # ru_maxrss is in KiB on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    results.put((worker, samples, rss))
+
+
+def percentile(values, p):
+    """
+    :param values: sorted values
+    :param p: percentile (0-100)
+
+    :returns: nearest-rank percentile of values
+    """
+
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(samples):
+    """
+    :param samples: `list` of (kind, latency, success) tuples
+
+    :returns: `dict` of request count, errors and latencies (ms)
+    """
+
+    latencies = sorted(latency * 1000 for _, latency, _ in samples)
+
+    return {
+        'requests': len(samples),
+        'errors': sum(not success for _, _, success in samples),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3)
+        }
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    compare results with a previous run
+
+    :returns: `list` of regressions (throughput drops or p95 latency
+              increases beyond tolerance)
+    """
+
+    regressions = []
+
+    ratio = results['requests_per_second'] / baseline['requests_per_second']
+    click.echo('requests/s   {:10.1f} vs {:10.1f}  x{:.2f}'.format(
+        results['requests_per_second'], baseline['requests_per_second'],
+        ratio))
+    if ratio < 1 - tolerance:
+        regressions.append('requests/s')
+
+    for kind, summary in sorted(results['by_request'].items()):
+        if kind not in baseline['by_request']:
+            continue
+        p95 = summary['latency_ms']['p95']
+        p95_ = baseline['by_request'][kind]['latency_ms']['p95']
+        click.echo('{:<32} p95 {:8.2f}ms vs {:8.2f}ms  x{:.2f}'.format(
+            kind, p95, p95_, p95 / p95_))
+        if p95 > p95_ * (1 + tolerance):
+            regressions.append('{} p95'.format(kind))
+
+    return regressions
+
+
+@click.command()
+@click.option('--workers', '-w', type=int, default=1,
+              help='number of worker processes')
+@click.option('--passes', '-p', type=int, default=3,
+              help='number of timed passes over the workload per worker')
+@click.option('--seed', type=int, default=0, help='request order seed')
+@click.option('--workload', 'workload_file', type=click.Path(exists=True),
+              help='replay a recorded workload (one query string per line) '
+                   'instead of the request mix of the test configuration')
+@click.option('--output', '-o', type=click.Path(),
+              help='write results as JSON')
+@click.option('--compare', 'baseline_file', type=click.Path(exists=True),
+              help='compare with the JSON results of a previous run')
+@click.option('--tolerance', type=float, default=0.1,
+              help='regression tolerance of --compare (fraction)')
+def benchmark(workers, passes, seed, workload_file, output, baseline_file,
+              tolerance):
+    """load test the OWS endpoint"""
+
+    tmpdir = tempfile.mkdtemp(prefix='geomet-climate-bench-')
+    os.environ.update(build(tmpdir))
+
+    from geomet_climate import __version__
+
+    if workload_file is not None:
+        with io.open(workload_file) as fh:
+            workload = [line.strip() for line in fh if line.strip()]
+    else:
+        with io.open(TEST_CONFIG) as fh:
+            cfg = yaml.load(fh, Loader=CLoader)
+        workload = record_workload(cfg)
+        workload_file = os.path.join(tmpdir, 'workload.txt')
+        with io.open(workload_file, 'w') as fh:
+            fh.write('\n'.join(workload) + '\n')
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers + 1)
+    results_queue = context.Queue()
+
+    processes = [context.Process(target=run_worker,
+                                 args=(worker, workload, passes, seed,
+                                       barrier, results_queue))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    # time the timed passes only, once every worker has warmed up
+    barrier.wait()
+    start = time.monotonic()
+    worker_results = sorted(results_queue.get() for _ in processes)
+    duration = time.monotonic() - start
+
+    for process in processes:
+        process.join()
+
+    samples = [sample for _, samples_, _ in worker_results
+               for sample in samples_]
+    by_kind = {}
+    for sample in samples:
+        by_kind.setdefault(sample[0], []).append(sample)
+
+    results = {
+        'version': __version__,
+        'timestamp': datetime.now(timezone.utc).strftime(
+            '%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'workload': workload_file,
+        'workers': workers,
+        'passes': passes,
+        'duration': round(duration, 3),
+        'requests_per_second': round(len(samples) / duration, 2),
+        'rss_mb': [round(rss, 1) for _, _, rss in worker_results]
+    }
+    results.update(summarize(samples))
+    results['by_request'] = {kind: summarize(samples_)
+                             for kind, samples_ in sorted(by_kind.items())}
+
+    click.echo(json.dumps(results, indent=2))
+
+    if output is not None:
+        with io.open(output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+    click.echo('outputs in {}'.format(tmpdir))
+
+    if baseline_file is not None:
+        with io.open(baseline_file) as fh:
+            regressions = compare(results, json.load(fh), tolerance)
+        if regressions:
+            raise click.ClickException('regressions: {}'.format(
+                ', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    benchmark()
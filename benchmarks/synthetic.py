@@ -0,0 +1,159 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import io
+import os
+import subprocess
+
+import yaml
+from yaml import CDumper, CLoader
+
+THISDIR = os.path.dirname(os.path.realpath(__file__))
+
+TEST_CONFIG = os.path.join(THISDIR, '..', 'tests', 'geomet-climate-test.yml')
+TEST_DATADIR = os.path.join(THISDIR, '..', 'tests', 'data', 'climate')
+
+# geomet-climate commands of a full build, in order
+BUILD_COMMANDS = [
+    ['vrt', 'generate'],
+    ['tileindex', 'generate'],
+    ['legend', 'generate'],
+    ['mapfile', 'generate', '--service', 'WMS'],
+    ['mapfile', 'generate', '--service', 'WCS'],
+    ['capabilities', 'generate']
+]
+
+
+def get_source_files(layer_info, datadir):
+    """
+    data files of a layer in a data directory (a single file, or the set
+    of files sharing the filename prefix)
+
+    :param layer_info: layer information
+    :param datadir: path to data directory
+
+    :returns: `list` of data file paths
+    """
+
+    if layer_info.get('type') != 'RASTER' or 'filepath' not in layer_info:
+        return []
+
+    dirname = os.path.join(datadir, layer_info['climate_model']['basepath'],
+                           layer_info['filepath'])
+    filepath = os.path.join(dirname, layer_info['filename'])
+
+    if os.path.isfile(filepath):
+        return [filepath]
+    if not os.path.isdir(dirname):
+        return []
+
+    return sorted(os.path.join(dirname, f) for f in os.listdir(dirname)
+                  if f.startswith(layer_info['filename']))
+
+
+def synthesize_config(num_layers, filepath, config=TEST_CONFIG,
+                      datadir=None, source_datadir=TEST_DATADIR):
+    """
+    write a configuration with num_layers layers, cycling through
+    the layers of an existing configuration (layers keep referencing
+    its layer_groups and layer_templates anchors)
+
+    :param num_layers: number of layers to generate
+    :param filepath: path to output configuration
+    :param config: path to source configuration
+    :param datadir: if set, data directory in which each synthesized
+                    layer gets its own data files (symbolic links to the
+                    files of its source layer), as in production
+    :param source_datadir: path to data directory of source configuration
+
+    :returns: `dict` of synthesized configuration
+    """
+
+    with io.open(config) as fh:
+        cfg = yaml.load(fh, Loader=CLoader)
+
+    source_layers = list(cfg['layers'].items())
+    layers = {}
+
+    for i in range(num_layers):
+        key, value = source_layers[i % len(source_layers)]
+        source_files = []
+
+        if datadir is not None:
+            source_files = get_source_files(value, source_datadir)
+
+        if source_files:
+            value = dict(value, filepath='{}/S{}'.format(value['filepath'],
+                                                         i))
+            dirname = os.path.join(datadir, value['climate_model']['basepath'],
+                                   value['filepath'])
+            os.makedirs(dirname, exist_ok=True)
+            for source_file in source_files:
+                os.symlink(os.path.abspath(source_file), os.path.join(
+                    dirname, os.path.basename(source_file)))
+
+        layers['{}.S{}'.format(key, i)] = value
+
+    cfg['layers'] = layers
+
+    with io.open(filepath, 'w', encoding='utf-8') as fh:
+        yaml.dump(cfg, fh, Dumper=CDumper, allow_unicode=True)
+
+    return cfg
+
+
+def get_env(basedir, config, datadir=TEST_DATADIR):
+    """
+    environment for running geomet-climate against a synthesized build
+
+    :param basedir: build directory
+    :param config: path to configuration
+    :param datadir: path to data directory
+
+    :returns: `dict` of environment variables
+    """
+
+    env = os.environ.copy()
+    env.update({
+        'GEOMET_CLIMATE_BASEDIR': basedir,
+        'GEOMET_CLIMATE_CONFIG': config,
+        'GEOMET_CLIMATE_DATADIR': os.path.abspath(datadir),
+        'GEOMET_CLIMATE_URL': 'http://localhost:8099'
+    })
+
+    return env
+
+
+def build(basedir, config=TEST_CONFIG):
+    """
+    build a configuration (VRTs, tileindexes, legends, mapfiles and
+    capabilities) with the geomet-climate command line
+
+    :param basedir: build directory
+    :param config: path to configuration
+
+    :returns: `dict` of environment variables of the build
+    """
+
+    env = get_env(basedir, config)
+
+    for command in BUILD_COMMANDS:
+        subprocess.check_call(['geomet-climate'] + command, env=env)
+
+    return env
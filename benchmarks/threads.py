@@ -0,0 +1,140 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+# Stress test the WSGI application with concurrent mixed WMS/WCS requests
+# against a build of the test configuration, checking that every response
+# is identical to the serial one, e.g.:
+#
+#   python3 benchmarks/threads.py --threads 8 --rounds 5
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import click
+import yaml
+from yaml import CLoader
+
+from synthetic import TEST_CONFIG, build
+
+GETMAP = ('service=WMS&version=1.3.0&request=GetMap&layers={}&styles=&'
+          'crs=EPSG:4326&bbox=40,-100,60,-60&width=256&height=256&'
+          'format=image/png')
+GETCAPABILITIES = 'service=WMS&version=1.3.0&request=GetCapabilities&layer={}'
+DESCRIBECOVERAGE = ('service=WCS&version=2.0.1&request=DescribeCoverage&'
+                    'coverageid={}')
+GETCOVERAGE = ('service=WCS&version=2.0.1&request=GetCoverage&'
+               'coverageid={}&format=image/tiff')
+
+
+def get_requests(cfg):
+    """
+    query strings of a mix of WMS and WCS requests on every layer
+    """
+
+    requests = []
+
+    for key, layer_info in cfg['layers'].items():
+        requests.append(GETMAP.format(key))
+        requests.append(GETCAPABILITIES.format(key))
+        if layer_info['type'] == 'RASTER':
+            requests.append(DESCRIBECOVERAGE.format(key))
+            requests.append(GETCOVERAGE.format(key))
+
+    return requests
+
+
+def call(application, query_string):
+    """
+    run a request through the WSGI application
+
+    :returns: tuple of status, content type and digest of content
+    """
+
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+        response['headers'] = dict(headers)
+
+    content = b''.join(application({'QUERY_STRING': query_string,
+                                    'REQUEST_METHOD': 'GET'},
+                                   start_response))
+
+    return (response['status'], response['headers'].get('Content-Type'),
+            hashlib.sha256(content).hexdigest())
+
+
+@click.command()
+@click.option('--threads', '-t', type=int, default=8,
+              help='number of concurrent threads')
+@click.option('--rounds', '-r', type=int, default=5,
+              help='number of times each request is run concurrently')
+@click.option('--seed', type=int, default=0, help='request order seed')
+def stress(threads, rounds, seed):
+    """stress test the WSGI application with concurrent requests"""
+
+    tmpdir = tempfile.mkdtemp(prefix='geomet-climate-bench-')
+    os.environ.update(build(tmpdir))
+
+    # geomet_climate reads its environment at import time
+    from geomet_climate.wsgi import application
+
+    with io.open(TEST_CONFIG) as fh:
+        cfg = yaml.load(fh, Loader=CLoader)
+
+    requests = get_requests(cfg)
+
+    start = time.monotonic()
+    expected = {qs: call(application, qs) for qs in requests}
+    serial = time.monotonic() - start
+
+    workload = requests * rounds
+    random.Random(seed).shuffle(workload)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(threads) as executor:
+        responses = list(executor.map(lambda qs: call(application, qs),
+                                      workload))
+    concurrent = time.monotonic() - start
+
+    mismatch = [qs for qs, response in zip(workload, responses)
+                if response != expected[qs]]
+
+    click.echo('{} requests, {} threads, responses differing from serial: {}'
+               .format(len(workload), threads, len(mismatch)))
+    for qs in sorted(set(mismatch)):
+        click.echo('  {}'.format(qs))
+
+    click.echo('serial     {:8.1f} requests/s'.format(len(requests) / serial))
+    click.echo('concurrent {:8.1f} requests/s'.format(
+        len(workload) / concurrent))
+
+    click.echo('outputs in {}'.format(tmpdir))
+
+    if mismatch:
+        raise click.ClickException('concurrent responses differ')
+
+
+if __name__ == '__main__':
+    stress()
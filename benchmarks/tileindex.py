@@ -0,0 +1,159 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+# Benchmark the tileindex GeoPackage writer against the previous
+# feature-at-a-time writer on the layers of the test configuration, e.g.:
+#
+#   python3 benchmarks/tileindex.py --repeat 5
+
+import io
+import os
+import tempfile
+import time
+
+import click
+import yaml
+from yaml import CLoader
+
+from synthetic import TEST_CONFIG, get_env
+
+
+def write_tileindex_legacy(ds_path, ds_name, projection, extent, records):
+    """
+    previous tileindex writer: one implicit transaction per feature,
+    a new geometry per feature and a VACUUM once written
+    """
+
+    from osgeo import ogr, osr
+
+    driver = ogr.GetDriverByName('GPKG')
+
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+
+    if os.path.exists(ds_path):
+        driver.DeleteDataSource(ds_path)
+
+    ds = driver.CreateDataSource(ds_path)
+    layer = ds.CreateLayer(ds_name, srs, ogr.wkbPolygon)
+    layerdefinition = layer.GetLayerDefn()
+    layer.CreateField(ogr.FieldDefn('location', ogr.OFTString))
+    layer.CreateField(ogr.FieldDefn('timestamp', ogr.OFTString))
+
+    extent = [int(s) for s in extent]
+
+    for location, timestamp in records:
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        ring.AddPoint(extent[0], extent[1])
+        ring.AddPoint(extent[0], extent[3])
+        ring.AddPoint(extent[2], extent[3])
+        ring.AddPoint(extent[2], extent[1])
+        ring.AddPoint(extent[0], extent[1])
+        poly = ogr.Geometry(ogr.wkbPolygon)
+        poly.AddGeometry(ring)
+
+        feature = ogr.Feature(layerdefinition)
+        feature.SetGeometry(poly)
+        feature.SetField('location', location)
+        feature.SetField('timestamp', timestamp)
+        layer.CreateFeature(feature)
+
+    ds.ExecuteSQL('VACUUM')
+    ds.Destroy()
+
+
+def read_tileindex(ds_path):
+    """
+    read the (location, timestamp) records of a tileindex GeoPackage
+    """
+
+    from osgeo import ogr
+
+    ds = ogr.Open(ds_path)
+    records = sorted((f.GetField('location'), f.GetField('timestamp'))
+                     for f in ds.GetLayer(0))
+    ds = None
+
+    return records
+
+
+@click.command()
+@click.option('--repeat', '-r', type=int, default=3,
+              help='number of times each layer is written')
+@click.option('--vacuum', is_flag=True,
+              help='VACUUM the GeoPackages written by the current writer')
+def benchmark(repeat, vacuum):
+    """benchmark tileindex GeoPackage writes"""
+
+    tmpdir = tempfile.mkdtemp(prefix='geomet-climate-bench-')
+    os.environ.update(get_env(tmpdir, TEST_CONFIG))
+
+    # geomet_climate reads its environment at import time
+    from geomet_climate.manifest import get_data_files
+    from geomet_climate.tileindex import (
+        get_tileindex_records, get_time_index_vrt, write_tileindex)
+
+    with io.open(TEST_CONFIG) as fh:
+        cfg = yaml.load(fh, Loader=CLoader)
+
+    writers = {
+        'legacy': write_tileindex_legacy,
+        'current': lambda *args: write_tileindex(*args, vacuum=vacuum)
+    }
+    timings = dict.fromkeys(writers, 0)
+    num_features = 0
+    mismatch = 0
+
+    for key, layer_info in cfg['layers'].items():
+        if any([layer_info['type'] != 'RASTER',
+                not layer_info['climate_model'].get('is_vrt'),
+                layer_info.get('num_bands', 1) < 2,
+                not get_data_files(layer_info)]):
+            continue
+
+        records = get_tileindex_records(layer_info,
+                                        get_time_index_vrt(layer_info))
+        num_features += len(records) * repeat
+
+        outputs = {}
+        for name, writer in writers.items():
+            ds_path = os.path.join(tmpdir, '{}-{}.gpkg'.format(key, name))
+            args = (ds_path, key, layer_info['climate_model']['projection'],
+                    layer_info['climate_model']['extent'], records)
+
+            start = time.monotonic()
+            for i in range(repeat):
+                writer(*args)
+            timings[name] += time.monotonic() - start
+
+            outputs[name] = read_tileindex(ds_path)
+
+        mismatch += outputs['legacy'] != outputs['current']
+
+    click.echo('{} features, tileindexes differing: {}'.format(
+        num_features, mismatch))
+    for name, elapsed in timings.items():
+        click.echo('{:<8} {:8.2f}s  speedup x{:.2f}'.format(
+            name, elapsed, timings['legacy'] / elapsed))
+
+    click.echo('outputs in {}'.format(tmpdir))
+
+
+if __name__ == '__main__':
+    benchmark()
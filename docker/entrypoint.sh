@@ -46,17 +46,11 @@ geomet-climate mapfile generate -s WMS
 echo "Generating geomet-climate mapfile for WCS..."
 geomet-climate mapfile generate -s WCS
 
-echo "Caching WMS (English)..."
-mapserv -nh QUERY_STRING="map=$GEOMET_CLIMATE_BASEDIR/mapfile/geomet-climate-WMS-en.map&service=WMS&version=1.3.0&request=GetCapabilities" > $GEOMET_CLIMATE_BASEDIR/geomet-climate-WMS-1.3.0-capabilities-en.xml && mv -f $GEOMET_CLIMATE_BASEDIR/geomet-climate-WMS-1.3.0-capabilities-en.xml $GEOMET_CLIMATE_BASEDIR/mapfile
+echo "Caching WMS and WCS capabilities..."
+geomet-climate capabilities generate
 
-echo "Caching WMS (French)..."
-mapserv -nh QUERY_STRING="map=$GEOMET_CLIMATE_BASEDIR/mapfile/geomet-climate-WMS-fr.map&lang=fr&service=WMS&version=1.3.0&request=GetCapabilities" > $GEOMET_CLIMATE_BASEDIR/geomet-climate-WMS-1.3.0-capabilities-fr.xml && mv -f $GEOMET_CLIMATE_BASEDIR/geomet-climate-WMS-1.3.0-capabilities-fr.xml $GEOMET_CLIMATE_BASEDIR/mapfile
-
-echo "Caching WCS (English)..."
-mapserv -nh QUERY_STRING="map=$GEOMET_CLIMATE_BASEDIR/mapfile/geomet-climate-WCS-en.map&service=WCS&version=2.1.0&request=GetCapabilities" > $GEOMET_CLIMATE_BASEDIR/geomet-climate-WCS-2.0.1-capabilities-en.xml && mv -f $GEOMET_CLIMATE_BASEDIR/geomet-climate-WCS-2.0.1-capabilities-en.xml $GEOMET_CLIMATE_BASEDIR/mapfile
-
-echo "Caching WCS (French)..."
-mapserv -nh QUERY_STRING="map=$GEOMET_CLIMATE_BASEDIR/mapfile/geomet-climate-WCS-fr.map&lang=fr&service=WCS&version=2.1.0&request=GetCapabilities" > $GEOMET_CLIMATE_BASEDIR/geomet-climate-WCS-2.0.1-capabilities-fr.xml && mv -f $GEOMET_CLIMATE_BASEDIR/geomet-climate-WCS-2.0.1-capabilities-fr.xml $GEOMET_CLIMATE_BASEDIR/mapfile
+echo "Precompressing capabilities and legends..."
+geomet-climate capabilities compress
 
 
 
@@ -65,5 +59,4 @@ echo "Done."
 
 # server runs
 echo "Starting up geomet-climate via gunicorn..."
-# geomet-climate serve --port=80
-gunicorn -w 2 -b 0.0.0.0:8099 --chdir $BASEDIR/geomet_climate wsgi:application --reload --timeout 900 --access-logfile /tmp/gunicorn-geomet-climate.log
\ No newline at end of file
+geomet-climate serve --port=8099 --workers=2 --threads=4 --access-log=/tmp/gunicorn-geomet-climate.log
\ No newline at end of file
@@ -21,8 +21,10 @@ __version__ = '1.17.dev0'
 
 import click
 
+from geomet_climate.capabilities import capabilities
 from geomet_climate.legend import legend
 from geomet_climate.mapfile import mapfile
+from geomet_climate.seed import cache
 from geomet_climate.tileindex import tileindex
 from geomet_climate.vrt import vrt
 from geomet_climate.wsgi import serve
@@ -39,3 +41,5 @@ cli.add_command(vrt)
 cli.add_command(tileindex)
 cli.add_command(serve)
 cli.add_command(legend)
+cli.add_command(capabilities)
+cli.add_command(cache)
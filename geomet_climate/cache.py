@@ -0,0 +1,377 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+from collections import OrderedDict
+import io
+import logging
+import os
+import tempfile
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    bounded mapping evicting its least recently used items, safe to share
+    between the threads of a worker
+    """
+
+    def __init__(self, maxsize):
+        """
+        initialize cache
+
+        :param maxsize: maximum number of items
+
+        :returns: `geomet_climate.cache.LRUCache` instance
+        """
+
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        get an item, marking it as recently used
+
+        :param key: item key
+        :param default: value returned if the key is not cached
+
+        :returns: cached value or default
+        """
+
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                return default
+
+            return self._items[key]
+
+    def set(self, key, value):
+        """
+        cache an item, evicting the least recently used items beyond
+        the size of the cache
+
+        :param key: item key
+        :param value: item value
+
+        :returns: None
+        """
+
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.maxsize:
+                key_, _ = self._items.popitem(last=False)
+                LOGGER.debug('Evicting {}'.format(key_))
+
+    def pop(self, key, default=None):
+        """
+        remove an item
+
+        :param key: item key
+        :param default: value returned if the key is not cached
+
+        :returns: removed value or default
+        """
+
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        """
+        remove all items
+
+        :returns: None
+        """
+
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskCache:
+    """
+    size bounded on-disk cache, shared by all processes. Items are
+    sharded in subdirectories by the first characters of their key and
+    the least recently used items are evicted once the cache grows
+    beyond its size.
+
+    Eviction runs in a background thread of each process: it rescans the
+    cache periodically (seeing the items written by other processes) and
+    as soon as the writes of the process push the size estimate of the
+    last scan beyond the size of the cache
+    """
+
+    def __init__(self, basedir, maxbytes, low_water=0.9,
+                 rescan_interval=60):
+        """
+        initialize cache
+
+        :param basedir: cache directory
+        :param maxbytes: maximum size of the cache (bytes)
+        :param low_water: fraction of maxbytes eviction shrinks the cache to
+        :param rescan_interval: seconds between scans of the cache size
+
+        :returns: `geomet_climate.cache.DiskCache` instance
+        """
+
+        self.basedir = basedir
+        self.maxbytes = maxbytes
+        self.low_water = low_water
+        self.rescan_interval = rescan_interval
+        self._size = 0
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def get_path(self, key):
+        """
+        :param key: item key (hexadecimal digest)
+
+        :returns: path to item
+        """
+
+        return os.path.join(self.basedir, key[:2], key[2:4], key)
+
+    def get(self, key):
+        """
+        get an item, marking it as recently used
+
+        :param key: item key (hexadecimal digest)
+
+        :returns: `bytes` of item, or None if not cached
+        """
+
+        filepath = self.get_path(key)
+
+        try:
+            with io.open(filepath, 'rb') as fh:
+                value = fh.read()
+        except OSError:
+            return None
+
+        # marking the item as recently used is best effort
+        try:
+            os.utime(filepath)
+        except OSError as err:
+            LOGGER.debug('Could not touch {}: {}'.format(filepath, err))
+
+        return value
+
+    def set(self, key, value):
+        """
+        cache an item (best effort: write errors are logged, not raised)
+
+        :param key: item key (hexadecimal digest)
+        :param value: `bytes` of item
+
+        :returns: None
+        """
+
+        filepath = self.get_path(key)
+        tmp_filepath = None
+
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            fd, tmp_filepath = tempfile.mkstemp(
+                dir=os.path.dirname(filepath), suffix='.tmp')
+            with io.open(fd, 'wb') as fh:
+                fh.write(value)
+            os.replace(tmp_filepath, filepath)
+        except OSError as err:
+            LOGGER.warning('Could not cache {} on disk: {}'.format(key, err))
+            if tmp_filepath is not None:
+                try:
+                    os.remove(tmp_filepath)
+                except OSError:
+                    pass
+            return
+
+        self.start()
+
+        with self._lock:
+            self._size += len(value)
+            if self._size > self.maxbytes:
+                self._wakeup.set()
+
+    def start(self):
+        """
+        start the eviction thread of the process, if not running (threads
+        do not survive forking, e.g. into pre-forked workers)
+
+        :returns: None
+        """
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='disk-cache-eviction')
+            self._thread.start()
+
+    def _run(self):
+        """
+        eviction thread: prune the cache, then wait for the next rescan
+        or for the size estimate to grow beyond the size of the cache
+        """
+
+        while True:
+            try:
+                self.prune()
+            except Exception as err:
+                LOGGER.error('Disk cache eviction failed: {}'.format(err))
+
+            self._wakeup.wait(self.rescan_interval)
+            self._wakeup.clear()
+
+    def _scan(self):
+        """
+        :returns: `list` of (last use, size, path) of cached items
+                  (excluding items being written)
+        """
+
+        items = []
+
+        for dirpath, dirnames, filenames in os.walk(self.basedir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                items.append((stat.st_mtime, stat.st_size, filepath))
+
+        return items
+
+    def get_size(self):
+        """
+        :returns: size of the cache (bytes)
+        """
+
+        return sum(size for _, size, _ in self._scan())
+
+    def prune(self):
+        """
+        rescan the cache and, if it is beyond its size, remove the least
+        recently used items until it is back under its low water mark
+
+        :returns: size of the cache (bytes)
+        """
+
+        with self._prune_lock:
+            items = sorted(self._scan())
+            size = sum(size for _, size, _ in items)
+
+            if size > self.maxbytes:
+                target = self.maxbytes * self.low_water
+
+                for _, size_, filepath in items:
+                    if size <= target:
+                        break
+                    try:
+                        os.remove(filepath)
+                    except OSError:
+                        pass
+                    size -= size_
+
+                LOGGER.debug('Evicted disk cache down to {} bytes'.format(
+                    size))
+
+            with self._lock:
+                self._size = size
+
+        return size
+
+    def __contains__(self, key):
+        return os.path.exists(self.get_path(key))
+
+
+class ResponseCache:
+    """
+    two tier (in-process LRU, then on-disk) cache of HTTP responses
+    """
+
+    def __init__(self, maxsize, basedir=None, maxbytes=0):
+        """
+        initialize cache
+
+        :param maxsize: maximum number of responses kept in memory
+        :param basedir: on-disk cache directory (None for no disk tier)
+        :param maxbytes: maximum size of the on-disk cache (bytes)
+
+        :returns: `geomet_climate.cache.ResponseCache` instance
+        """
+
+        self.memory = LRUCache(maxsize)
+        self.disk = None
+
+        if basedir is not None:
+            self.disk = DiskCache(basedir, maxbytes)
+
+    def get(self, key):
+        """
+        :param key: response key (hexadecimal digest)
+
+        :returns: tuple of content type and content, or None if not cached
+        """
+
+        response = self.memory.get(key)
+
+        if response is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                content_type, _, content = value.partition(b'\n')
+                response = (content_type.decode('utf-8'), content)
+                self.memory.set(key, response)
+
+        return response
+
+    def set(self, key, content_type, content):
+        """
+        :param key: response key (hexadecimal digest)
+        :param content_type: content type of response
+        :param content: `bytes` of response
+
+        :returns: None
+        """
+
+        self.memory.set(key, (content_type, content))
+
+        if self.disk is not None:
+            self.disk.set(key, content_type.encode('utf-8') + b'\n' +
+                          content)
+
+    def __contains__(self, key):
+        return key in self.memory or (self.disk is not None and
+                                      key in self.disk)
@@ -0,0 +1,251 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import glob
+import gzip
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+
+import click
+import mapscript
+
+from geomet_climate.env import BASEDIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+LOGGER = logging.getLogger(__name__)
+
+# precompressed variants, in order of preference: {encoding: extension}
+PRECOMPRESSED = {
+    'br': '.br',
+    'gzip': '.gz'
+}
+
+# whole service GetCapabilities documents cached for the WSGI application:
+# {service: version}
+VERSIONS = {
+    'WMS': '1.3.0',
+    'WCS': '2.0.1'
+}
+
+# variants not saving at least this fraction of the original size (i.e.
+# of already compressed PNG legends) are not kept
+MIN_SAVING = 0.05
+
+
+def get_variant_path(filepath, encoding):
+    """
+    :param filepath: path to original file
+    :param encoding: content encoding (br or gzip)
+
+    :returns: path to precompressed variant of file
+    """
+
+    return '{}{}'.format(filepath, PRECOMPRESSED[encoding])
+
+
+def compress_content(content, encoding):
+    """
+    :param content: `bytes` to compress
+    :param encoding: content encoding (br or gzip)
+
+    :returns: compressed `bytes`
+    """
+
+    if encoding == 'br':
+        return brotli.compress(content, quality=11)
+
+    # a fixed mtime keeps the output reproducible
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def write_atomic(filepath, content):
+    """
+    write a file through a temporary file and a rename, so that readers
+    never see a partially written file
+
+    :param filepath: path to file
+    :param content: `bytes` to write
+
+    :returns: None
+    """
+
+    fd, tmp_filepath = tempfile.mkstemp(dir=os.path.dirname(filepath),
+                                        suffix='.tmp')
+    try:
+        with io.open(fd, 'wb') as fh:
+            fh.write(content)
+        os.chmod(tmp_filepath, 0o644)
+        os.replace(tmp_filepath, filepath)
+    except Exception:
+        os.remove(tmp_filepath)
+        raise
+
+
+def compress_file(filepath):
+    """
+    write the precompressed variants (.gz and, if brotli is installed,
+    .br) of a file
+
+    :param filepath: path to file
+
+    :returns: `list` of content encodings written
+    """
+
+    with io.open(filepath, 'rb') as fh:
+        content = fh.read()
+
+    encodings = []
+
+    for encoding in PRECOMPRESSED:
+        variant_path = get_variant_path(filepath, encoding)
+
+        if encoding == 'br' and brotli is None:
+            LOGGER.debug('brotli not installed, skipping .br variants')
+            continue
+
+        compressed = compress_content(content, encoding)
+
+        if len(compressed) > len(content) * (1 - MIN_SAVING):
+            LOGGER.debug('Not keeping {} variant of {}'.format(
+                encoding, filepath))
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+            continue
+
+        LOGGER.debug('Writing {}'.format(variant_path))
+        write_atomic(variant_path, compressed)
+        encodings.append(encoding)
+
+    return encodings
+
+
+def get_capabilities_path(service, lang):
+    """
+    :param service: service (WMS or WCS)
+    :param lang: language (en or fr)
+
+    :returns: path to cached GetCapabilities document
+    """
+
+    filename = 'geomet-climate-{}-{}-capabilities-{}.xml'.format(
+        service, VERSIONS[service], lang)
+
+    return os.path.join(BASEDIR, 'mapfile', filename)
+
+
+def generate_capabilities(item):
+    """
+    render and cache the GetCapabilities document of a service, loading
+    its combined mapfile once
+
+    :param item: tuple of service (WMS or WCS) and language (en or fr)
+
+    :returns: path to cached GetCapabilities document
+    """
+
+    service, lang = item
+
+    mapfile = os.path.join(BASEDIR, 'mapfile', 'geomet-climate-{}-{}.map'
+                           .format(service, lang))
+    filepath = get_capabilities_path(service, lang)
+
+    LOGGER.info('Generating {} {} capabilities ({})'.format(
+        service, VERSIONS[service], lang))
+
+    map_ = mapscript.mapObj(mapfile)
+
+    request = mapscript.OWSRequest()
+    request.loadParamsFromURL(
+        'service={}&version={}&request=GetCapabilities&lang={}'.format(
+            service, VERSIONS[service], lang))
+
+    mapscript.msIO_installStdoutToBuffer()
+    try:
+        if map_.OWSDispatch(request) != mapscript.MS_SUCCESS:
+            raise RuntimeError('Could not generate {}'.format(filepath))
+        mapscript.msIO_stripStdoutBufferContentHeaders()
+        content = mapscript.msIO_getStdoutBufferBytes()
+    finally:
+        mapscript.msIO_resetHandlers()
+
+    write_atomic(filepath, content)
+
+    return filepath
+
+
+def get_static_files():
+    """
+    list the generated files served as is by the WSGI application
+
+    :returns: `list` of GetCapabilities document and legend paths
+    """
+
+    capabilities = os.path.join(BASEDIR, 'mapfile',
+                                'geomet-climate-*-capabilities-*.xml')
+    legends = os.path.join(BASEDIR, 'legends', '*.png')
+
+    return sorted(glob.glob(capabilities)) + sorted(glob.glob(legends))
+
+
+@click.group()
+def capabilities():
+    pass
+
+
+@click.command()
+@click.pass_context
+@click.option('--service', '-s', type=click.Choice(list(VERSIONS)),
+              multiple=True, help='service (default all)')
+@click.option('--jobs', '-j', type=int, default=4,
+              help='number of parallel processes')
+def generate(ctx, service, jobs):
+    """generate GetCapabilities caches"""
+
+    items = [(service_, lang) for service_ in service or VERSIONS
+             for lang in ['en', 'fr']]
+
+    if jobs > 1:
+        with multiprocessing.Pool(min(jobs, len(items))) as pool:
+            filepaths = pool.map(generate_capabilities, items)
+    else:
+        filepaths = [generate_capabilities(item) for item in items]
+
+    for filepath in filepaths:
+        click.echo('Generated {}'.format(filepath))
+
+
+@click.command()
+@click.pass_context
+def compress(ctx):
+    """precompress GetCapabilities documents and legends"""
+
+    for filepath in get_static_files():
+        LOGGER.info('Compressing {}'.format(filepath))
+        compress_file(filepath)
+
+
+capabilities.add_command(generate)
+capabilities.add_command(compress)
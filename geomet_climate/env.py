@@ -32,6 +32,25 @@ OWS_DEBUG = os.environ.get('GEOMET_CLIMATE_OWS_DEBUG', None)
 OWS_LOG = os.environ.get('GEOMET_CLIMATE_OWS_LOG', None)
 URL = os.environ.get('GEOMET_CLIMATE_URL', None)
 ES_URL = os.getenv('GEOMET_CLIMATE_ES_URL', None)
+MAPFILE_CACHE_SIZE = int(os.environ.get(
+    'GEOMET_CLIMATE_MAPFILE_CACHE_SIZE', 32))
+CAPABILITIES_CACHE_SIZE = int(os.environ.get(
+    'GEOMET_CLIMATE_CAPABILITIES_CACHE_SIZE', 256))
+RESPONSE_CACHE_SIZE = int(os.environ.get(
+    'GEOMET_CLIMATE_RESPONSE_CACHE_SIZE', 0))
+RESPONSE_CACHE_DIR = os.environ.get('GEOMET_CLIMATE_RESPONSE_CACHE_DIR', None)
+RESPONSE_CACHE_DISK_SIZE = int(os.environ.get(
+    'GEOMET_CLIMATE_RESPONSE_CACHE_DISK_SIZE', 1073741824))
+TILE_CACHE_SIZE = int(os.environ.get(
+    'GEOMET_CLIMATE_TILE_CACHE_SIZE', 0))
+TILEINDEX_CONSOLIDATED = os.environ.get(
+    'GEOMET_CLIMATE_TILEINDEX_CONSOLIDATED', 'false').lower() == 'true'
+METRICS = os.environ.get(
+    'GEOMET_CLIMATE_METRICS', 'false').lower() == 'true'
+METRICS_DIR = os.environ.get('GEOMET_CLIMATE_METRICS_DIR', None)
+SERVER_TIMING = os.environ.get(
+    'GEOMET_CLIMATE_SERVER_TIMING', 'false').lower() == 'true'
+PROFILE_SECRET = os.environ.get('GEOMET_CLIMATE_PROFILE_SECRET', None)
 
 LOGGER.debug(BASEDIR)
 LOGGER.debug(CONFIG)
@@ -39,6 +58,17 @@ LOGGER.debug(DATADIR)
 LOGGER.debug(OWS_LOG)
 LOGGER.debug(OWS_DEBUG)
 LOGGER.debug(URL)
+LOGGER.debug(MAPFILE_CACHE_SIZE)
+LOGGER.debug(CAPABILITIES_CACHE_SIZE)
+LOGGER.debug(RESPONSE_CACHE_SIZE)
+LOGGER.debug(RESPONSE_CACHE_DIR)
+LOGGER.debug(RESPONSE_CACHE_DISK_SIZE)
+LOGGER.debug(TILE_CACHE_SIZE)
+LOGGER.debug(TILEINDEX_CONSOLIDATED)
+LOGGER.debug(METRICS)
+LOGGER.debug(METRICS_DIR)
+LOGGER.debug(SERVER_TIMING)
+LOGGER.debug(PROFILE_SECRET is not None)
 
 if None in [BASEDIR, CONFIG, DATADIR, URL]:
     msg = 'Environment variables not set!'
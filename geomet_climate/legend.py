@@ -18,7 +18,6 @@
 ###############################################################################
 
 import io
-import json
 import logging
 import os
 
@@ -30,10 +29,24 @@ import yaml
 from yaml import CLoader
 
 from geomet_climate.env import BASEDIR, CONFIG
+from geomet_climate.manifest import (
+    get_fingerprint, load_manifest, prune_manifest, save_manifest)
+from geomet_climate.style import load_style
 
 LOGGER = logging.getLogger(__name__)
 
-THISDIR = os.path.dirname(os.path.realpath(__file__))
+
+def get_legend_paths(layer_info, output_dir):
+    """
+    :param layer_info: layer information
+    :param output_dir: path to output legend
+
+    :returns: `list` of paths to the legends of a layer
+    """
+
+    return [os.path.join(output_dir, '{}-{}.png'.format(
+                load_style(style)[0]['group'], lang))
+            for style in layer_info['styles'] for lang in ['en', 'fr']]
 
 
 def generate_legend(layer_info, output_dir):
@@ -52,9 +65,7 @@ def generate_legend(layer_info, output_dir):
     discrete = False
 
     for style in layer_info['styles']:
-        style_path = os.path.join(THISDIR, 'resources', style)
-        with io.open(style_path) as fh:
-            style_json = json.load(fh)
+        style_json = load_style(style)
 
         group = style_json[0]['group']
 
@@ -164,7 +175,9 @@ def legend():
 
 @click.command()
 @click.pass_context
-def generate(ctx):
+@click.option('--incremental', is_flag=True,
+              help='only regenerate legends whose inputs changed')
+def generate(ctx, incremental):
     """generate Legends"""
 
     output_dir = '{}{}legends'.format(BASEDIR, os.sep)
@@ -175,9 +188,25 @@ def generate(ctx):
     with io.open(CONFIG) as fh:
         cfg = yaml.load(fh, Loader=CLoader)
 
-        for key, value in cfg['layer_templates'].items():
-            if value['type'] == 'RASTER':
-                generate_legend(value, output_dir)
+    manifest = load_manifest('legend')
+
+    for key, value in cfg['layer_templates'].items():
+        if value['type'] != 'RASTER':
+            continue
+
+        fingerprint = get_fingerprint(value)
+        if all([incremental,
+                manifest.get(key) == fingerprint,
+                all(os.path.exists(legend_path) for legend_path in
+                    get_legend_paths(value, output_dir))]):
+            LOGGER.debug('Skipping unchanged legend {}'.format(key))
+            continue
+
+        generate_legend(value, output_dir)
+        manifest[key] = fingerprint
+
+    prune_manifest(manifest, cfg['layer_templates'])
+    save_manifest('legend', manifest)
 
 
 legend.add_command(generate)
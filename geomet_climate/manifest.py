@@ -0,0 +1,149 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+
+from geomet_climate import __version__
+from geomet_climate.env import BASEDIR, DATADIR
+from geomet_climate.style import get_style_digest
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_DIR = os.path.join(BASEDIR, 'manifest')
+
+
+def load_manifest(section):
+    """
+    load a section of the build manifest
+
+    :param section: manifest section (i.e. vrt, tileindex, mapfile-WMS)
+
+    :returns: `dict` of layer fingerprints (empty if no previous build)
+    """
+
+    filepath = os.path.join(MANIFEST_DIR, '{}.json'.format(section))
+
+    if not os.path.exists(filepath):
+        return {}
+
+    LOGGER.debug('Loading manifest {}'.format(filepath))
+    with io.open(filepath) as fh:
+        return json.load(fh)
+
+
+def save_manifest(section, manifest):
+    """
+    save a section of the build manifest (one file per section, so
+    that generate commands never overwrite each other's records)
+
+    :param section: manifest section (i.e. vrt, tileindex, mapfile-WMS)
+    :param manifest: `dict` of layer fingerprints
+
+    :returns: None
+    """
+
+    filepath = os.path.join(MANIFEST_DIR, '{}.json'.format(section))
+    LOGGER.debug('Saving manifest {}'.format(filepath))
+
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+
+    fd, tmp_filepath = tempfile.mkstemp(dir=MANIFEST_DIR, suffix='.tmp')
+    try:
+        with io.open(fd, 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+        os.replace(tmp_filepath, filepath)
+    except Exception:
+        os.remove(tmp_filepath)
+        raise
+
+
+def prune_manifest(manifest, keys):
+    """
+    drop the records of layers that are no longer configured
+
+    :param manifest: `dict` of layer fingerprints
+    :param keys: configured layer names
+
+    :returns: None
+    """
+
+    for key in set(manifest).difference(keys):
+        LOGGER.debug('Dropping removed layer {}'.format(key))
+        manifest.pop(key)
+
+
+def get_data_files(layer_info):
+    """
+    list the input data files of a layer
+
+    :param layer_info: layer information
+
+    :returns: `list` of data file paths
+    """
+
+    if layer_info.get('type') != 'RASTER' or 'filepath' not in layer_info:
+        return []
+
+    dirname = os.path.join(DATADIR,
+                           layer_info['climate_model']['basepath'],
+                           layer_info['filepath'])
+    filepath = os.path.join(dirname, layer_info['filename'])
+
+    if os.path.isfile(filepath):
+        return [filepath]
+
+    if not os.path.isdir(dirname):
+        return []
+
+    # CanGRD layers are a set of files sharing the filename prefix
+    return sorted(os.path.join(dirname, f) for f in os.listdir(dirname)
+                  if f.startswith(layer_info['filename']))
+
+
+def get_fingerprint(layer_info, *extra):
+    """
+    fingerprint the inputs of a layer: its resolved configuration,
+    the contents of its style files and the mtime/size of its data files
+    (as well as the geomet-climate version)
+
+    :param layer_info: layer information
+    :param extra: any other values the outputs depend on
+
+    :returns: `str` of fingerprint
+    """
+
+    sha = hashlib.sha256()
+
+    sha.update(json.dumps([__version__, layer_info, extra], sort_keys=True,
+                          default=str).encode('utf-8'))
+
+    for style in layer_info.get('styles', []):
+        sha.update(get_style_digest(style).encode('utf-8'))
+
+    for filepath in get_data_files(layer_info):
+        stat = os.stat(filepath)
+        sha.update('{}:{}:{}'.format(filepath, stat.st_mtime_ns,
+                                     stat.st_size).encode('utf-8'))
+
+    return sha.hexdigest()
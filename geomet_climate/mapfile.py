@@ -21,21 +21,30 @@
 from collections import OrderedDict
 import copy
 from datetime import datetime
+import hashlib
 import io
 import json
 import logging
+import multiprocessing
 import os
 import shutil
 
 import click
 import mappyfile
-from osgeo import osr
+from osgeo import gdal, osr
 import yaml
 from yaml import CLoader
 
 from geomet_climate import __version__
 from geomet_climate.env import (
-    BASEDIR, CONFIG, DATADIR, OWS_DEBUG, OWS_LOG, URL, ES_URL)
+    BASEDIR, CONFIG, DATADIR, OWS_DEBUG, OWS_LOG, URL, ES_URL,
+    TILEINDEX_CONSOLIDATED)
+from geomet_climate.manifest import (
+    get_fingerprint, load_manifest, prune_manifest, save_manifest)
+from geomet_climate.style import load_style
+from geomet_climate.tileindex import (
+    CONSOLIDATED_TILEINDEX, get_consolidated_table)
+from geomet_climate.timedimension import TimeDimension
 
 THISDIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -49,8 +58,30 @@ VECTOR_OUTPUT_FORMAT = os.path.join(
     'resources',
     'outputformats_vector.json')
 
+SYMBOLS_FILE = os.path.join(
+    THISDIR,
+    'resources',
+    'mapserv',
+    'symbols.json')
+
+TEMPLATE_RASTER = os.path.join(
+    THISDIR,
+    'resources',
+    'mapserv',
+    'templates',
+    'TEMPLATE_RASTER.json')
+
+STATIONS_LAYERS = ['CLIMATE.STATIONS', 'HYDROMETRIC.STATIONS',
+                   'AHCCD.STATIONS']
+
 LOGGER = logging.getLogger(__name__)
 
+# layer name rendered in place of the layers of a combined mapfile
+LAYERS_PLACEHOLDER = '__LAYERS__'
+
+# WKT to PROJ.4 conversions, shared by all layers of a group
+PROJ4_CACHE = {}
+
 MAPSERVER_CONFIG = f'''CONFIG
     ENV
         MS_MAP_PATTERN "{BASEDIR}/mapfile/.*"
@@ -59,6 +90,63 @@ END
 '''
 
 
+def get_proj4(wkt):
+    """
+    convert a WKT projection to PROJ.4, once per distinct projection
+
+    :param wkt: WKT projection
+
+    :returns: `str` of PROJ.4 projection
+    """
+
+    if wkt not in PROJ4_CACHE:
+        LOGGER.debug('Converting projection to PROJ.4')
+        projection = osr.SpatialReference()
+        projection.ImportFromWkt(wkt)
+        PROJ4_CACHE[wkt] = projection.ExportToProj4().strip()
+
+    return PROJ4_CACHE[wkt]
+
+
+def get_proj4_cache_version():
+    """
+    versions of the libraries the PROJ.4 conversions depend on
+
+    :returns: `str` of GDAL and PROJ versions
+    """
+
+    return 'GDAL {} PROJ {}.{}.{}'.format(
+        gdal.VersionInfo(), osr.GetPROJVersionMajor(),
+        osr.GetPROJVersionMinor(), osr.GetPROJVersionMicro())
+
+
+def load_proj4_cache():
+    """
+    seed the PROJ.4 conversions from the build manifest, if they were
+    computed with the same GDAL and PROJ versions
+
+    :returns: None
+    """
+
+    manifest = load_manifest('projections')
+
+    if manifest.get('version') == get_proj4_cache_version():
+        PROJ4_CACHE.update(manifest['projections'])
+
+
+def save_proj4_cache():
+    """
+    persist the PROJ.4 conversions in the build manifest
+
+    :returns: None
+    """
+
+    save_manifest('projections', {
+        'version': get_proj4_cache_version(),
+        'projections': PROJ4_CACHE
+    })
+
+
 def gen_web_metadata(m, c, service, url):
     """
     update mapfile MAP.WEB.METADATA section
@@ -225,16 +313,25 @@ def gen_layer(layer_name, layer_info,  template_path, service='WMS'):
         layer_tileindex['status'] = 'OFF'
         layer_tileindex['CONNECTIONTYPE'] = 'OGR'
 
-        if layer_info['filename'].startswith('CANGRD'):
-            filename = '{}.gpkg'.format(layer_info['filename'])
+        if TILEINDEX_CONSOLIDATED:
+            layer_tileindex['CONNECTION'] = CONSOLIDATED_TILEINDEX
+            layer_tileindex['DATA'] = [
+                "SELECT * FROM {} WHERE layer = '{}'".format(
+                    get_consolidated_table(
+                        layer_info['climate_model']['projection']),
+                    layer_name)
+            ]
         else:
-            filename = layer_info['filename'].replace('.nc', '.gpkg')
-        data = os.path.join(BASEDIR, 'tileindex',
-                            layer_info['climate_model']['basepath'],
-                            layer_info['filepath'],
-                            filename)
+            if layer_info['filename'].startswith('CANGRD'):
+                filename = '{}.gpkg'.format(layer_info['filename'])
+            else:
+                filename = layer_info['filename'].replace('.nc', '.gpkg')
+            data = os.path.join(BASEDIR, 'tileindex',
+                                layer_info['climate_model']['basepath'],
+                                layer_info['filepath'],
+                                filename)
 
-        layer_tileindex['CONNECTION'] = data
+            layer_tileindex['CONNECTION'] = data
         layer_tileindex['metadata'] = {
             '__type__': 'metadata',
             'ows_enable_request': '!*'
@@ -291,9 +388,9 @@ def gen_layer(layer_name, layer_info,  template_path, service='WMS'):
     if layer_name.startswith('CANGRD'):
         layer['projection'] = ['init=epsg:102998']
     else:
-        projection = osr.SpatialReference()
-        projection.ImportFromWkt(layer_info['climate_model']['projection'])
-        layer['projection'] = [projection.ExportToProj4().strip()]
+        layer['projection'] = [
+            get_proj4(layer_info['climate_model']['projection'])
+        ]
 
     if service == 'WCS' and layer_info['type'] == 'RASTER':
         layer['metadata']['wcs_bandcount'] = layer_info['num_bands']
@@ -303,29 +400,9 @@ def gen_layer(layer_name, layer_info,  template_path, service='WMS'):
 
     if service == 'WCS' and 'timestep' in layer_info:
         LOGGER.debug('calculating band names')
-        begin = layer_info['climate_model']['temporal_extent']['begin']
-        end = layer_info['climate_model']['temporal_extent']['end']
-        ts = layer_info['timestep']
-        step = [int(s) for s in ts if s.isdigit()][0]
-
-        band_names = []
-        if ts == 'P1Y':
-            for i in range(begin, end+step, step):
-                i = 'B{}'.format(i)
-                band_names.append(i)
-        elif ts == 'P1M':
-            begin = list(map(int, begin.split('-')))
-            begin = (begin[0] * 12) + begin[1]
-            end = list(map(int, end.split('-')))
-            end = (end[0] * 12) + end[1]
-            for i in range(begin, end+step, step):
-                year = int(i/12)
-                month = (i - (year * 12))
-                if month == 0:
-                    year = year - 1
-                    month = 12
-                time = 'B{}-{}'.format(year, str(month).zfill(2))
-                band_names.append(time)
+        time_dimension = TimeDimension.from_layer_info(layer_info)
+        band_names = ['B{}'.format(t) for t in time_dimension]
+
         layer['metadata']['wcs_band_names'] = \
             ' '.join(str(x) for x in band_names)
 
@@ -385,19 +462,227 @@ def gen_layer(layer_name, layer_info,  template_path, service='WMS'):
     if 'classgroup' in layer_info:
         layer['classgroup'] = layer_info['classgroup']
 
+    # style classes are shared by all the layers of the process (see
+    # load_style): copy any class before modifying it
     if 'styles' in layer_info:
         for style in layer_info['styles']:
-            style_filepath = os.path.join(THISDIR, 'resources', style)
-            with io.open(style_filepath) as fh:
-                new_class = json.load(fh)
-                for class_ in new_class:
-                    layer['classes'].append(class_)
+            layer['classes'].extend(load_style(style))
 
     layers.append(layer)
 
     return layers
 
 
+def gen_layer_mapfile(key, layer_info, mapfile, service, output_dir,
+                      template_dir, write=True):
+    """
+    write the mapfile (and GeoJSON template) of a single layer
+
+    :param key: name of layer
+    :param layer_info: layer information
+    :param mapfile: base mapfile JSON object (not modified)
+    :param service: service (WMS or WCS)
+    :param output_dir: mapfile output directory
+    :param template_dir: GeoJSON template output directory
+    :param write: whether to write the layer mapfile and template
+                  (`False` only generates the layer objects)
+
+    :returns: tuple of list of mappyfile layer objects of layer
+              and output formats of the layer mapfile
+    """
+
+    mapfile = mapfile.copy()
+
+    template_name = 'template-{}.js'.format(key)
+    template_path = '{}{}{}'.format(template_dir, os.sep, template_name)
+
+    if key not in STATIONS_LAYERS:
+        if write:
+            with io.open(TEMPLATE_RASTER, encoding='utf-8') as fh:
+                template_raster = fh.read().replace('{}', key)
+            with io.open(template_path, 'w', encoding='utf-8') as fh:
+                fh.write(template_raster)
+
+        outputformats = copy.deepcopy(mapfile['outputformats'])
+        for i in outputformats:
+            if i['name'] == 'GeoJSON':
+                i['formatoption'] = ['FILE={}'.format(template_path)]
+    else:
+        template_path = f'{key}.js'
+        with io.open(VECTOR_OUTPUT_FORMAT) as fh:
+            outputformats = json.load(fh)
+
+    layers = gen_layer(key, layer_info, template_path, service)
+
+    if write:
+        mapfile['outputformats'] = outputformats
+        mapfile['layers'] = layers
+
+        filepath = get_layer_mapfile_path(key, service, output_dir)
+
+        with io.open(filepath, 'w') as fh:
+            mappyfile.dump(mapfile, fh)
+
+    return layers, outputformats
+
+
+def translate_metadata(metadata, lang, keys=None):
+    """
+    swap the language specific values of a metadata block into their
+    unsuffixed keys (i.e. ows_title_fr into ows_title)
+
+    :param metadata: metadata object
+    :param lang: language
+    :param keys: keys to swap (default all keys suffixed with the language)
+
+    :returns: translated copy of metadata object
+    """
+
+    suffix = '_{}'.format(lang)
+    metadata_ = metadata.copy()
+
+    if keys is None:
+        keys = [k[:-len(suffix)] for k in metadata if k.endswith(suffix)]
+
+    for key in keys:
+        metadata_[key] = metadata['{}{}'.format(key, suffix)]
+
+    return metadata_
+
+
+def dump_mapfile(mapfile, layers, fh, lang='en'):
+    """
+    write a combined mapfile, one LAYER block at a time, so that the
+    whole mapfile is never held as a single string or copied per language
+
+    :param mapfile: base mapfile JSON object (without layers)
+    :param layers: `list` of layer JSON objects
+    :param fh: file handle to write to
+    :param lang: language of the mapfile
+
+    :returns: None
+    """
+
+    placeholder = {'__type__': 'layer', 'name': LAYERS_PLACEHOLDER}
+
+    header = mapfile.copy()
+    header['layers'] = [placeholder]
+
+    if lang != 'en':
+        header['web'] = mapfile['web'].copy()
+        header['web']['metadata'] = translate_metadata(
+            mapfile['web']['metadata'], lang)
+
+    # render everything but the layers, then write the layers in place of
+    # the placeholder
+    placeholder_block = _indent(mappyfile.dumps(placeholder))
+    head, tail = mappyfile.dumps(header).split(placeholder_block)
+
+    fh.write(head)
+
+    for i, layer in enumerate(layers):
+        if lang != 'en' and 'ows_title' in layer['metadata']:
+            layer = layer.copy()
+            layer['metadata'] = translate_metadata(
+                layer['metadata'], lang, ['ows_layer_group', 'ows_title'])
+
+        if i > 0:
+            fh.write('\n')
+        fh.write(_indent(mappyfile.dumps(layer)))
+
+    fh.write(tail)
+
+
+def _indent(block, indent='    '):
+    """
+    indent a block of mapfile text by one level
+
+    :param block: mapfile text
+    :param indent: indentation
+
+    :returns: indented text
+    """
+
+    return '\n'.join(indent + line if line else line
+                     for line in block.split('\n'))
+
+
+def get_layer_mapfile_path(key, service, output_dir):
+    """
+    :param key: name of layer
+    :param service: service (WMS or WCS)
+    :param output_dir: mapfile output directory
+
+    :returns: path to mapfile of layer
+    """
+
+    filename = 'geomet-climate-{}-{}.map'.format(service, key)
+
+    return '{}{}{}'.format(output_dir, os.sep, filename)
+
+
+def get_build_fingerprint(cfg, service):
+    """
+    fingerprint the inputs shared by all layer mapfiles (service
+    metadata, environment and base mapfile resources)
+
+    :param cfg: configuration
+    :param service: service (WMS or WCS)
+
+    :returns: `str` of fingerprint
+    """
+
+    sha = hashlib.sha256()
+
+    sha.update(json.dumps([cfg['metadata'], service, DATADIR, URL, ES_URL,
+                           OWS_DEBUG, OWS_LOG, TILEINDEX_CONSOLIDATED],
+                          sort_keys=True,
+                          default=str).encode('utf-8'))
+
+    for filepath in [MAPFILE_BASE, SYMBOLS_FILE, VECTOR_OUTPUT_FORMAT,
+                     TEMPLATE_RASTER]:
+        with io.open(filepath, 'rb') as fh:
+            sha.update(fh.read())
+
+    return sha.hexdigest()
+
+
+# base mapfile and arguments shared by gen_layer_mapfile pool workers
+_WORKER_ARGS = None
+
+
+def _init_worker(mapfile, service, output_dir, template_dir, projections):
+    """
+    initialize a mapfile generation worker process
+
+    :param mapfile: base mapfile JSON object
+    :param service: service (WMS or WCS)
+    :param output_dir: mapfile output directory
+    :param template_dir: GeoJSON template output directory
+    :param projections: `dict` of WKT to PROJ.4 conversions
+
+    :returns: None
+    """
+
+    global _WORKER_ARGS
+    _WORKER_ARGS = (mapfile, service, output_dir, template_dir)
+    PROJ4_CACHE.update(projections)
+
+
+def _gen_layer_mapfile_worker(item):
+    """
+    gen_layer_mapfile wrapper for pool workers
+
+    :param item: tuple of layer name, layer information and write flag
+
+    :returns: result of gen_layer_mapfile
+    """
+
+    key, layer_info, write = item
+
+    return gen_layer_mapfile(key, layer_info, *_WORKER_ARGS, write=write)
+
+
 @click.group()
 def mapfile():
     pass
@@ -408,7 +693,11 @@ def mapfile():
 @click.option('--service', '-s', type=click.Choice(['WMS', 'WCS']),
               help='service')
 @click.option('--layer', '-lyr', help='layer')
-def generate(ctx, service, layer):
+@click.option('--jobs', '-j', type=int, default=1,
+              help='number of parallel processes')
+@click.option('--incremental', is_flag=True,
+              help='only rewrite layer mapfiles whose inputs changed')
+def generate(ctx, service, layer, jobs, incremental):
     """generate mapfile"""
 
     # generate MapServer config file if not present
@@ -431,8 +720,7 @@ def generate(ctx, service, layer):
 
     with io.open(MAPFILE_BASE) as fh:
         mapfile = json.load(fh, object_pairs_hook=OrderedDict)
-        symbols_file = os.path.join(THISDIR, 'resources/mapserv/symbols.json')
-        with io.open(symbols_file) as fh2:
+        with io.open(SYMBOLS_FILE) as fh2:
             mapfile['symbols'] = json.load(fh2)
 
     if OWS_LOG is not None:
@@ -456,71 +744,61 @@ def generate(ctx, service, layer):
     mapfile['web']['metadata'] = gen_web_metadata(mapfile, cfg['metadata'],
                                                   service, URL)
 
-    for key, value in mapfiles.items():
-        mapfile['layers'] = []
-
-        template_name = 'template-{}.js'.format(key)
-        template_path = '{}{}{}'.format(template_dir, os.sep, template_name)
-
-        with io.open(template_path, 'w', encoding='utf-8') as fh:
-            template_dir = os.path.join(THISDIR, 'resources', 'mapserv',
-                                        'templates')
-
-            stations_layers = ['CLIMATE.STATIONS', 'HYDROMETRIC.STATIONS',
-                               'AHCCD.STATIONS']
-
-            if key not in stations_layers:
-                trf = os.path.join(template_dir, 'TEMPLATE_RASTER.json')
-                with io.open(trf, encoding='utf-8') as template_raster:
-                    template_raster = template_raster.read().replace('{}', key)
-                    fh.write(template_raster)
-                for i in mapfile['outputformats']:
-                    if i['name'] == 'GeoJSON':
-                        i['formatoption'] = ['FILE={}'.format(template_path)]
-            else:
-                template_path = f'{key}.js'
-                with io.open(VECTOR_OUTPUT_FORMAT) as vector_output:
-                    mapfile['outputformats'] = json.load(vector_output)
+    worker_args = (mapfile, service, output_dir, template_dir)
 
-        layers = gen_layer(key, value, template_path, service)
+    manifest_section = 'mapfile-{}'.format(service)
+    manifest = load_manifest(manifest_section)
+    build_fingerprint = get_build_fingerprint(cfg, service)
 
-        for lyr in layers:
-            mapfile['layers'].append(lyr)
-            all_layers.append(lyr)
+    items = []
+    fingerprints = {}
+    for key, value in mapfiles.items():
+        fingerprints[key] = get_fingerprint(value, build_fingerprint)
+        write = any([not incremental,
+                     manifest.get(key) != fingerprints[key],
+                     not os.path.exists(
+                         get_layer_mapfile_path(key, service, output_dir))])
+        if not write:
+            LOGGER.debug('Skipping unchanged layer {}'.format(key))
+        items.append((key, value, write))
+
+    if incremental:
+        load_proj4_cache()
+
+    if jobs > 1:
+        # convert each distinct projection once, before forking workers
+        for value in mapfiles.values():
+            if 'projection' in value['climate_model']:
+                get_proj4(value['climate_model']['projection'])
+
+        LOGGER.info('Generating layer mapfiles with {} processes'.format(jobs))
+        chunksize = max(1, len(items) // (jobs * 4))
+        with multiprocessing.Pool(jobs, initializer=_init_worker,
+                                  initargs=worker_args + (PROJ4_CACHE,)
+                                  ) as pool:
+            results = pool.imap(_gen_layer_mapfile_worker, items, chunksize)
+            results = list(results)
+    else:
+        results = [gen_layer_mapfile(key, value, *worker_args, write=write)
+                   for key, value, write in items]
 
-        filename = 'geomet-climate-{}-{}.map'.format(service, key)
-        filepath = '{}{}{}'.format(output_dir, os.sep, filename)
+    manifest.update(fingerprints)
+    prune_manifest(manifest, cfg['layers'])
+    save_manifest(manifest_section, manifest)
+    save_proj4_cache()
 
-        with io.open(filepath, 'w') as fh:
-            mappyfile.dump(mapfile, fh)
+    # the combined mapfile keeps the output formats of the last layer
+    for layers, outputformats in results:
+        all_layers.extend(layers)
+        mapfile['outputformats'] = outputformats
 
     if layer is None:  # generate entire mapfile
-        metadata_dict = mapfile['web']['metadata'].copy()
         for lang_ in ['en', 'fr']:
-
-            lang_map = copy.deepcopy(mapfile)
-            lang_map['layers'] = all_layers
-
             filename = 'geomet-climate-{}-{}.map'.format(service, lang_)
             filepath = '{}{}{}'.format(output_dir, os.sep, filename)
 
-            if lang_ == 'fr':
-                for metadata in metadata_dict:
-                    if metadata.endswith('_{}'.format(lang_)):
-                        key_ = metadata.replace('_{}'.format(lang_), '')
-                        value_ = mapfile['web']['metadata'][metadata]
-                        lang_map['web']['metadata'][key_] = value_
-
-                for lyr_ in range(0, len(lang_map['layers'])):
-                    lm = lang_map['layers'][lyr_]['metadata']
-                    if 'ows_title' in lm:
-                        lm['ows_layer_group'] = \
-                            lm['ows_layer_group_{}'.format(lang_)]
-                        lm['ows_title'] = \
-                            lm['ows_title_{}'.format(lang_)]
-
             with io.open(filepath, 'w') as fh:
-                mappyfile.dump(lang_map, fh)
+                dump_mapfile(mapfile, all_layers, fh, lang_)
 
     epsg_file = os.path.join(THISDIR, 'resources', 'mapserv', 'epsg')
     shutil.copy2(epsg_file, os.path.join(BASEDIR, 'mapfile'))
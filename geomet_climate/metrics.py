@@ -0,0 +1,514 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import atexit
+from bisect import bisect_left
+from contextlib import contextmanager
+import glob
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from geomet_climate.env import METRICS, METRICS_DIR
+
+LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# histogram buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# label values are normalized to these (anything else is 'other', or
+# empty for languages), so that arbitrary request parameters do not
+# create new series
+SERVICES = ['WMS', 'WCS', 'WMTS']
+REQUESTS = ['GetCapabilities', 'GetMap', 'GetFeatureInfo',
+            'GetLegendGraphic', 'DescribeCoverage', 'GetCoverage', 'GetTile']
+LANGUAGES = ['en', 'fr']
+
+# interval (seconds) at which a process shares its metrics in METRICS_DIR
+FLUSH_INTERVAL = 1
+
+_CHANGED = threading.Event()
+_FLUSH_LOCK = threading.Lock()
+_FLUSHER_LOCK = threading.Lock()
+_FLUSHER_PID = None
+
+
+def format_labels(labels):
+    """
+    :param labels: `tuple` of (name, value) label pairs
+
+    :returns: `str` of labels in text exposition format
+    """
+
+    if not labels:
+        return ''
+
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"')) for name, value in labels))
+
+
+class Counter:
+    """counter metric, by label values"""
+
+    def __init__(self, name, help_):
+        """
+        initialize counter
+
+        :param name: metric name
+        :param help_: metric description
+
+        :returns: `geomet_climate.metrics.Counter` instance
+        """
+
+        self.name = name
+        self.help = help_
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        """
+        :param value: increment
+        :param labels: label values
+
+        :returns: None
+        """
+
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dump(self):
+        """
+        :returns: `list` of [labels, value] (JSON serializable)
+        """
+
+        with self._lock:
+            return [[key, value] for key, value in self._values.items()]
+
+    def merge(self, values):
+        """
+        add the values of another process
+
+        :param values: `list` of [labels, value] (as dumped)
+
+        :returns: None
+        """
+
+        for key, value in values:
+            self.inc(value, **dict(key))
+
+    def reset(self):
+        """
+        :returns: None
+        """
+
+        with self._lock:
+            self._values.clear()
+
+    def expose(self):
+        """
+        :returns: `list` of lines in text exposition format
+        """
+
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} counter'.format(self.name)]
+
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append('{}{} {}'.format(self.name, format_labels(key),
+                                              value))
+
+        return lines
+
+
+class Histogram:
+    """histogram metric, by label values"""
+
+    def __init__(self, name, help_, buckets=BUCKETS):
+        """
+        initialize histogram
+
+        :param name: metric name
+        :param help_: metric description
+        :param buckets: `tuple` of bucket upper bounds (ascending)
+
+        :returns: `geomet_climate.metrics.Histogram` instance
+        """
+
+        self.name = name
+        self.help = help_
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        :param value: observed value
+        :param labels: label values
+
+        :returns: None
+        """
+
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def dump(self):
+        """
+        :returns: `list` of [labels, bucket counts, sum] (JSON serializable)
+        """
+
+        with self._lock:
+            return [[key, counts, total] for key, (counts, total)
+                    in self._values.items()]
+
+    def merge(self, values):
+        """
+        add the values of another process
+
+        :param values: `list` of [labels, bucket counts, sum] (as dumped)
+
+        :returns: None
+        """
+
+        for key, counts, total in values:
+            if len(counts) != len(self.buckets) + 1:
+                LOGGER.warning('Skipping {} with other buckets'.format(
+                    self.name))
+                continue
+
+            key = tuple(sorted(tuple(label) for label in key))
+            with self._lock:
+                counts_, total_ = self._values.get(
+                    key, ([0] * (len(self.buckets) + 1), 0))
+                self._values[key] = (
+                    [a + b for a, b in zip(counts_, counts)], total_ + total)
+
+    def reset(self):
+        """
+        :returns: None
+        """
+
+        with self._lock:
+            self._values.clear()
+
+    def expose(self):
+        """
+        :returns: `list` of lines in text exposition format
+        """
+
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} histogram'.format(self.name)]
+
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(
+                        self.name, format_labels(key + (('le', bound),)),
+                        cumulative))
+                lines.append('{}_sum{} {}'.format(
+                    self.name, format_labels(key), total))
+                lines.append('{}_count{} {}'.format(
+                    self.name, format_labels(key), cumulative))
+
+        return lines
+
+
+REQUEST_PHASES = Histogram(
+    'geomet_climate_request_phase_seconds',
+    'Time spent in each phase of requests (seconds)')
+
+CACHE_LOOKUPS = Counter(
+    'geomet_climate_cache_lookups_total',
+    'Lookups in the caches of the application, by result')
+
+
+def get_layer_group(layer):
+    """
+    :param layer: layer name(s) of a request
+
+    :returns: `str` of layer group (first component of the layer name)
+    """
+
+    if not layer:
+        return ''
+    if ',' in layer:
+        return 'multiple'
+
+    return layer.split('.')[0]
+
+
+class RequestTimer:
+    """phase timers of a request"""
+
+    def __init__(self):
+        """
+        initialize timer, starting the clock of the request
+
+        :returns: `geomet_climate.metrics.RequestTimer` instance
+        """
+
+        self.start = time.perf_counter()
+        self.phases = []
+        self.labels = {
+            'service': '',
+            'request': '',
+            'layer_group': '',
+            'lang': ''
+        }
+
+    def set_labels(self, service, request, layer, lang):
+        """
+        label the request, normalizing values
+
+        :param service: service (i.e. WMS)
+        :param request: request type (i.e. GetMap)
+        :param layer: layer name(s) (validated, None if not applicable)
+        :param lang: language (None if not applicable)
+
+        :returns: None
+        """
+
+        self.labels = {
+            'service': service if service in SERVICES else 'other',
+            'request': request if request in REQUESTS else 'other',
+            'layer_group': get_layer_group(layer),
+            'lang': lang if lang in LANGUAGES else ''
+        }
+
+    @contextmanager
+    def phase(self, name):
+        """
+        time a phase of the request
+
+        :param name: phase name (i.e. mapfile, time, render)
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def get_server_timing(self):
+        """
+        :returns: `str` of Server-Timing header value (milliseconds)
+        """
+
+        phases = self.phases + [('total', time.perf_counter() - self.start)]
+
+        return ', '.join('{};dur={:.1f}'.format(name, seconds * 1000)
+                         for name, seconds in phases)
+
+    def observe(self):
+        """
+        record the phases and total time of the request in REQUEST_PHASES
+
+        :returns: None
+        """
+
+        if not METRICS:
+            return
+
+        phases = self.phases + [('total', time.perf_counter() - self.start)]
+
+        for name, seconds in phases:
+            REQUEST_PHASES.observe(seconds, phase=name, **self.labels)
+
+        notify_change()
+
+
+def count_cache_lookup(cache, hit):
+    """
+    record a cache lookup in CACHE_LOOKUPS
+
+    :param cache: cache name (i.e. mapfile, capabilities, response)
+    :param hit: whether the item was cached
+
+    :returns: None
+    """
+
+    if METRICS:
+        CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+        notify_change()
+
+
+def set_metrics_dir(path):
+    """
+    share the metrics of processes in a directory, from which they are
+    merged at rendering (i.e. for pre-forked workers). Metrics files of a
+    previous server are removed.
+
+    :param path: directory path (None to keep metrics per process)
+
+    :returns: None
+    """
+
+    global METRICS_DIR
+
+    METRICS_DIR = path
+
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+        for filepath in glob.glob(os.path.join(path, '*.json')):
+            os.remove(filepath)
+
+
+def reset_metrics():
+    """
+    forget the metrics of this process (i.e. inherited by a forked worker
+    from its parent)
+
+    :returns: None
+    """
+
+    REQUEST_PHASES.reset()
+    CACHE_LOOKUPS.reset()
+
+
+def flush_metrics():
+    """
+    write the metrics of this process to METRICS_DIR (if set)
+
+    :returns: None
+    """
+
+    if METRICS_DIR is None:
+        return
+
+    with _FLUSH_LOCK:
+        _CHANGED.clear()
+
+        snapshot = {
+            REQUEST_PHASES.name: REQUEST_PHASES.dump(),
+            CACHE_LOOKUPS.name: CACHE_LOOKUPS.dump()
+        }
+
+        fd, tmp_filepath = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+        try:
+            with io.open(fd, 'w') as fh:
+                json.dump(snapshot, fh)
+            os.replace(tmp_filepath, os.path.join(
+                METRICS_DIR, '{}.json'.format(os.getpid())))
+        except Exception:
+            os.remove(tmp_filepath)
+            raise
+
+
+def _flush_periodically():
+    """
+    flush the metrics of this process whenever they change, at most
+    every FLUSH_INTERVAL seconds
+
+    :returns: None
+    """
+
+    while True:
+        _CHANGED.wait()
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush_metrics()
+        except OSError as err:
+            LOGGER.warning('Could not flush metrics: {}'.format(err))
+
+
+def notify_change():
+    """
+    schedule a flush of the metrics of this process to METRICS_DIR,
+    starting the flushing thread of the process on first use
+
+    :returns: None
+    """
+
+    global _FLUSHER_PID
+
+    if METRICS_DIR is None:
+        return
+
+    _CHANGED.set()
+
+    if _FLUSHER_PID != os.getpid():
+        with _FLUSHER_LOCK:
+            if _FLUSHER_PID != os.getpid():
+                _FLUSHER_PID = os.getpid()
+                threading.Thread(target=_flush_periodically,
+                                 daemon=True).start()
+                atexit.register(flush_metrics)
+
+
+def merge_metrics():
+    """
+    merge the metrics of all processes sharing METRICS_DIR (including
+    processes that exited, so that counters never go backwards)
+
+    :returns: `list` of merged metrics
+    """
+
+    flush_metrics()
+
+    metrics = [Histogram(REQUEST_PHASES.name, REQUEST_PHASES.help,
+                         REQUEST_PHASES.buckets),
+               Counter(CACHE_LOOKUPS.name, CACHE_LOOKUPS.help)]
+
+    for filepath in sorted(glob.glob(os.path.join(METRICS_DIR, '*.json'))):
+        try:
+            with io.open(filepath) as fh:
+                snapshot = json.load(fh)
+        except (OSError, ValueError) as err:
+            LOGGER.warning('Could not read metrics {}: {}'.format(
+                filepath, err))
+            continue
+
+        for metric in metrics:
+            metric.merge(snapshot.get(metric.name, []))
+
+    return metrics
+
+
+def render_metrics():
+    """
+    :returns: `str` of all metrics in text exposition format, merged
+              across processes when METRICS_DIR is set
+    """
+
+    if METRICS_DIR is None:
+        metrics = [REQUEST_PHASES, CACHE_LOOKUPS]
+    else:
+        metrics = merge_metrics()
+
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,129 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import cProfile
+from datetime import datetime, timezone
+import hashlib
+import hmac
+import logging
+import os
+import re
+import threading
+from urllib.parse import parse_qsl
+
+from geomet_climate.env import BASEDIR, PROFILE_SECRET
+
+LOGGER = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(BASEDIR, 'profiles')
+
+# WSGI environment key of the X-GeoMet-Climate-Profile request header
+PROFILE_HEADER = 'HTTP_X_GEOMET_CLIMATE_PROFILE'
+
+# characters replaced in profile filenames
+UNSAFE_CHARACTERS = re.compile(r'[^A-Za-z0-9._=,-]+')
+
+# maximum length of the request part of profile filenames
+MAX_NAME_LENGTH = 160
+
+# only one profiler can be active at a time
+PROFILE_LOCK = threading.Lock()
+
+
+def is_profiling_requested(env):
+    """
+    :param env: WSGI environment
+
+    :returns: `bool` of whether profiling is enabled and the request
+              carries the profiling secret
+    """
+
+    if PROFILE_SECRET is None or PROFILE_HEADER not in env:
+        return False
+
+    return hmac.compare_digest(env[PROFILE_HEADER].encode('utf-8'),
+                               PROFILE_SECRET.encode('utf-8'))
+
+
+def get_profile_name(path_info, query_string):
+    """
+    normalized request (path and sorted, upper cased parameter names),
+    made safe for use as a filename
+
+    :param path_info: path of request
+    :param query_string: key-value parameters of the request
+
+    :returns: `str` of profile name
+    """
+
+    params = sorted((key.upper(), value) for key, value in
+                    parse_qsl(query_string, keep_blank_values=True))
+
+    name = '_'.join('{}={}'.format(key, value) for key, value in params)
+    if path_info.strip('/'):
+        name = '{}_{}'.format(path_info.strip('/'), name)
+
+    name = UNSAFE_CHARACTERS.sub('_', name).strip('_') or 'request'
+
+    if len(name) > MAX_NAME_LENGTH:
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:12]
+        name = '{}_{}'.format(name[:MAX_NAME_LENGTH], digest)
+
+    return name
+
+
+def profile_request(func, env, start_response, *args):
+    """
+    Run a WSGI request under cProfile (including the time spent in
+    mapscript calls) and dump its statistics to PROFILE_DIR, as
+    <normalized request>.<UTC time>.prof (the filename is returned in the
+    X-GeoMet-Climate-Profile response header)
+
+    :param func: WSGI callable serving the request
+    :param env: WSGI environment
+    :param start_response: WSGI start_response
+    :param args: any other arguments of func
+
+    :returns: WSGI response
+    """
+
+    if not PROFILE_LOCK.acquire(blocking=False):
+        LOGGER.warning('Profiler busy, serving request without profiling')
+        return func(env, start_response, *args)
+
+    try:
+        filename = '{}.{}.prof'.format(
+            get_profile_name(env.get('PATH_INFO', ''),
+                             env.get('QUERY_STRING', '')),
+            datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ'))
+
+        def start_response_(status, headers):
+            return start_response(status, headers + [
+                ('X-GeoMet-Climate-Profile', filename)])
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, env, start_response_, *args)
+        finally:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            filepath = os.path.join(PROFILE_DIR, filename)
+            profiler.dump_stats(filepath)
+            LOGGER.info('Request profile written to {}'.format(filepath))
+    finally:
+        PROFILE_LOCK.release()
@@ -0,0 +1,265 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import io
+import json
+import logging
+import multiprocessing
+import time
+
+import click
+import mapscript
+import yaml
+from yaml import CLoader
+
+from geomet_climate.env import (
+    BASEDIR, CONFIG, RESPONSE_CACHE_DIR, RESPONSE_CACHE_DISK_SIZE)
+from geomet_climate.mapfile import MAPFILE_BASE
+from geomet_climate.tiles import (
+    METATILE, TILE_MATRIX_SETS, TileRenderError, get_metatile,
+    get_tile_range, render_metatile)
+from geomet_climate.timedimension import TimeDimension
+from geomet_climate.wsgi import TILE_CACHE, get_tile_key, load_mapfile
+
+LOGGER = logging.getLogger(__name__)
+
+
+def parse_zoom_levels(value):
+    """
+    :param value: zoom levels (i.e. 0-5 or 3 or 0,2,4)
+
+    :returns: `list` of zoom levels
+    """
+
+    zooms = []
+
+    for token in value.split(','):
+        start, _, end = token.partition('-')
+        zooms.extend(range(int(start), int(end or start) + 1))
+
+    return sorted(set(zooms))
+
+
+def get_times(layer_info, time_steps):
+    """
+    TIME values of a layer to seed
+
+    :param layer_info: layer information
+    :param time_steps: number of most recent time steps to seed
+                       besides the default time (-1 for all)
+
+    :returns: `list` of TIME values (None for the layer default)
+    """
+
+    times = [None]
+
+    if 'timestep' not in layer_info or time_steps == 0:
+        return times
+
+    time_dimension = TimeDimension.from_layer_info(layer_info)
+    values = list(time_dimension)
+
+    if time_steps > 0:
+        values = values[-time_steps:]
+
+    return times + list(reversed(values))
+
+
+def get_metatiles(tile_matrix_set, zoom, bbox):
+    """
+    metatiles of a zoom level intersecting a bounding box
+
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param bbox: `list` of minlon, minlat, maxlon, maxlat
+
+    :returns: `list` of (column, row) of the top left tile of metatiles
+    """
+
+    minx, miny, maxx, maxy = get_tile_range(tile_matrix_set, zoom, bbox)
+
+    return [(x, y)
+            for y in range(miny - miny % METATILE, maxy + 1, METATILE)
+            for x in range(minx - minx % METATILE, maxx + 1, METATILE)]
+
+
+def is_seeded(mapfile, tile_matrix_set, zoom, x, y, time_, style):
+    """
+    :returns: `bool` of whether all tiles of a metatile are cached
+    """
+
+    x0, y0, columns, rows = get_metatile(tile_matrix_set, zoom, x, y)
+
+    for column in range(x0, x0 + columns):
+        for row in range(y0, y0 + rows):
+            key = get_tile_key(mapfile, tile_matrix_set, zoom, column, row,
+                               time_, style)
+            if key not in TILE_CACHE:
+                return False
+
+    return True
+
+
+def seed_metatile(item):
+    """
+    render a metatile into the tile cache
+
+    :param item: tuple of layer name, tile matrix set name, zoom level,
+                 column, row, TIME value, style and resume flag
+
+    :returns: tuple of status (seeded, skipped or failed) and number
+              of tiles written
+    """
+
+    layer, tile_matrix_set, zoom, x, y, time_, style, resume = item
+
+    mapfile = '{}/mapfile/geomet-climate-WMS-{}.map'.format(BASEDIR, layer)
+
+    # a failed metatile (MapServer error, missing mapfile, cache write
+    # error) is reported without stopping the seeding of the others
+    try:
+        if resume and is_seeded(mapfile, tile_matrix_set, zoom, x, y, time_,
+                                style):
+            return 'skipped', 0
+
+        tiles = render_metatile(load_mapfile(mapfile), layer,
+                                tile_matrix_set, zoom, x, y, time_, style)
+
+        for (x_, y_), content in tiles.items():
+            TILE_CACHE.set(get_tile_key(mapfile, tile_matrix_set, zoom, x_,
+                                        y_, time_, style),
+                           'image/png', content)
+    except (TileRenderError, mapscript.MapServerError, OSError) as err:
+        LOGGER.error('Failed to seed {} {} {}/{}/{}: {}'.format(
+            layer, time_, zoom, x, y, err))
+        return 'failed', 0
+
+    return 'seeded', len(tiles)
+
+
+@click.group()
+def cache():
+    pass
+
+
+@click.command()
+@click.pass_context
+@click.option('--layer', '-lyr', multiple=True,
+              help='layer (repeatable, default all raster layers)')
+@click.option('--zoom', '-z', default='0-4',
+              help='zoom levels (i.e. 0-4 or 2,4)')
+@click.option('--tilematrixset', '-t', type=click.Choice(TILE_MATRIX_SETS),
+              default='WebMercatorQuad', help='tile matrix set')
+@click.option('--time-steps', type=int, default=0,
+              help='number of most recent time steps to seed besides the '
+                   'default time (-1 for all)')
+@click.option('--bbox', help='minlon,minlat,maxlon,maxlat to seed '
+                             '(default service extent)')
+@click.option('--jobs', '-j', type=int, default=1,
+              help='number of parallel processes')
+@click.option('--resume', is_flag=True,
+              help='skip metatiles already in the cache')
+def seed(ctx, layer, zoom, tilematrixset, time_steps, bbox, jobs, resume):
+    """seed tile cache"""
+
+    if RESPONSE_CACHE_DIR is None:
+        raise click.ClickException(
+            'GEOMET_CLIMATE_RESPONSE_CACHE_DIR must be set to seed tiles')
+
+    with io.open(CONFIG) as fh:
+        cfg = yaml.load(fh, Loader=CLoader)
+
+    if bbox is not None:
+        bbox = [float(v) for v in bbox.split(',')]
+    else:
+        with io.open(MAPFILE_BASE) as fh:
+            bbox = json.load(fh)['extent']
+
+    unknown = [layer_ for layer_ in layer if layer_ not in cfg['layers']]
+    if unknown:
+        raise click.ClickException('Unknown layers: {}'.format(
+            ', '.join(unknown)))
+
+    layers = layer or [key for key, value in cfg['layers'].items()
+                       if value['type'] == 'RASTER']
+
+    items = []
+    for layer_ in layers:
+        for time_ in get_times(cfg['layers'][layer_], time_steps):
+            for zoom_ in parse_zoom_levels(zoom):
+                for x, y in get_metatiles(tilematrixset, zoom_, bbox):
+                    items.append((layer_, tilematrixset, zoom_, x, y, time_,
+                                  None, resume))
+
+    click.echo('Seeding {} metatiles ({} layers)'.format(
+        len(items), len(layers)))
+
+    counts = dict.fromkeys(['seeded', 'skipped', 'failed'], 0)
+    num_tiles = 0
+    start = time.monotonic()
+    last_report = start
+
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap_unordered(seed_metatile, items)
+    else:
+        pool = None
+        results = map(seed_metatile, items)
+
+    try:
+        for i, (status, tiles) in enumerate(results, 1):
+            counts[status] += 1
+            num_tiles += tiles
+
+            now = time.monotonic()
+            if now - last_report >= 10 or i == len(items):
+                last_report = now
+                click.echo('{}/{} metatiles, {} tiles, {:.1f} tiles/s'.format(
+                    i, len(items), num_tiles,
+                    num_tiles / max(now - start, 1e-6)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    click.echo('Seeded {seeded}, skipped {skipped}, failed {failed} '
+               'metatiles in {elapsed:.2f}s'.format(
+                   elapsed=time.monotonic() - start, **counts))
+
+    if counts['failed']:
+        raise click.ClickException('{} metatiles failed'.format(
+            counts['failed']))
+
+
+@click.command()
+@click.pass_context
+def prune(ctx):
+    """evict least recently used responses beyond the disk cache size"""
+
+    if RESPONSE_CACHE_DIR is None:
+        raise click.ClickException(
+            'GEOMET_CLIMATE_RESPONSE_CACHE_DIR is not set')
+
+    size = TILE_CACHE.disk.prune()
+
+    click.echo('Disk cache size: {} bytes (maximum {})'.format(
+        size, RESPONSE_CACHE_DISK_SIZE))
+
+
+cache.add_command(seed)
+cache.add_command(prune)
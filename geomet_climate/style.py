@@ -0,0 +1,84 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+from functools import lru_cache
+import hashlib
+import io
+import json
+import logging
+import os
+
+LOGGER = logging.getLogger(__name__)
+
+THISDIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def get_style_path(style):
+    """
+    :param style: style file, relative to resources
+                  (i.e. mapserv/class/temp_anomalies.json)
+
+    :returns: path to style file
+    """
+
+    return os.path.join(THISDIR, 'resources', style)
+
+
+@lru_cache(maxsize=None)
+def load_style(style):
+    """
+    load and validate the classes of a style file, once per process
+
+    :param style: style file, relative to resources
+                  (i.e. mapserv/class/temp_anomalies.json)
+
+    :returns: `tuple` of mappyfile class objects. These are shared by
+              every caller and must not be modified (copy them first)
+    """
+
+    LOGGER.debug('Loading style {}'.format(style))
+
+    with io.open(get_style_path(style)) as fh:
+        classes = json.load(fh)
+
+    if not isinstance(classes, list) or not classes:
+        raise ValueError('Invalid style {}: expected a list of classes'
+                         .format(style))
+
+    for class_ in classes:
+        if not isinstance(class_, dict) or 'style' not in class_:
+            raise ValueError('Invalid style {}: class without style'
+                             .format(style))
+
+    return tuple(classes)
+
+
+@lru_cache(maxsize=None)
+def get_style_digest(style):
+    """
+    digest of the contents of a style file, computed once per process
+
+    :param style: style file, relative to resources
+                  (i.e. mapserv/class/temp_anomalies.json)
+
+    :returns: `str` of digest
+    """
+
+    with io.open(get_style_path(style), 'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
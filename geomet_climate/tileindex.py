@@ -17,19 +17,31 @@
 #
 ###############################################################################
 
+import hashlib
 import io
 import logging
+import multiprocessing
 import os
+import time
 
 import click
 from osgeo import gdal, ogr, osr
 import yaml
 from yaml import CLoader
 
-from geomet_climate.env import BASEDIR, CONFIG, DATADIR
+from geomet_climate.env import (
+    BASEDIR, CONFIG, DATADIR, TILEINDEX_CONSOLIDATED)
+from geomet_climate.manifest import (
+    get_fingerprint, load_manifest, prune_manifest, save_manifest)
+from geomet_climate.timedimension import TimeDimension
 
 LOGGER = logging.getLogger(__name__)
 
+# single tileindex of all layers (GEOMET_CLIMATE_TILEINDEX_CONSOLIDATED),
+# with a table per projection (see get_consolidated_table)
+CONSOLIDATED_TILEINDEX = os.path.join(BASEDIR, 'tileindex', 'tileindex.gpkg')
+CONSOLIDATED_TILEINDEX_TABLE = 'tileindex'
+
 VRT_TEMPLATE_FULL = '''<VRTDataset rasterXSize="{x}" rasterYSize="{y}">
   <GeoTransform>{gtf}</GeoTransform>
   <VRTRasterBand dataType="Float32" band="1">
@@ -106,7 +118,6 @@ def get_time_index_vrt(layer_info):
     the file (vrt) with the associated time stamp
     """
 
-    num = 0
     band_time = {}
     file_time = {}
     vrts = []
@@ -117,28 +128,11 @@ def get_time_index_vrt(layer_info):
         if f.startswith(vrt_name):
             vrts.append(f)
 
-    time_begin = layer_info['climate_model']['temporal_extent']['begin']
-    num_bands = layer_info['num_bands']
+    time_dimension = TimeDimension.from_layer_info(layer_info)
 
     # Dict to associate the band number and the time they should refer to
-    if layer_info['timestep'] == 'P1M':
-        for i in range(1, num_bands + 1):
-            begin_year, begin_month = time_begin.split('-')
-            begin = (int(begin_year) * 12) + int(begin_month)
-            time = begin + num
-            year = int(time/12)
-            month = (time - (year * 12))
-            if month == 0:
-                year = year - 1
-                month = 12
-            time_stamp = '{}-{}'.format(int(year), str(month).zfill(2))
-            band_time[i] = '{}-00T00:00:00'.format(str(time_stamp))
-            num += 1
-    else:
-        for i in range(1, num_bands + 1):
-            time_stamp = time_begin + num
-            band_time[i] = '{}-01-00T00:00:00'.format(str(time_stamp))
-            num += 1
+    for i in range(1, layer_info['num_bands'] + 1):
+        band_time[i] = time_dimension.timestamp(i - 1)
 
     for k in vrts:
         band = k.replace('.vrt', '').split('_')[-1]
@@ -147,15 +141,21 @@ def get_time_index_vrt(layer_info):
     return file_time
 
 
-def create_dataset(layer_info, input_dir, output_dir):
+def create_dataset(layer_info, input_dir, output_dir, vacuum=False):
     """
     This function is needed to create the tile index
     for every layer, we will want to create a gpkg tile index.
 
     Every gpkg will have a column with the absolute path to the VRT
     and a timestamp column for the time value associated with each band
+
+    :param layer_info: layer information
+    :param input_dir: VRT directory
+    :param output_dir: tileindex output directory
+    :param vacuum: whether to VACUUM the GeoPackage once written
+
+    :returns: None
     """
-    file_time = None
 
     if 'filepath' in layer_info:
         output = '{}{}{}{}{}'.format(output_dir, os.sep,
@@ -164,97 +164,383 @@ def create_dataset(layer_info, input_dir, output_dir):
         if not os.path.exists(output):
             os.makedirs(output)
 
-    if layer_info['type'] == 'RASTER':
-        if all(['is_vrt' in layer_info['climate_model'],
-                layer_info['num_bands'] > 1]):
-            LOGGER.info('Creating tileindex')
-            file_time = get_time_index_vrt(layer_info)
-            ds_name = layer_info['filename'].replace('.nc', '')
-            ds_path = os.path.join(output, layer_info['filename'].replace(
-                                    '.nc', '.gpkg'))
-
-        elif 'timestep' in layer_info and layer_info['num_bands'] == 1:
-            file_time = get_time_index_novrt(layer_info)
-            ds_name = layer_info['filename']
-            ds_path = '{}.gpkg'.format(
-                os.path.join(output, layer_info['filename']))
+    dataset = get_dataset(layer_info, output_dir)
 
-        else:
+    if dataset is not None:
+        ds_path, ds_name, records = dataset
+        write_tileindex(ds_path, ds_name,
+                        layer_info['climate_model']['projection'],
+                        layer_info['climate_model']['extent'],
+                        records, vacuum)
+
+
+def get_dataset_path(layer_info, output_dir):
+    """
+    :param layer_info: layer information
+    :param output_dir: tileindex output directory
+
+    :returns: path to the tileindex GeoPackage of a layer, or None if the
+              layer is not time enabled
+    """
+
+    if layer_info['type'] != 'RASTER' or 'filepath' not in layer_info:
+        return None
+
+    output = '{}{}{}{}{}'.format(output_dir, os.sep,
+                                 layer_info['climate_model']['basepath'],
+                                 os.sep, layer_info['filepath'])
+
+    if all(['is_vrt' in layer_info['climate_model'],
+            layer_info['num_bands'] > 1]):
+        return os.path.join(output, layer_info['filename'].replace(
+                            '.nc', '.gpkg'))
+
+    if 'timestep' in layer_info and layer_info['num_bands'] == 1:
+        return '{}.gpkg'.format(os.path.join(output, layer_info['filename']))
+
+    return None
+
+
+def get_dataset(layer_info, output_dir):
+    """
+    resolve the tileindex GeoPackage of a layer and its records
+
+    :param layer_info: layer information
+    :param output_dir: tileindex output directory
+
+    :returns: tuple of GeoPackage path, GeoPackage layer name and `list`
+              of (location, timestamp) records, or None if the layer
+              is not time enabled
+    """
+
+    ds_path = get_dataset_path(layer_info, output_dir)
+
+    if ds_path is None:
+        if layer_info['type'] == 'RASTER':
             msg = '{} is not a time enabled layer'.format(
                 layer_info['label_en'])
             LOGGER.debug(msg)
+        return None
 
-    if file_time:
-        LOGGER.debug('Creating dataset')
-        driver = ogr.GetDriverByName('GPKG')
+    if layer_info['num_bands'] > 1:
+        LOGGER.info('Creating tileindex')
+        file_time = get_time_index_vrt(layer_info)
+        ds_name = layer_info['filename'].replace('.nc', '')
+    else:
+        file_time = get_time_index_novrt(layer_info)
+        ds_name = layer_info['filename']
 
-        srs = osr.SpatialReference()
-        srs.ImportFromWkt(layer_info['climate_model']['projection'])
+    if not file_time:
+        return None
+
+    return ds_path, ds_name, get_tileindex_records(layer_info, file_time)
 
-        ds = driver.CreateDataSource(ds_path)
-        layer = ds.CreateLayer(ds_name, srs, ogr.wkbPolygon)
-        layerdefinition = layer.GetLayerDefn()
-        layer.CreateField(ogr.FieldDefn('location', ogr.OFTString))
-        layer.CreateField(ogr.FieldDefn('timestamp', ogr.OFTString))
 
-        extent = layer_info['climate_model']['extent']
-        extent = [int(s) for s in extent]
-        xsize, ysize = layer_info['climate_model']['dimensions']
-        filename = os.path.join(DATADIR,
-                                layer_info['climate_model']['basepath'],
-                                layer_info['filepath'],
-                                layer_info['filename'])
-
-        LOGGER.info('Generating GPKG')
-        nodata_check = False
-        for key in file_time:
-            LOGGER.debug('Adding feature to layer')
-            if not key.endswith('.tif'):
-                if nodata_check is False:
-                    netcdf_ds = gdal.Open(filename)
-                    srcband = netcdf_ds.GetRasterBand(1)
-                    nodata = srcband.GetNoDataValue()
-                    nodata_check = True
-                    netcdf_ds = None
-                band = key.split('_')[-1].replace('.vrt', '')
-                gtf = layer_info['climate_model']['geo_transform']
-
-                gpkg_dict = {'filename': filename, 'x': xsize,
-                             'y': ysize,
-                             'gtf': gtf,
-                             'nodata': nodata,
-                             'band': band}
-
-                filename_gpkg = VRT_TEMPLATE_FULL.format(**gpkg_dict)
-            elif key.endswith('.tif'):
-                filename_gpkg = os.path.abspath(
-                    os.path.join(
-                        DATADIR,
-                        layer_info['climate_model']['basepath'],
-                        layer_info['filepath'], key
-                    )
+def get_tileindex_records(layer_info, file_time):
+    """
+    resolve the tileindex location (inline VRT or GeoTIFF path) of each
+    time step of a layer
+
+    :param layer_info: layer information
+    :param file_time: `dict` of VRT/GeoTIFF filename to timestamp
+
+    :returns: `list` of (location, timestamp) tuples
+    """
+
+    records = []
+
+    xsize, ysize = layer_info['climate_model']['dimensions']
+    filename = os.path.join(DATADIR,
+                            layer_info['climate_model']['basepath'],
+                            layer_info['filepath'],
+                            layer_info['filename'])
+
+    nodata_check = False
+    for key in file_time:
+        if not key.endswith('.tif'):
+            if nodata_check is False:
+                netcdf_ds = gdal.Open(filename)
+                srcband = netcdf_ds.GetRasterBand(1)
+                nodata = srcband.GetNoDataValue()
+                nodata_check = True
+                netcdf_ds = None
+            band = key.split('_')[-1].replace('.vrt', '')
+            gtf = layer_info['climate_model']['geo_transform']
+
+            gpkg_dict = {'filename': filename, 'x': xsize,
+                         'y': ysize,
+                         'gtf': gtf,
+                         'nodata': nodata,
+                         'band': band}
+
+            location = VRT_TEMPLATE_FULL.format(**gpkg_dict)
+        else:
+            location = os.path.abspath(
+                os.path.join(
+                    DATADIR,
+                    layer_info['climate_model']['basepath'],
+                    layer_info['filepath'], key
                 )
+            )
+
+        records.append((location, file_time[key]))
+
+    return records
+
+
+def get_extent_polygon(extent):
+    """
+    :param extent: `list` of minx, miny, maxx, maxy
+
+    :returns: `ogr.Geometry` polygon of extent
+    """
+
+    extent = [int(s) for s in extent]
+
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    ring.AddPoint(extent[0], extent[1])
+    ring.AddPoint(extent[0], extent[3])
+    ring.AddPoint(extent[2], extent[3])
+    ring.AddPoint(extent[2], extent[1])
+    ring.AddPoint(extent[0], extent[1])
+    poly = ogr.Geometry(ogr.wkbPolygon)
+    poly.AddGeometry(ring)
+
+    return poly
 
-            ring = ogr.Geometry(ogr.wkbLinearRing)
-            ring.AddPoint(extent[0], extent[1])
-            ring.AddPoint(extent[0], extent[3])
-            ring.AddPoint(extent[2], extent[3])
-            ring.AddPoint(extent[2], extent[1])
-            ring.AddPoint(extent[0], extent[1])
-            poly = ogr.Geometry(ogr.wkbPolygon)
-            poly.AddGeometry(ring)
 
-            LOGGER.debug('Creating feature')
+def write_tileindex(ds_path, ds_name, projection, extent, records,
+                    vacuum=False):
+    """
+    write a tileindex GeoPackage, adding all features in a single
+    transaction. Every time step covers the same extent, so one
+    geometry is shared by all features
+
+    :param ds_path: path to GeoPackage
+    :param ds_name: name of GeoPackage layer
+    :param projection: WKT projection
+    :param extent: `list` of minx, miny, maxx, maxy
+    :param records: `list` of (location, timestamp) tuples
+    :param vacuum: whether to VACUUM the GeoPackage once written
+
+    :returns: None
+    """
+
+    LOGGER.debug('Creating dataset')
+    driver = ogr.GetDriverByName('GPKG')
+
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+
+    if os.path.exists(ds_path):
+        LOGGER.debug('Removing existing {}'.format(ds_path))
+        driver.DeleteDataSource(ds_path)
+
+    ds = driver.CreateDataSource(ds_path)
+    layer = ds.CreateLayer(ds_name, srs, ogr.wkbPolygon)
+    layerdefinition = layer.GetLayerDefn()
+    layer.CreateField(ogr.FieldDefn('location', ogr.OFTString))
+    layer.CreateField(ogr.FieldDefn('timestamp', ogr.OFTString))
+
+    poly = get_extent_polygon(extent)
+
+    LOGGER.info('Generating GPKG ({} features)'.format(len(records)))
+    ds.StartTransaction()
+    try:
+        for location, timestamp in records:
             feature = ogr.Feature(layerdefinition)
-            LOGGER.debug('Creating geometry')
             feature.SetGeometry(poly)
-            LOGGER.debug('Adding fields')
-            feature.SetField('location', filename_gpkg)
-            feature.SetField('timestamp', file_time[key])
+            feature.SetField('location', location)
+            feature.SetField('timestamp', timestamp)
             layer.CreateFeature(feature)
+    except Exception:
+        ds.RollbackTransaction()
+        raise
+    ds.CommitTransaction()
 
+    if vacuum:
+        LOGGER.debug('Vacuuming {}'.format(ds_path))
         ds.ExecuteSQL('VACUUM')
-        ds.Destroy()
+
+    ds.Destroy()
+
+
+def get_consolidated_table(projection):
+    """
+    :param projection: WKT projection of layer
+
+    :returns: name of the table of the consolidated tileindex holding the
+              records of the layers of the projection (a GeoPackage table
+              has a single SRS)
+    """
+
+    digest = hashlib.sha1(projection.encode('utf-8')).hexdigest()[:8]
+
+    return '{}_{}'.format(CONSOLIDATED_TILEINDEX_TABLE, digest)
+
+
+def get_consolidated_layer(ds, projection):
+    """
+    get (or create) the table of a projection in the consolidated tileindex
+
+    :param ds: `ogr.DataSource` of consolidated GeoPackage
+    :param projection: WKT projection
+
+    :returns: `ogr.Layer` of table
+    """
+
+    table = get_consolidated_table(projection)
+    layer = ds.GetLayerByName(table)
+
+    if layer is None:
+        LOGGER.debug('Creating consolidated tileindex table {}'.format(
+            table))
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(projection)
+
+        layer = ds.CreateLayer(table, srs, ogr.wkbPolygon)
+        layer.CreateField(ogr.FieldDefn('layer', ogr.OFTString))
+        layer.CreateField(ogr.FieldDefn('location', ogr.OFTString))
+        layer.CreateField(ogr.FieldDefn('timestamp', ogr.OFTString))
+        ds.ExecuteSQL('CREATE INDEX {0}_layer_timestamp '
+                      'ON {0} (layer, timestamp)'.format(table))
+
+    return layer
+
+
+def write_consolidated_tileindex(ds_path, layers, layer_names=None,
+                                 vacuum=False):
+    """
+    write the records of layers into the consolidated tileindex, a single
+    GeoPackage with a table of (layer, timestamp, location) indexed on
+    (layer, timestamp) per projection. Existing records of the layers
+    are replaced
+
+    :param ds_path: path to consolidated GeoPackage
+    :param layers: `dict` of layer name to tuple of WKT projection, extent
+                   and `list` of (location, timestamp) records (`None` to
+                   only remove the records of the layer)
+    :param layer_names: names of all the layers of the configuration, to
+                        remove the records of any other layer (`None` to
+                        keep them)
+    :param vacuum: whether to VACUUM the GeoPackage once written
+
+    :returns: None
+    """
+
+    driver = ogr.GetDriverByName('GPKG')
+
+    if os.path.exists(ds_path):
+        ds = driver.Open(ds_path, 1)
+    else:
+        LOGGER.debug('Creating consolidated tileindex {}'.format(ds_path))
+        os.makedirs(os.path.dirname(ds_path), exist_ok=True)
+        ds = driver.CreateDataSource(ds_path)
+
+    def quote(value):
+        return "'{}'".format(value.replace("'", "''"))
+
+    for value in layers.values():
+        if value is not None:
+            get_consolidated_layer(ds, value[0])
+
+    tables = [ds.GetLayer(i).GetName() for i in range(ds.GetLayerCount())]
+    tables = [table for table in tables
+              if table.startswith(CONSOLIDATED_TILEINDEX_TABLE)]
+
+    ds.StartTransaction()
+    try:
+        if layer_names is not None:
+            LOGGER.debug('Removing consolidated records of removed layers')
+            for table in tables:
+                ds.ExecuteSQL('DELETE FROM {} WHERE layer NOT IN ({})'.format(
+                    table, ','.join(quote(name) for name in layer_names)))
+
+        for key, value in layers.items():
+            LOGGER.debug('Replacing consolidated records of {}'.format(key))
+            # from any table, should the projection of the layer change
+            for table in tables:
+                ds.ExecuteSQL('DELETE FROM {} WHERE layer = {}'.format(
+                    table, quote(key)))
+
+            if value is None:
+                continue
+
+            projection, extent, records = value
+            layer = ds.GetLayerByName(get_consolidated_table(projection))
+            layerdefinition = layer.GetLayerDefn()
+            poly = get_extent_polygon(extent)
+
+            for location, timestamp in records:
+                feature = ogr.Feature(layerdefinition)
+                feature.SetGeometry(poly)
+                feature.SetField('layer', key)
+                feature.SetField('location', location)
+                feature.SetField('timestamp', timestamp)
+                layer.CreateFeature(feature)
+    except Exception:
+        ds.RollbackTransaction()
+        raise
+    ds.CommitTransaction()
+
+    if vacuum:
+        LOGGER.debug('Vacuuming {}'.format(ds_path))
+        ds.ExecuteSQL('VACUUM')
+
+    ds.Destroy()
+
+
+def get_consolidated_records(item):
+    """
+    get_dataset wrapper returning the records of a layer for the
+    consolidated tileindex
+
+    :param item: tuple of layer information and output directory
+
+    :returns: tuple of WKT projection, extent and `list` of
+              (location, timestamp) records, or None if the layer is not
+              time enabled
+    """
+
+    layer_info, output_dir = item
+
+    dataset = get_dataset(layer_info, output_dir)
+
+    if dataset is None:
+        return None
+
+    return (layer_info['climate_model']['projection'],
+            layer_info['climate_model']['extent'], dataset[2])
+
+
+def create_dataset_isolated(item):
+    """
+    create_dataset wrapper which times a layer and captures its failure,
+    so that one bad layer does not abort the whole run
+
+    :param item: tuple of layer name, layer information, input directory,
+                 output directory and vacuum flag
+
+    :returns: tuple of layer name, wall time (seconds), error message
+              (None on success) and, for the consolidated tileindex,
+              the records of the layer (written by the caller)
+    """
+
+    key, layer_info, input_dir, output_dir, vacuum = item
+    error = None
+    records = None
+
+    start = time.monotonic()
+    try:
+        if TILEINDEX_CONSOLIDATED:
+            records = get_consolidated_records((layer_info, output_dir))
+        else:
+            create_dataset(layer_info, input_dir, output_dir, vacuum)
+    except Exception as err:
+        LOGGER.exception('Failed to create tileindex of {}'.format(key))
+        error = '{}: {}'.format(type(err).__name__, err)
+
+    return key, time.monotonic() - start, error, records
 
 
 @click.group()
@@ -265,7 +551,13 @@ def tileindex():
 @click.command()
 @click.pass_context
 @click.option('--layer', '-lyr', help='layer')
-def generate(ctx, layer):
+@click.option('--jobs', '-j', type=int, default=1,
+              help='number of parallel processes')
+@click.option('--incremental', is_flag=True,
+              help='only regenerate layers whose inputs changed')
+@click.option('--vacuum', is_flag=True,
+              help='VACUUM each GeoPackage once written')
+def generate(ctx, layer, jobs, incremental, vacuum):
     """generate tileindex"""
 
     input_dir = '{}{}vrt'.format(BASEDIR, os.sep)
@@ -277,13 +569,76 @@ def generate(ctx, layer):
     with io.open(CONFIG) as fh:
         cfg = yaml.load(fh, Loader=CLoader)
 
-        if layer is not None:
-            if not cfg['layers'][layer]['type'] == 'POINT':
-                create_dataset(cfg['layers'][layer], input_dir, output_dir)
+    if layer is not None:
+        layers = {
+            layer: cfg['layers'][layer]
+        }
+    else:
+        layers = cfg['layers']
+
+    manifest = load_manifest('tileindex')
+
+    items = []
+    fingerprints = {}
+    for key, value in layers.items():
+        if value['type'] == 'POINT':
+            continue
+
+        fingerprints[key] = get_fingerprint(value, DATADIR,
+                                            TILEINDEX_CONSOLIDATED)
+        if TILEINDEX_CONSOLIDATED:
+            ds_path = CONSOLIDATED_TILEINDEX
+        else:
+            ds_path = get_dataset_path(value, output_dir)
+        if all([incremental,
+                manifest.get(key) == fingerprints[key],
+                ds_path is None or os.path.exists(ds_path)]):
+            LOGGER.debug('Skipping unchanged layer {}'.format(key))
+            continue
+
+        items.append((key, value, input_dir, output_dir, vacuum))
+
+    start = time.monotonic()
+
+    if jobs > 1:
+        LOGGER.info('Generating tileindexes with {} processes'.format(jobs))
+        with multiprocessing.Pool(jobs) as pool:
+            results = list(pool.imap_unordered(create_dataset_isolated,
+                                               items))
+    else:
+        results = [create_dataset_isolated(item) for item in items]
+
+    failed = {}
+    consolidated = {}
+    for key, wall_time, error, records in results:
+        if error is None:
+            manifest[key] = fingerprints[key]
+            consolidated[key] = records
         else:
-            for layers, values in cfg['layers'].items():
-                if not values['type'] == 'POINT':
-                    create_dataset(values, input_dir, output_dir)
+            failed[key] = error
+            manifest.pop(key, None)
+
+    if TILEINDEX_CONSOLIDATED:
+        LOGGER.info('Writing consolidated tileindex')
+        write_consolidated_tileindex(CONSOLIDATED_TILEINDEX, consolidated,
+                                     list(cfg['layers']), vacuum)
+
+    elapsed = time.monotonic() - start
+
+    prune_manifest(manifest, cfg['layers'])
+    save_manifest('tileindex', manifest)
+
+    click.echo('Generated {} of {} tileindexes in {:.2f}s'.format(
+        len(results) - len(failed), len(results), elapsed))
+
+    for key, wall_time, error, _ in sorted(results, key=lambda r: r[1],
+                                           reverse=True):
+        status = 'FAILED ({})'.format(error) if error else 'OK'
+        click.echo('{:8.2f}s  {}  {}'.format(wall_time, key, status))
+
+    if failed:
+        raise click.ClickException('{} tileindexes failed: {}'.format(
+            len(failed), ', '.join(sorted(failed))))
 
 
 tileindex.add_command(generate)
@@ -0,0 +1,279 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import io
+import logging
+import math
+
+import mapscript
+from PIL import Image
+
+LOGGER = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+
+# tiles rendered together in a single GetMap (METATILE x METATILE)
+METATILE = 4
+
+MAX_ZOOM = 18
+
+# supported tile matrix sets (OGC Two Dimensional Tile Matrix Set)
+TILE_MATRIX_SETS = {
+    'WebMercatorQuad': {
+        'crs': 'EPSG:3857',
+        'extent': [-20037508.3427892, -20037508.3427892,
+                   20037508.3427892, 20037508.3427892],
+        # number of tiles of the matrix at zoom level 0
+        'matrix_size': (1, 1)
+    },
+    'WorldCRS84Quad': {
+        'crs': 'EPSG:4326',
+        'extent': [-180, -90, 180, 90],
+        'matrix_size': (2, 1)
+    }
+}
+
+
+class InvalidTile(ValueError):
+    """tile outside of its tile matrix set"""
+    pass
+
+
+class TileRenderError(RuntimeError):
+    """MapServer did not render a metatile"""
+
+    def __init__(self, content=None, message=None):
+        """
+        :param content: `bytes` of MapServer response (service exception),
+                        None if MapServer raised an error instead
+        :param message: error message (default: content)
+        """
+
+        if message is None:
+            message = content.decode('utf-8', 'replace')
+
+        super().__init__(message)
+        self.content = content
+
+
+def get_matrix_size(tile_matrix_set, zoom):
+    """
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+
+    :returns: tuple of number of tile columns and rows
+    """
+
+    width, height = TILE_MATRIX_SETS[tile_matrix_set]['matrix_size']
+
+    return width * 2 ** zoom, height * 2 ** zoom
+
+
+def validate_tile(tile_matrix_set, zoom, x, y):
+    """
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param x: tile column
+    :param y: tile row
+
+    :returns: None (raises `InvalidTile` if the tile does not exist)
+    """
+
+    if tile_matrix_set not in TILE_MATRIX_SETS:
+        raise InvalidTile('Unsupported tile matrix set {}'.format(
+            tile_matrix_set))
+
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise InvalidTile('Zoom level outside 0-{}'.format(MAX_ZOOM))
+
+    columns, rows = get_matrix_size(tile_matrix_set, zoom)
+
+    if not (0 <= x < columns and 0 <= y < rows):
+        raise InvalidTile('Tile outside of tile matrix')
+
+
+def lonlat_to_crs(tile_matrix_set, lon, lat):
+    """
+    :param tile_matrix_set: tile matrix set name
+    :param lon: longitude
+    :param lat: latitude
+
+    :returns: tuple of x, y in the CRS of the tile matrix set
+    """
+
+    if TILE_MATRIX_SETS[tile_matrix_set]['crs'] == 'EPSG:4326':
+        return lon, lat
+
+    # spherical mercator, clamped to the latitudes of the matrix
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    radius = 6378137.0
+
+    return (math.radians(lon) * radius,
+            math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * radius)
+
+
+def get_tile_range(tile_matrix_set, zoom, bbox):
+    """
+    tiles of a zoom level intersecting a bounding box
+
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param bbox: `list` of minlon, minlat, maxlon, maxlat
+
+    :returns: tuple of first column, first row, last column and last row
+    """
+
+    minx, miny, maxx, maxy = TILE_MATRIX_SETS[tile_matrix_set]['extent']
+    matrix_width, matrix_height = get_matrix_size(tile_matrix_set, zoom)
+
+    span_x = (maxx - minx) / matrix_width
+    span_y = (maxy - miny) / matrix_height
+
+    left, bottom = lonlat_to_crs(tile_matrix_set, bbox[0], bbox[1])
+    right, top = lonlat_to_crs(tile_matrix_set, bbox[2], bbox[3])
+
+    def clamp(value, size):
+        return max(0, min(int(value), size - 1))
+
+    return (clamp((left - minx) / span_x, matrix_width),
+            clamp((maxy - top) / span_y, matrix_height),
+            clamp((right - minx) / span_x, matrix_width),
+            clamp((maxy - bottom) / span_y, matrix_height))
+
+
+def get_bbox(tile_matrix_set, zoom, x, y, columns=1, rows=1):
+    """
+    bounding box of a block of tiles
+
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param x: column of top left tile
+    :param y: row of top left tile
+    :param columns: number of tile columns
+    :param rows: number of tile rows
+
+    :returns: `list` of minx, miny, maxx, maxy
+    """
+
+    minx, miny, maxx, maxy = TILE_MATRIX_SETS[tile_matrix_set]['extent']
+    matrix_width, matrix_height = get_matrix_size(tile_matrix_set, zoom)
+
+    span_x = (maxx - minx) / matrix_width
+    span_y = (maxy - miny) / matrix_height
+
+    return [minx + x * span_x, maxy - (y + rows) * span_y,
+            minx + (x + columns) * span_x, maxy - y * span_y]
+
+
+def get_metatile(tile_matrix_set, zoom, x, y):
+    """
+    metatile containing a tile
+
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param x: tile column
+    :param y: tile row
+
+    :returns: tuple of column and row of top left tile, number of columns
+              and number of rows of the metatile
+    """
+
+    matrix_width, matrix_height = get_matrix_size(tile_matrix_set, zoom)
+
+    x0 = x - x % METATILE
+    y0 = y - y % METATILE
+
+    return (x0, y0, min(METATILE, matrix_width - x0),
+            min(METATILE, matrix_height - y0))
+
+
+def render_metatile(mapfile, layer, tile_matrix_set, zoom, x, y,
+                    time=None, style=None):
+    """
+    render the metatile containing a tile in a single GetMap and slice
+    it into tiles
+
+    :param mapfile: `mapscript.mapObj` of layer
+    :param layer: layer name
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param x: tile column
+    :param y: tile row
+    :param time: TIME value (None for the layer default)
+    :param style: style name (None for the layer default)
+
+    :returns: `dict` of (column, row) to PNG `bytes` of every tile
+              of the metatile. Raises `TileRenderError` if MapServer
+              fails or does not return an image
+    """
+
+    x0, y0, columns, rows = get_metatile(tile_matrix_set, zoom, x, y)
+    bbox = get_bbox(tile_matrix_set, zoom, x0, y0, columns, rows)
+
+    # WMS 1.1.1 keeps x/y axis order for EPSG:4326
+    params = {
+        'SERVICE': 'WMS',
+        'VERSION': '1.1.1',
+        'REQUEST': 'GetMap',
+        'LAYERS': layer,
+        'STYLES': style or '',
+        'SRS': TILE_MATRIX_SETS[tile_matrix_set]['crs'],
+        'BBOX': ','.join(repr(float(v)) for v in bbox),
+        'WIDTH': str(columns * TILE_SIZE),
+        'HEIGHT': str(rows * TILE_SIZE),
+        'FORMAT': 'image/png',
+        'TRANSPARENT': 'TRUE'
+    }
+    if time is not None:
+        params['TIME'] = time
+
+    request = mapscript.OWSRequest()
+    for key, value in params.items():
+        request.setParameter(key, value)
+
+    LOGGER.debug('Rendering metatile {}/{}/{} ({}x{})'.format(
+        zoom, x0, y0, columns, rows))
+
+    mapscript.msIO_installStdoutToBuffer()
+    try:
+        mapfile.OWSDispatch(request)
+        headers = mapscript.msIO_getAndStripStdoutBufferMimeHeaders()
+        content = mapscript.msIO_getStdoutBufferBytes()
+    except mapscript.MapServerError as err:
+        raise TileRenderError(message=str(err))
+    finally:
+        mapscript.msIO_resetHandlers()
+
+    if not headers.get('Content-Type', '').startswith('image/'):
+        raise TileRenderError(content)
+
+    image = Image.open(io.BytesIO(content))
+    tiles = {}
+
+    for column in range(columns):
+        for row in range(rows):
+            left = column * TILE_SIZE
+            top = row * TILE_SIZE
+            tile = image.crop((left, top, left + TILE_SIZE, top + TILE_SIZE))
+
+            output = io.BytesIO()
+            tile.save(output, 'PNG')
+            tiles[(x0 + column, y0 + row)] = output.getvalue()
+
+    return tiles
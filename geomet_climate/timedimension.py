@@ -0,0 +1,198 @@
+###############################################################################
+#
+# Copyright (C) 2026 Government of Canada
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+from functools import lru_cache
+import logging
+import re
+
+from dateutil.parser import isoparse
+
+LOGGER = logging.getLogger(__name__)
+
+TIMESTEP_PATTERN = re.compile(r'^P(\d+)([YM])$')
+
+
+class InvalidTimeFormat(ValueError):
+    """time value does not follow the format of the time dimension"""
+    pass
+
+
+def _to_months(value):
+    """
+    convert a YYYY or YYYY-MM value to a month count
+
+    :param value: time value (str or int)
+
+    :returns: `int` of months since year 0
+    """
+
+    tokens = str(value).split('-')
+    year = int(tokens[0])
+    month = int(tokens[1]) if len(tokens) > 1 else 1
+
+    return (year * 12) + month - 1
+
+
+class TimeDimension:
+    """
+    Time dimension of a layer (P1Y or P1M), resolving time values to
+    band indexes with month arithmetic instead of enumerating every
+    time step
+    """
+
+    def __init__(self, begin, end, timestep):
+        """
+        initializer
+
+        :param begin: first time step (YYYY or YYYY-MM)
+        :param end: last time step (YYYY or YYYY-MM)
+        :param timestep: ISO 8601 duration (i.e. P1Y, P1M)
+        """
+
+        match = TIMESTEP_PATTERN.match(timestep)
+        if match is None:
+            raise ValueError('Unsupported timestep: {}'.format(timestep))
+
+        step, unit = match.groups()
+
+        self.timestep = timestep
+        self.yearly = unit == 'Y'
+        self.step = int(step) * 12 if self.yearly else int(step)
+        self.format = '%Y' if self.yearly else '%Y-%m'
+        self.begin = _to_months(begin)
+        self.end = _to_months(end)
+
+    @classmethod
+    def from_extent(cls, extent):
+        """
+        create a time dimension from a begin/end/timestep extent
+
+        :param extent: time extent (i.e. ows_timeextent metadata)
+
+        :returns: `TimeDimension` object
+        """
+
+        begin, end, timestep = extent.split('/')
+
+        return cls(begin, end, timestep)
+
+    @classmethod
+    def from_layer_info(cls, layer_info):
+        """
+        create a time dimension from layer configuration
+
+        :param layer_info: layer information
+
+        :returns: `TimeDimension` object
+        """
+
+        temporal_extent = layer_info['climate_model']['temporal_extent']
+
+        return cls(temporal_extent['begin'], temporal_extent['end'],
+                   layer_info['timestep'])
+
+    def __len__(self):
+        return (self.end - self.begin) // self.step + 1
+
+    def __iter__(self):
+        return (self.value(i) for i in range(len(self)))
+
+    def __contains__(self, value):
+        try:
+            return self.index(value) is not None
+        except ValueError:
+            return False
+
+    def _year_month(self, index):
+        """
+        :param index: zero-based index of time step
+
+        :returns: `tuple` of year and month of time step
+        """
+
+        year, month = divmod(self.begin + (index * self.step), 12)
+
+        return year, month + 1
+
+    def value(self, index):
+        """
+        time value of a time step
+
+        :param index: zero-based index of time step
+
+        :returns: `str` of time value (YYYY or YYYY-MM)
+        """
+
+        year, month = self._year_month(index)
+
+        if self.yearly:
+            return '{}'.format(year)
+
+        return '{}-{}'.format(year, str(month).zfill(2))
+
+    def timestamp(self, index):
+        """
+        tileindex timestamp of a time step
+
+        :param index: zero-based index of time step
+
+        :returns: `str` of timestamp
+        """
+
+        year, month = self._year_month(index)
+
+        return '{}-{}-00T00:00:00'.format(year, str(month).zfill(2))
+
+    def index(self, value):
+        """
+        resolve a time value to its time step
+
+        :param value: time value (YYYY or YYYY-MM)
+
+        :returns: zero-based index of time step, or `None` if the value
+                  is not a valid time step of the dimension
+        """
+
+        time_iso = isoparse(value)
+
+        if value != time_iso.strftime(self.format):
+            raise InvalidTimeFormat('Invalid time format: {}'.format(value))
+
+        months = (time_iso.year * 12) + time_iso.month - 1
+        offset = months - self.begin
+
+        if offset < 0 or months > self.end or offset % self.step != 0:
+            return None
+
+        return offset // self.step
+
+
+@lru_cache(maxsize=None)
+def get_time_dimension(extent):
+    """
+    get a (cached) time dimension for a time extent
+
+    :param extent: time extent (i.e. ows_timeextent metadata)
+
+    :returns: `TimeDimension` object
+    """
+
+    LOGGER.debug('Compiling time dimension {}'.format(extent))
+
+    return TimeDimension.from_extent(extent)
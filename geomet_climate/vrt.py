@@ -26,6 +26,8 @@ import yaml
 from yaml import CLoader
 
 from geomet_climate.env import BASEDIR, CONFIG, DATADIR
+from geomet_climate.manifest import (
+    get_fingerprint, load_manifest, prune_manifest, save_manifest)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -89,6 +91,24 @@ def create_vrt(layer_info, vrt_list, output_dir, vrt_name):
         fh.write(vrt)
 
 
+def get_vrt_path(layer_info, output_dir):
+    """
+    :param layer_info: layer information
+    :param output_dir: VRT output directory
+
+    :returns: path to the VRT of a layer, or None if the layer has none
+    """
+
+    if (layer_info['climate_model']['is_vrt'] or
+            layer_info['type'] != 'RASTER' or
+            not layer_info['filename'].startswith('CANGRD')):
+        return None
+
+    return os.path.join(output_dir, layer_info['climate_model']['basepath'],
+                        layer_info['filepath'],
+                        '{}.vrt'.format(layer_info['filename']))
+
+
 def generate_vrt_list(layer_info, output_dir):
     """
     This script creates a VRT file per file band.
@@ -99,10 +119,9 @@ def generate_vrt_list(layer_info, output_dir):
     """
 
     basepath = layer_info['climate_model']['basepath']
+    vrt_path = get_vrt_path(layer_info, output_dir)
 
-    if (not layer_info['climate_model']['is_vrt'] and
-            layer_info['type'] == 'RASTER' and
-            layer_info['filename'].startswith('CANGRD')):
+    if vrt_path is not None:
 
         dirname = os.path.join(DATADIR,
                                basepath,
@@ -114,7 +133,7 @@ def generate_vrt_list(layer_info, output_dir):
             if k.startswith(layer_info['filename']):
                 vrt_list.append(k)
 
-        vrt_name = '{}.vrt'.format(layer_info['filename'])
+        vrt_name = os.path.basename(vrt_path)
         create_vrt(layer_info, vrt_list, output_dir, vrt_name)
 
 
@@ -126,7 +145,9 @@ def vrt():
 @click.command()
 @click.pass_context
 @click.option('--layer', '-lyr', help='layer')
-def generate(ctx, layer):
+@click.option('--incremental', is_flag=True,
+              help='only regenerate layers whose inputs changed')
+def generate(ctx, layer, incremental):
     """generate VRT"""
 
     output_dir = '{}{}vrt'.format(BASEDIR, os.sep)
@@ -137,11 +158,29 @@ def generate(ctx, layer):
     with io.open(CONFIG) as fh:
         cfg = yaml.load(fh, Loader=CLoader)
 
-        if layer is not None:
-            generate_vrt_list(cfg['layers'][layer], output_dir)
-        else:
-            for key, value in cfg['layers'].items():
-                generate_vrt_list(value, output_dir)
+    if layer is not None:
+        layers = {
+            layer: cfg['layers'][layer]
+        }
+    else:
+        layers = cfg['layers']
+
+    manifest = load_manifest('vrt')
+
+    for key, value in layers.items():
+        fingerprint = get_fingerprint(value, DATADIR)
+        vrt_path = get_vrt_path(value, output_dir)
+        if all([incremental,
+                manifest.get(key) == fingerprint,
+                vrt_path is None or os.path.exists(vrt_path)]):
+            LOGGER.debug('Skipping unchanged layer {}'.format(key))
+            continue
+
+        generate_vrt_list(value, output_dir)
+        manifest[key] = fingerprint
+
+    prune_manifest(manifest, cfg['layers'])
+    save_manifest('vrt', manifest)
 
 
 vrt.add_command(generate)
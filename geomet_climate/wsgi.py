@@ -17,35 +17,103 @@
 #
 ###############################################################################
 
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
 import io
+import json
 import logging
 import os
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qsl
+from xml.sax.saxutils import escape
 
 import click
-from dateutil.parser import isoparse
-from dateutil.relativedelta import relativedelta
 import mapscript
 
-from geomet_climate.env import BASEDIR
+from geomet_climate.capabilities import (
+    PRECOMPRESSED, get_capabilities_path, get_variant_path)
+from geomet_climate.cache import LRUCache, ResponseCache
+from geomet_climate.env import (
+    BASEDIR, CAPABILITIES_CACHE_SIZE, MAPFILE_CACHE_SIZE, METRICS,
+    METRICS_DIR, RESPONSE_CACHE_DIR, RESPONSE_CACHE_DISK_SIZE,
+    RESPONSE_CACHE_SIZE, SERVER_TIMING, TILE_CACHE_SIZE)
+from geomet_climate.metrics import (
+    CONTENT_TYPE, RequestTimer, count_cache_lookup, get_layer_group,
+    render_metrics, reset_metrics, set_metrics_dir)
+from geomet_climate.profiling import is_profiling_requested, profile_request
+from geomet_climate.tiles import (
+    InvalidTile, TileRenderError, render_metatile, validate_tile)
+from geomet_climate.timedimension import InvalidTimeFormat, get_time_dimension
 
 LOGGER = logging.getLogger(__name__)
 
-# List of all environment variable used by MapServer
-MAPSERV_ENV = [
-  'CONTENT_LENGTH', 'CONTENT_TYPE', 'CURL_CA_BUNDLE', 'HTTP_COOKIE',
-  'HTTP_HOST', 'HTTPS', 'HTTP_X_FORWARDED_HOST', 'HTTP_X_FORWARDED_PORT',
-  'HTTP_X_FORWARDED_PROTO', 'MS_DEBUGLEVEL', 'MS_ENCRYPTION_KEY',
-  'MS_ERRORFILE', 'MS_MAPFILE', 'MS_MAPFILE_PATTERN', 'MS_MAP_NO_PATH',
-  'MS_MAP_PATTERN', 'MS_MODE', 'MS_OPENLAYERS_JS_URL', 'MS_TEMPPATH',
-  'MS_XMLMAPFILE_XSLT', 'PROJ_LIB', 'QUERY_STRING', 'REMOTE_ADDR',
-  'REQUEST_METHOD', 'SCRIPT_NAME', 'SERVER_NAME', 'SERVER_PORT'
-]
-
 WCS_FORMATS = {
     'image/tiff': 'tif',
     'image/netcdf': 'nc'
 }
 
+# per-process cache of parsed mapfiles: {filepath: (mtime, mapObj)}
+MAPFILE_CACHE = LRUCache(MAPFILE_CACHE_SIZE)
+
+# per-process cache of mapfiles merged from the per-layer mapfiles of
+# multi-layer requests: {layer mapfiles: (mtimes, mapObj)}
+MERGED_MAPFILE_CACHE = LRUCache(MAPFILE_CACHE_SIZE)
+
+# per mapfile locks, so that concurrent requests parse (or merge) a
+# mapfile once while requests for other mapfiles go on: {key of
+# MAPFILE_CACHE or MERGED_MAPFILE_CACHE: lock}. Cached mapfiles are
+# shared by all the threads of a worker and never modified (requests
+# get their own clone)
+MAPFILE_LOCKS = LRUCache(MAPFILE_CACHE_SIZE * 2)
+
+# guards MAPFILE_LOCKS
+MAPFILE_LOCK = threading.Lock()
+
+# per-process cache of whole service GetCapabilities documents:
+# {filepath: capabilities document (see load_capabilities)}
+CAPABILITIES_CACHE = {}
+
+# per-process cache of per-layer GetCapabilities responses:
+# {(service, version, layer, lang, other parameters):
+#  (mapfile mtime, headers, content)}
+LAYER_CAPABILITIES_CACHE = LRUCache(CAPABILITIES_CACHE_SIZE)
+
+# GetCapabilities parameters part of the key of LAYER_CAPABILITIES_CACHE
+CAPABILITIES_KEY_PARAMS = ['SERVICE', 'VERSION', 'REQUEST', 'LAYER',
+                           'LAYERS', 'COVERAGEID', 'LANG']
+
+# optional cache of GetMap responses (see get_response_key)
+RESPONSE_CACHE = None
+if RESPONSE_CACHE_SIZE > 0 or RESPONSE_CACHE_DIR is not None:
+    RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_DIR,
+                                   RESPONSE_CACHE_DISK_SIZE)
+
+# tiles are cached in the response cache, or else in memory if enabled
+# (a metatile renders METATILE x METATILE tiles at once)
+TILE_CACHE = None
+if RESPONSE_CACHE is not None:
+    TILE_CACHE = RESPONSE_CACHE
+elif TILE_CACHE_SIZE > 0:
+    TILE_CACHE = ResponseCache(TILE_CACHE_SIZE)
+
+# /{layer}/{time}/{z}/{x}/{y}.png tile route
+TILE_ROUTE = re.compile(r'^/(?P<layer>[^/]+)/(?P<time>[^/]+)/(?P<zoom>\d+)/'
+                        r'(?P<x>\d+)/(?P<y>\d+)\.png$')
+
+# request parameters whose values are case insensitive
+CASE_INSENSITIVE_PARAMS = ['SERVICE', 'REQUEST', 'VERSION', 'FORMAT', 'CRS',
+                           'SRS', 'TRANSPARENT', 'EXCEPTIONS']
+
+UPDATE_SEQUENCE = re.compile(rb'updateSequence="([^"]+)"')
+
+METADATA_ITEM = re.compile(r'^"([^"]*)"\s+"(.*)"$')
+
 SERVICE_EXCEPTION = '''<?xml version='1.0' encoding="UTF-8" standalone="no"?>
 <ServiceExceptionReport version="1.3.0" xmlns="http://www.opengis.net/ogc"
     xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
@@ -84,6 +152,628 @@ def metadata_lang(m, lg):
     m.metadata['wcs_description'] = m.metadata[f'wcs_description_{lg}']
 
 
+def get_mapfile_lock(key):
+    """
+    :param key: key of MAPFILE_CACHE or MERGED_MAPFILE_CACHE
+
+    :returns: `threading.Lock` serializing the parsing (or merging)
+              of the mapfile of key
+    """
+
+    with MAPFILE_LOCK:
+        lock = MAPFILE_LOCKS.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            MAPFILE_LOCKS.set(key, lock)
+
+    return lock
+
+
+def get_parsed_mapfile(filepath):
+    """
+    Get a mapfile from the per-process cache, parsing it only when
+    it is not cached yet or when it has changed on disk
+
+    :param filepath: path to mapfile
+
+    :returns: `mapscript.mapObj` shared by all requests (not to be modified)
+    """
+
+    mtime = os.path.getmtime(filepath)
+    cached = MAPFILE_CACHE.get(filepath)
+    hit = cached is not None and cached[0] == mtime
+    count_cache_lookup('mapfile', hit)
+
+    if not hit:
+        with get_mapfile_lock(filepath):
+            # parsed by another thread while waiting for the lock
+            cached = MAPFILE_CACHE.get(filepath)
+            if cached is None or cached[0] != mtime:
+                LOGGER.debug('Loading mapfile: {}'.format(filepath))
+                cached = (mtime, mapscript.mapObj(filepath))
+                MAPFILE_CACHE.set(filepath, cached)
+
+    return cached[1]
+
+
+def load_mapfile(filepath):
+    """
+    Load a mapfile from the per-process cache, parsing it only when
+    it is not cached yet or when it has changed on disk
+
+    :param filepath: path to mapfile
+
+    :returns: `mapscript.mapObj` clone, safe to modify for the request
+    """
+
+    return get_parsed_mapfile(filepath).clone()
+
+
+def get_layer_mapfile(service, layer):
+    """
+    :param service: service (WMS or WCS)
+    :param layer: layer name
+
+    :returns: path to per-layer mapfile of layer, or None if the layer
+              has none (service mapfiles and names holding a path are
+              not layers)
+    """
+
+    if layer in ['en', 'fr'] or '/' in layer or os.sep in layer:
+        return None
+
+    filepath = '{}/mapfile/geomet-climate-{}-{}.map'.format(
+        BASEDIR, service, layer)
+
+    if not os.path.exists(filepath):
+        return None
+
+    return filepath
+
+
+def get_layer_mapfiles(service, layers):
+    """
+    :param service: service (WMS or WCS)
+    :param layers: `list` of layer names
+
+    :returns: `list` of paths to the per-layer mapfiles of the layers
+              (sorted by layer name), or None if a layer has none
+    """
+
+    filepaths = []
+
+    for layer in sorted(set(layers)):
+        filepath = get_layer_mapfile(service, layer)
+        if filepath is None:
+            return None
+        filepaths.append(filepath)
+
+    return filepaths
+
+
+def merge_mapfiles(filepaths, layers):
+    """
+    Merge per-layer mapfiles into a single mapfile
+
+    :param filepaths: `list` of paths to per-layer mapfiles
+    :param layers: `list` of the layer names of the mapfiles
+
+    :returns: `mapscript.mapObj` of merged mapfile, or None if a per-layer
+              mapfile does not serve its layer
+    """
+
+    mapfiles = [get_parsed_mapfile(filepath) for filepath in filepaths]
+
+    # only merge per-layer mapfiles actually serving their layer
+    if any(mapfile.getLayerByName(layer) is None
+           for mapfile, layer in zip(mapfiles, layers)):
+        return None
+
+    LOGGER.debug('Merging mapfiles of layers {}'.format(','.join(layers)))
+
+    # station layer mapfiles only have vector output formats
+    # (getOutputFormatByName would create missing formats in the shared
+    # mapfile, so look them up without it)
+    base = next((m for m in mapfiles if 'PNG' in [
+        m.getOutputFormat(i).name.upper()
+        for i in range(m.numoutputformats)]), mapfiles[0])
+
+    merged = base.clone()
+    for mapfile in mapfiles:
+        if mapfile is base:
+            continue
+        # insertLayer takes a reference to the layer and rebinds its
+        # index and map, so insert copies: the layers of the shared
+        # mapfiles are cloned by single layer requests
+        for i in range(mapfile.numlayers):
+            merged.insertLayer(mapfile.getLayer(i).clone())
+
+    return merged
+
+
+def load_merged_mapfile(service, layers):
+    """
+    Load a mapfile holding only the layers of a multi-layer request,
+    merged from their per-layer mapfiles (including their tileindex
+    layers) and cached by layer set
+
+    :param service: service (WMS or WCS)
+    :param layers: `list` of layer names
+
+    :returns: `mapscript.mapObj` clone, safe to modify for the request,
+              or None if a layer has no per-layer mapfile
+    """
+
+    filepaths = get_layer_mapfiles(service, layers)
+
+    if filepaths is None:
+        return None
+
+    key = tuple(filepaths)
+    mtimes = tuple(os.path.getmtime(filepath) for filepath in filepaths)
+
+    cached = MERGED_MAPFILE_CACHE.get(key)
+    hit = cached is not None and cached[0] == mtimes
+    count_cache_lookup('merged_mapfile', hit)
+
+    if not hit:
+        with get_mapfile_lock(key):
+            # merged by another thread while waiting for the lock
+            cached = MERGED_MAPFILE_CACHE.get(key)
+            if cached is None or cached[0] != mtimes:
+                merged = merge_mapfiles(filepaths, sorted(set(layers)))
+                if merged is None:
+                    return None
+                cached = (mtimes, merged)
+                MERGED_MAPFILE_CACHE.set(key, cached)
+
+    return cached[1].clone()
+
+
+def read_web_metadata(filepath):
+    """
+    Read the MAP.WEB.METADATA of a generated mapfile without parsing
+    the whole (potentially very large) mapfile
+
+    :param filepath: path to mapfile
+
+    :returns: `dict` of web metadata
+    """
+
+    metadata = {}
+    in_web = False
+    in_metadata = False
+
+    with io.open(filepath, encoding='utf-8') as fh:
+        for line in fh:
+            token = line.strip()
+            if in_metadata:
+                if token == 'END':
+                    break
+                match = METADATA_ITEM.match(token)
+                if match is not None:
+                    metadata[match.group(1)] = match.group(2)
+            elif token == 'WEB':
+                in_web = True
+            elif in_web and token == 'METADATA':
+                in_metadata = True
+            elif token == 'LAYER':
+                break
+
+    return metadata
+
+
+def get_variant_mtimes(filepath):
+    """
+    :param filepath: path to file
+
+    :returns: `dict` of modification time of the file (`None` key) and of
+              its up to date precompressed variants (content encoding key)
+    """
+
+    mtimes = {None: os.path.getmtime(filepath)}
+
+    for encoding in PRECOMPRESSED:
+        try:
+            mtime = os.path.getmtime(get_variant_path(filepath, encoding))
+        except OSError:
+            continue
+        # ignore variants left over from a previous build
+        if mtime >= mtimes[None]:
+            mtimes[encoding] = mtime
+
+    return mtimes
+
+
+def negotiate_encoding(env, encodings):
+    """
+    Pick the content encoding of a response from the Accept-Encoding
+    header of the request
+
+    :param env: WSGI environment
+    :param encodings: available content encodings, in order of preference
+
+    :returns: content encoding (`None` for identity)
+    """
+
+    accepted = {}
+
+    for item in env.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+
+    return None
+
+
+def get_encoding_headers(encoding):
+    """
+    :param encoding: content encoding of response (`None` for identity)
+
+    :returns: `list` of HTTP headers
+    """
+
+    headers = [('Vary', 'Accept-Encoding')]
+
+    if encoding is not None:
+        headers.append(('Content-Encoding', encoding))
+
+    return headers
+
+
+def load_capabilities(filepath, mapfile):
+    """
+    Load a cached GetCapabilities document (and its precompressed
+    variants) from the per-process cache, reading it only when it is not
+    cached yet or when it has changed on disk
+
+    :param filepath: path to GetCapabilities document
+    :param mapfile: path to mapfile the document was generated from
+
+    :returns: `dict` of document content (keyed by content encoding),
+              ETag, Last-Modified (seconds since epoch) and HTTP max age
+              (`None` if not set)
+    """
+
+    mtimes = get_variant_mtimes(filepath)
+    cached = CAPABILITIES_CACHE.get(filepath)
+
+    if cached is not None and cached['mtimes'] == mtimes:
+        return cached
+
+    LOGGER.debug('Loading capabilities: {}'.format(filepath))
+    content = {}
+    for encoding in mtimes:
+        variant_path = filepath
+        if encoding is not None:
+            variant_path = get_variant_path(filepath, encoding)
+        with io.open(variant_path, 'rb') as fh:
+            content[encoding] = fh.read()
+
+    last_modified = mtimes[None]
+    update_sequence = UPDATE_SEQUENCE.search(content[None])
+
+    if update_sequence is not None:
+        update_sequence = update_sequence.group(1).decode('utf-8')
+        try:
+            last_modified = datetime.strptime(
+                update_sequence, '%Y-%m-%dT%H:%M:%SZ').replace(
+                    tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+    else:
+        update_sequence = str(mtimes[None])
+
+    etag = hashlib.sha1('{}:{}'.format(
+        os.path.basename(filepath), update_sequence).encode('utf-8'))
+
+    max_age = read_web_metadata(mapfile).get('ows_http_max_age')
+
+    cached = {
+        'mtimes': mtimes,
+        'content': content,
+        'etag': etag.hexdigest(),
+        'last_modified': int(last_modified),
+        'max_age': max_age
+    }
+    CAPABILITIES_CACHE[filepath] = cached
+
+    return cached
+
+
+def get_etag(document, encoding=None):
+    """
+    :param document: `dict` of cached document (see load_capabilities)
+    :param encoding: content encoding of response (`None` for identity)
+
+    :returns: ETag of the representation of the document
+    """
+
+    if encoding is None:
+        return '"{}"'.format(document['etag'])
+
+    return '"{}-{}"'.format(document['etag'], encoding)
+
+
+def get_validator_headers(document, encoding=None):
+    """
+    HTTP caching headers of a cached document
+
+    :param document: `dict` of cached document (see load_capabilities)
+    :param encoding: content encoding of response (`None` for identity)
+
+    :returns: `list` of HTTP headers
+    """
+
+    headers = [
+        ('ETag', get_etag(document, encoding)),
+        ('Last-Modified', formatdate(document['last_modified'], usegmt=True))
+    ]
+
+    if document['max_age'] is not None:
+        headers.append(('Cache-Control', 'max-age={}'.format(
+            document['max_age'])))
+
+    return headers
+
+
+def is_not_modified(env, document, encoding=None):
+    """
+    Evaluate the conditional request headers (If-None-Match,
+    If-Modified-Since) of a request against a cached document
+
+    :param env: WSGI environment
+    :param document: `dict` of cached document (see load_capabilities)
+    :param encoding: content encoding of response (`None` for identity)
+
+    :returns: `bool` of whether the client copy is still valid
+    """
+
+    if_none_match = env.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etag = get_etag(document, encoding)
+        etags = [etag_.strip() for etag_ in if_none_match.split(',')]
+        return any(['*' in etags,
+                    etag in etags,
+                    'W/{}'.format(etag) in etags])
+
+    if_modified_since = env.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return document['last_modified'] <= since.timestamp()
+
+    return False
+
+
+def get_layer_capabilities_key(query_string, service, layer, lang):
+    """
+    Key of a per-layer GetCapabilities request in LAYER_CAPABILITIES_CACHE
+
+    :param query_string: key-value parameters of the request
+    :param service: service (WMS or WCS)
+    :param layer: layer name
+    :param lang: language of the request
+
+    :returns: `tuple` of service, version, layer, language and any other
+              request parameters (normalized)
+    """
+
+    params = parse_qsl(query_string, keep_blank_values=True)
+    params = {key.upper(): value for key, value in params}
+
+    extra = tuple(sorted((key, value) for key, value in params.items()
+                         if key not in CAPABILITIES_KEY_PARAMS))
+
+    return service, params.get('VERSION'), layer, lang, extra
+
+
+def get_response_key(query_string, mapfiles):
+    """
+    Key of a request in RESPONSE_CACHE: its sorted, case normalized
+    parameters and the build of the mapfiles serving it
+
+    :param query_string: key-value parameters of the request
+    :param mapfiles: `list` of paths to mapfiles
+
+    :returns: `str` of key (hexadecimal digest)
+    """
+
+    params = []
+
+    for key, value in parse_qsl(query_string, keep_blank_values=True):
+        key = key.upper()
+        if key in CASE_INSENSITIVE_PARAMS:
+            value = value.upper()
+        params.append((key, value))
+
+    build_id = [os.stat(mapfile).st_mtime_ns for mapfile in mapfiles]
+
+    return hashlib.sha256(json.dumps([mapfiles, build_id, sorted(params)])
+                          .encode('utf-8')).hexdigest()
+
+
+def get_tile_key(mapfile, tile_matrix_set, zoom, x, y, time, style):
+    """
+    Key of a tile in TILE_CACHE
+
+    :param mapfile: path to mapfile of layer
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param x: tile column
+    :param y: tile row
+    :param time: TIME value (None for the layer default)
+    :param style: style name (None for the layer default)
+
+    :returns: `str` of key (hexadecimal digest)
+    """
+
+    build_id = os.stat(mapfile).st_mtime_ns
+
+    return hashlib.sha256(json.dumps([
+        'tile', mapfile, build_id, tile_matrix_set, zoom, x, y, time, style
+    ]).encode('utf-8')).hexdigest()
+
+
+def get_tile(start_response, layer, tile_matrix_set, zoom, x, y,
+             time=None, style=None, timer=None):
+    """
+    Serve a tile of a WMS layer, rendering (and caching) its whole
+    metatile if it is not cached yet
+
+    :param start_response: WSGI start_response
+    :param layer: layer name
+    :param tile_matrix_set: tile matrix set name
+    :param zoom: zoom level (tile matrix)
+    :param x: tile column
+    :param y: tile row
+    :param time: TIME value (None, empty, - or default for the layer
+                 default)
+    :param style: style name (None, empty or default for the layer
+                  default)
+    :param timer: `geomet_climate.metrics.RequestTimer` of the request
+
+    :returns: WSGI response
+    """
+
+    if timer is None:
+        timer = RequestTimer()
+
+    # tiles of the layer defaults share their cache keys
+    if time in ['', '-', 'default']:
+        time = None
+    if style in ['', 'default']:
+        style = None
+
+    mapfile_ = get_layer_mapfile('WMS', layer)
+
+    if mapfile_ is None:
+        start_response('404 Not Found', [('Content-Type', 'application/xml')])
+        msg = 'Layer not found'
+        return [SERVICE_EXCEPTION.format(msg).encode('utf-8')]
+
+    timer.labels['layer_group'] = get_layer_group(layer)
+
+    try:
+        validate_tile(tile_matrix_set, zoom, x, y)
+    except InvalidTile as err:
+        start_response('400 Bad Request',
+                       [('Content-Type', 'application/xml')])
+        return [SERVICE_EXCEPTION.format(err).encode('utf-8')]
+
+    key = get_tile_key(mapfile_, tile_matrix_set, zoom, x, y, time, style)
+    cached = None
+    if TILE_CACHE is not None:
+        cached = TILE_CACHE.get(key)
+        count_cache_lookup('tile', cached is not None)
+
+    if cached is None:
+        with timer.phase('mapfile'):
+            mapfile = load_mapfile(mapfile_)
+
+        layerobj = mapfile.getLayerByName(layer)
+        if time is not None and layerobj is not None and \
+                'ows_timeextent' in layerobj.metadata.keys():
+            with timer.phase('time'):
+                response = validate_time(
+                    layerobj.metadata['ows_timeextent'], time)
+
+            if response is not None:
+                start_response('400 Bad Request',
+                               [('Content-Type', 'text/xml')])
+                return [response]
+
+        try:
+            with timer.phase('render'):
+                tiles = render_metatile(mapfile, layer, tile_matrix_set,
+                                        zoom, x, y, time, style)
+        except TileRenderError as err:
+            LOGGER.error(err)
+            start_response('400 Bad Request',
+                           [('Content-Type', 'application/xml')])
+            if err.content is None:
+                return [SERVICE_EXCEPTION.format(
+                    escape(str(err))).encode('utf-8')]
+            return [err.content]
+
+        if TILE_CACHE is not None:
+            for (x_, y_), content in tiles.items():
+                TILE_CACHE.set(get_tile_key(mapfile_, tile_matrix_set, zoom,
+                                            x_, y_, time, style),
+                               'image/png', content)
+
+        cached = ('image/png', tiles[(x, y)])
+
+    start_response('200 OK', [('Content-Type', cached[0])])
+    return [cached[1]]
+
+
+def load_request(env):
+    """
+    Parse the parameters of a request from its query string or POST body
+    (without going through the process environment, which is shared by
+    all the threads of a worker)
+
+    :param env: WSGI environment
+
+    :returns: `tuple` of `mapscript.OWSRequest` (None if the request has
+              no parameters) and `str` of key-value parameters (empty for
+              XML POST requests)
+    """
+
+    query_string = env.get('QUERY_STRING', '')
+    body = None
+
+    if env.get('REQUEST_METHOD') == 'POST':
+        try:
+            length = int(env.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > 0:
+            try:
+                body = env['wsgi.input'].read(length).decode('utf-8')
+            except UnicodeDecodeError:
+                LOGGER.debug('Ignoring POST body which is not UTF-8')
+
+    if body:
+        content_type = env.get('CONTENT_TYPE', '')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            query_string = body
+            body = None
+
+    if not query_string and not body:
+        return None, ''
+
+    request = mapscript.OWSRequest()
+    if body:
+        # the query string (if any) only complements XML requests
+        request.contenttype = env.get('CONTENT_TYPE') or 'application/xml'
+        request.loadParamsFromPost(body, query_string)
+        query_string = ''
+    else:
+        request.loadParamsFromURL(query_string)
+
+    return request, query_string
+
+
 def get_custom_service_exception(code, locator, text):
     """return custom wms:ServiceExceptionReport"""
 
@@ -97,16 +787,97 @@ def get_custom_service_exception(code, locator, text):
     </ogc:ServiceExceptionReport>'''.format(code=code, locator=locator, text=text), encoding='utf-8') # noqa
 
 
+def validate_time(time_extent, value):
+    """
+    Validate the TIME of a request against the time extent of a layer
+
+    :param time_extent: time extent of layer (ows_timeextent)
+    :param value: TIME value of request
+
+    :returns: `bytes` of exception report if invalid, else None
+    """
+
+    try:
+        time_dimension = get_time_dimension(time_extent)
+
+        if time_dimension.index(value) is None:
+            time_error = 'Temps en dehors des heures valides /' \
+                         ' Time outside valid hours'
+            return get_custom_service_exception('NoMatch', 'time',
+                                                time_error)
+
+    except InvalidTimeFormat:
+        if time_dimension.yearly:
+            time_error = 'Format de temps invalide, ' \
+                         'format attendu : YYYY / ' \
+                         'Invalid time format, ' \
+                         'expected format: YYYY'
+        else:
+            time_error = 'Format de temps invalide, ' \
+                         'format attendu' \
+                         ' YYYY-MM / Invalid time format, ' \
+                         'expected format: YYYY-MM'
+        return get_custom_service_exception('InvalidDimensionValue', 'time',
+                                            time_error)
+
+    except ValueError:
+        time_error = 'Valeur de temps invalide  /' \
+                     ' Time value is invalid'
+        return get_custom_service_exception('InvalidDimensionValue', 'time',
+                                            time_error)
+
+    return None
+
+
 def application(env, start_response):
     """WSGI application for WMS/WCS"""
-    for key in MAPSERV_ENV:
-        if key in env:
-            os.environ[key] = env[key]
-        else:
-            os.unsetenv(key)
+
+    if METRICS and env.get('PATH_INFO') == '/metrics':
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE)])
+        return [render_metrics().encode('utf-8')]
+
+    timer = RequestTimer()
+
+    def start_response_(status, headers):
+        if SERVER_TIMING:
+            headers = headers + [('Server-Timing',
+                                  timer.get_server_timing())]
+        return start_response(status, headers)
+
+    try:
+        if is_profiling_requested(env):
+            return profile_request(dispatch, env, start_response_, timer)
+        return dispatch(env, start_response_, timer)
+    finally:
+        timer.observe()
+
+
+def dispatch(env, start_response, timer):
+    """
+    Serve a WMS/WCS/WMTS request
+
+    :param env: WSGI environment
+    :param start_response: WSGI start_response
+    :param timer: `geomet_climate.metrics.RequestTimer` of the request
+
+    :returns: WSGI response
+    """
+
+    tile = TILE_ROUTE.match(env.get('PATH_INFO', ''))
+    if tile is not None:
+        timer.set_labels('WMTS', 'GetTile', None, None)
+        params = parse_qsl(env.get('QUERY_STRING', ''))
+        params = {key.upper(): value for key, value in params}
+        return get_tile(start_response, tile.group('layer'),
+                        params.get('TILEMATRIXSET', 'WebMercatorQuad'),
+                        int(tile.group('zoom')), int(tile.group('x')),
+                        int(tile.group('y')), tile.group('time'),
+                        params.get('STYLE'), timer)
 
     layer = None
     mapfile_ = None
+    caps_key = None
+    response_key = None
 
     text = '''Veuillez spécifier une requête respectant le standard WMS, WFS ou WCS. 
     Pour davantage d\'information sur les services web géospatiaux GeoMet 
@@ -117,16 +888,15 @@ def application(env, start_response):
     Geospatial Web Services, please visit 
     https://www.canada.ca/en/environment-climate-change/services/weather-general-tools-resources/weather-tools-specialized-data/geospatial-web-services.html'''  # noqa
 
-    if not os.environ['QUERY_STRING']:
+    request, query_string = load_request(env)
+
+    if request is None:
         response = get_custom_service_exception('MissingParameterValue',
                                                 'request',
                                                 text)
 
         start_response('200 OK', [('Content-type', 'text/xml')])
         return [response]
-    else:
-        request = mapscript.OWSRequest()
-        request.loadParams()
 
     lang_ = request.getValueByName('LANG')
     service_ = request.getValueByName('SERVICE')
@@ -153,43 +923,88 @@ def application(env, start_response):
     if service_ is None:
         service_ = 'WMS'
 
+    timer.set_labels(service_, request_, None, lang)
+
+    if service_ == 'WMTS':
+        if request_ != 'GetTile' or layer is None:
+            start_response('400 Bad Request',
+                           [('Content-Type', 'application/xml')])
+            msg = 'Only WMTS GetTile requests of a LAYER are supported'
+            return [SERVICE_EXCEPTION.format(msg).encode('utf-8')]
+        try:
+            zoom, row, column = [int(request.getValueByName(name))
+                                 for name in ['TILEMATRIX', 'TILEROW',
+                                              'TILECOL']]
+        except (TypeError, ValueError):
+            start_response('400 Bad Request',
+                           [('Content-Type', 'application/xml')])
+            msg = 'Invalid TILEMATRIX, TILEROW or TILECOL'
+            return [SERVICE_EXCEPTION.format(msg).encode('utf-8')]
+
+        return get_tile(start_response, layer,
+                        request.getValueByName('TILEMATRIXSET'),
+                        zoom, column, row, time_, style_, timer)
+
     if layer is not None and len(layer) == 0:
         layer = None
 
     LOGGER.debug('service: {}'.format(service_))
     LOGGER.debug('language: {}'.format(lang))
 
+    service_mapfile = '{}/mapfile/geomet-climate-{}-{}.map'.format(
+        BASEDIR, service_, lang)
+
     if layer is not None and ',' not in layer:
-        mapfile_ = '{}/mapfile/geomet-climate-{}-{}.map'.format(
-            BASEDIR, service_, layer)
-    if mapfile_ is None or not os.path.exists(mapfile_):
-        mapfile_ = '{}/mapfile/geomet-climate-{}-{}.map'.format(
-            BASEDIR, service_, lang)
+        mapfile_ = get_layer_mapfile(service_, layer)
+    if mapfile_ is None:
+        mapfile_ = service_mapfile
     if not os.path.exists(mapfile_):
         start_response('400 Bad Request',
                        [('Content-Type', 'application/xml')])
         msg = 'Unsupported service'
-        return [SERVICE_EXCEPTION.format(msg)]
+        return [SERVICE_EXCEPTION.format(msg).encode('utf-8')]
+
+    # label by layer group only known layers, not arbitrary LAYERS values
+    if mapfile_ != service_mapfile or (layer is not None and ',' in layer):
+        timer.set_labels(service_, request_, layer, lang)
 
     # if requesting GetCapabilities for entire service, return cache
     if request_ == 'GetCapabilities':
         if layer is None:
-            if service_ == 'WMS':
-                filename = 'geomet-climate-WMS-1.3.0-capabilities-{}.xml'.format( # noqa
-                    lang)
-                cached_caps = os.path.join(BASEDIR, 'mapfile', filename)
-            elif service_ == 'WCS':
-                filename = 'geomet-climate-WCS-2.0.1-capabilities-{}.xml'.format( # noqa
-                    lang)
-                cached_caps = os.path.join(BASEDIR, 'mapfile', filename)
+            cached_caps = get_capabilities_path(service_, lang)
+            count_cache_lookup('capabilities', os.path.isfile(cached_caps))
 
             if os.path.isfile(cached_caps):
-                start_response('200 OK', [('Content-Type', 'application/xml')])
-                with io.open(cached_caps, 'rb') as fh:
-                    return [fh.read()]
+                with timer.phase('capabilities'):
+                    caps = load_capabilities(cached_caps, mapfile_)
+                encoding = negotiate_encoding(
+                    env, [e for e in PRECOMPRESSED if e in caps['content']])
+                headers_ = (get_validator_headers(caps, encoding) +
+                            get_encoding_headers(encoding))
+
+                if is_not_modified(env, caps, encoding):
+                    start_response('304 Not Modified', headers_)
+                    return [b'']
+
+                start_response('200 OK', [
+                    ('Content-Type', 'application/xml')] + headers_)
+                return [caps['content'][encoding]]
         else:
-            LOGGER.debug('Loading mapfile: {}'.format(mapfile_))
-            mapfile = mapscript.mapObj(mapfile_)
+            caps_key = get_layer_capabilities_key(query_string, service_,
+                                                  layer, lang)
+            mtime = os.path.getmtime(mapfile_)
+            cached = LAYER_CAPABILITIES_CACHE.get(caps_key)
+            hit = cached is not None and cached[0] == mtime
+            count_cache_lookup('layer_capabilities', hit)
+
+            if hit:
+                LOGGER.debug('Returning cached capabilities of {}'.format(
+                    layer))
+                start_response('200 OK', cached[1])
+                return [cached[2]]
+
+            with timer.phase('mapfile'):
+                mapfile = load_mapfile(mapfile_)
             if request_ == 'GetCapabilities' and lang == 'fr':
                 metadata_lang(mapfile.web, lang)
                 layerobj = mapfile.getLayerByName(layer)
@@ -201,105 +1016,84 @@ def application(env, start_response):
                 ]
 
     elif request_ == 'GetLegendGraphic' and layer is not None:
-        mapfile = mapscript.mapObj(mapfile_)
+        with timer.phase('mapfile'):
+            mapfile = load_mapfile(mapfile_)
         if style_ in [None, '']:
             layerobj = mapfile.getLayerByName(layer)
             style_ = layerobj.classgroup
         filename = '{}-{}.png'.format(style_, lang)
         cached_legends = os.path.join(BASEDIR, 'legends', filename)
+        count_cache_lookup('legend', os.path.isfile(cached_legends))
 
         if os.path.isfile(cached_legends):
-            start_response('200 OK', [('Content-Type', 'image/png')])
-            with io.open(cached_legends, 'rb') as ff:
+            variants = get_variant_mtimes(cached_legends)
+            encoding = negotiate_encoding(
+                env, [e for e in PRECOMPRESSED if e in variants])
+            if encoding is not None:
+                cached_legends = get_variant_path(cached_legends, encoding)
+
+            start_response('200 OK', [('Content-Type', 'image/png')] +
+                           get_encoding_headers(encoding))
+            with timer.phase('legend'), io.open(cached_legends, 'rb') as ff:
                 return [ff.read()]
 
     else:
-        LOGGER.debug('Loading mapfile: {}'.format(mapfile_))
-        mapfile = mapscript.mapObj(mapfile_)
+        if RESPONSE_CACHE is not None and str(request_).lower() == 'getmap':
+            # multi-layer requests are served from their per-layer
+            # mapfiles, which can be rebuilt on their own
+            mapfiles = [mapfile_]
+            if layer is not None and ',' in layer:
+                mapfiles += get_layer_mapfiles(service_,
+                                               layer.split(',')) or []
+            response_key = get_response_key(query_string, mapfiles)
+            cached = RESPONSE_CACHE.get(response_key)
+            count_cache_lookup('response', cached is not None)
+
+            if cached is not None:
+                LOGGER.debug('Returning cached response')
+                start_response('200 OK', [('Content-Type', cached[0])])
+                return [cached[1]]
+
+        with timer.phase('mapfile'):
+            mapfile = None
+            if layer is not None and ',' in layer:
+                mapfile = load_merged_mapfile(service_, layer.split(','))
+            if mapfile is None:
+                mapfile = load_mapfile(mapfile_)
         layerobj = mapfile.getLayerByName(layer)
         if request_ == 'GetCapabilities' and lang == 'fr':
             metadata_lang(mapfile, lang)
             layerobj.metadata['ows_title'] = layerobj.metadata[f'ows_title_{lang}'] # noqa
             layerobj.metadata['ows_layer_group'] = layerobj.metadata[f'ows_layer_group_{lang}'] # noqa
 
-        if time_ and 'ows_timeextent' in layerobj.metadata.keys():
-            try:
-                dates = []
-                timeextent = layerobj.metadata['ows_timeextent']
-
-                start_date, end_date, duration = timeextent.split('/')
-                start_date = isoparse(start_date)
-                end_date = isoparse(end_date)
-                time_iso = isoparse(time_)
-
-                end_year_month = (end_date.year - start_date.year) * 12
-                end_month = end_date.month - start_date.month
-                end_date = end_year_month + end_month
-
-                if duration == 'P1Y':
-                    if time_ != time_iso.strftime('%Y'):
-                        time_error = 'Format de temps invalide, ' \
-                                     'format attendu : YYYY / ' \
-                                     'Invalid time format, ' \
-                                     'expected format: YYYY'
-                        response = get_custom_service_exception('InvalidDimensionValue', # noqa
-                                                                'time',
-                                                                time_error)
-                        start_response('200 OK', [('Content-type',
-                                                   'text/xml')])
-                        return [response]
-
-                    for i in range(0, end_date + 1, 12):
-                        date_ = start_date + relativedelta(months=i)
-                        dates.append(date_.strftime('%Y'))
-
-                else:
-                    if time_ != time_iso.strftime('%Y-%m'):
-                        time_error = 'Format de temps invalide, ' \
-                                     'format attendu' \
-                                     ' YYYY-MM / Invalid time format, ' \
-                                     'expected format: YYYY-MM'
-                        response = get_custom_service_exception('InvalidDimensionValue', # noqa
-                                                                'time',
-                                                                time_error)
-                        start_response('200 OK', [('Content-type',
-                                                   'text/xml')])
-                        return [response]
-
-                    for i in range(0, end_date + 1, 1):
-                        date_ = start_date + relativedelta(months=i)
-                        dates.append(date_.strftime('%Y-%m'))
-
-                if time_ not in dates:
-                    time_error = 'Temps en dehors des heures valides /' \
-                                 ' Time outside valid hours'
-                    response = get_custom_service_exception('NoMatch',
-                                                            'time',
-                                                            time_error)
-                    start_response('200 OK', [('Content-type', 'text/xml')])
-                    return [response]
-
-            except ValueError:
-                time_error = 'Valeur de temps invalide  /' \
-                             ' Time value is invalid'
-                response = get_custom_service_exception('InvalidDimensionValue', # noqa
-                                                        'time',
-                                                        time_error)
+        if time_ and layerobj is not None and \
+                'ows_timeextent' in layerobj.metadata.keys():
+            with timer.phase('time'):
+                response = validate_time(
+                    layerobj.metadata['ows_timeextent'], time_)
+
+            if response is not None:
                 start_response('200 OK', [('Content-type', 'text/xml')])
                 return [response]
 
+    # MapServer IO contexts are per thread: the buffer only collects the
+    # output of this request, and is released once read
     mapscript.msIO_installStdoutToBuffer()
-    request.loadParamsFromURL(env['QUERY_STRING'])
 
-    try:
-        LOGGER.debug('Dispatching OWS request')
-        mapfile.OWSDispatch(request)
-    except (mapscript.MapServerError, IOError) as err:
-        # let error propagate to service exception
-        LOGGER.error(err)
-        pass
+    with timer.phase('render'):
+        try:
+            LOGGER.debug('Dispatching OWS request')
+            mapfile.OWSDispatch(request)
+        except (mapscript.MapServerError, IOError) as err:
+            # let error propagate to service exception
+            LOGGER.error(err)
+            pass
 
-    headers = mapscript.msIO_getAndStripStdoutBufferMimeHeaders()
+        try:
+            headers = mapscript.msIO_getAndStripStdoutBufferMimeHeaders()
+            content = mapscript.msIO_getStdoutBufferBytes()
+        finally:
+            mapscript.msIO_resetHandlers()
 
     headers_ = [
         ('Content-Type', headers['Content-Type']),
@@ -313,18 +1107,174 @@ def application(env, start_response):
             headers_.append(('Content-Disposition',
                              'attachment; filename="{}"'.format(filename)))
 
-    content = mapscript.msIO_getStdoutBufferBytes()
+    if caps_key is not None and b'ExceptionReport' not in content[:1024]:
+        LAYER_CAPABILITIES_CACHE.set(caps_key, (mtime, headers_, content))
+
+    # only cache rendered maps, not service exceptions
+    if response_key is not None and \
+            headers['Content-Type'].startswith('image/'):
+        RESPONSE_CACHE.set(response_key, headers['Content-Type'], content)
 
     start_response('200 OK', headers_)
 
     return [content]
 
 
+def get_build_mtime():
+    """
+    :returns: modification time of the most recent mapfile of the build
+              (None if there is no build)
+    """
+
+    try:
+        entries = os.scandir(os.path.join(BASEDIR, 'mapfile'))
+    except FileNotFoundError:
+        return None
+
+    with entries:
+        return max((entry.stat().st_mtime for entry in entries
+                    if entry.name.endswith('.map')), default=None)
+
+
+def warm_caches():
+    """
+    Parse the service mapfiles and read the cached GetCapabilities
+    documents of the build into the per-process caches, so that workers
+    forked afterwards share them (copy-on-write)
+
+    :returns: None
+    """
+
+    for service in ['WMS', 'WCS']:
+        for lang in ['en', 'fr']:
+            mapfile_ = '{}/mapfile/geomet-climate-{}-{}.map'.format(
+                BASEDIR, service, lang)
+            if not os.path.exists(mapfile_):
+                continue
+
+            # parse only: requests clone the cached mapfile
+            get_parsed_mapfile(mapfile_)
+
+            cached_caps = get_capabilities_path(service, lang)
+            if os.path.isfile(cached_caps):
+                load_capabilities(cached_caps, mapfile_)
+
+
+def watch_build(interval):
+    """
+    Poll the build and gracefully reload the workers (SIGHUP to the
+    server) once a new build has landed and settled (unchanged for an
+    interval)
+
+    :param interval: polling interval (seconds)
+
+    :returns: None (runs forever)
+    """
+
+    loaded = previous = get_build_mtime()
+
+    while True:
+        time.sleep(interval)
+        build_mtime = get_build_mtime()
+
+        if build_mtime != loaded and build_mtime == previous:
+            LOGGER.info('New build detected, reloading workers')
+            loaded = build_mtime
+            os.kill(os.getpid(), signal.SIGHUP)
+
+        previous = build_mtime
+
+
+def serve_gunicorn(port, workers, threads, reload_interval, access_log=None,
+                   timeout=900):
+    """
+    Serve geomet-climate via gunicorn pre-forked workers
+
+    :param port: port
+    :param workers: number of worker processes
+    :param threads: number of threads per worker
+    :param reload_interval: interval (seconds) at which new builds are
+                            checked (0 to disable)
+    :param access_log: path to access log (None for no access log)
+    :param timeout: seconds after which silent workers are restarted
+
+    :returns: None
+    """
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('--workers/--threads require gunicorn')
+
+    def when_ready(server):
+        if reload_interval > 0:
+            threading.Thread(target=watch_build, args=(reload_interval,),
+                             daemon=True).start()
+
+    def on_reload(server):
+        warm_caches()
+
+    def post_fork(server, worker):
+        # workers share their own metrics, not those of the master
+        reset_metrics()
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', '0.0.0.0:{}'.format(port))
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('accesslog', access_log)
+            self.cfg.set('when_ready', when_ready)
+            self.cfg.set('on_reload', on_reload)
+            self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            warm_caches()
+            return application
+
+    metrics_dir = None
+    pid = os.getpid()
+    if METRICS:
+        # merge the metrics of all workers (and of restarted workers) at
+        # /metrics, whichever worker serves the scrape
+        metrics_dir = METRICS_DIR or tempfile.mkdtemp(
+            prefix='geomet-climate-metrics-')
+        set_metrics_dir(metrics_dir)
+
+    click.echo('Serving on port {} ({} workers, {} threads)'.format(
+        port, workers, threads))
+    try:
+        Server().run()
+    finally:
+        # workers exit through here too
+        if all([metrics_dir is not None, METRICS_DIR is None,
+                os.getpid() == pid]):
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
 @click.command()
 @click.pass_context
 @click.option('--port', '-p', type=int, help='port', default=8099)
-def serve(ctx, port):
-    """Serve geomet-climate via wsgiref, for dev"""
+@click.option('--workers', '-w', type=int,
+              help='number of worker processes (serves via gunicorn)')
+@click.option('--threads', '-t', type=int,
+              help='number of threads per worker (serves via gunicorn)')
+@click.option('--reload-interval', type=int, default=30,
+              help='interval (seconds) at which new builds are checked, '
+                   'gracefully reloading workers (0 to disable)')
+@click.option('--access-log', help='path to access log (- for stdout)')
+@click.option('--timeout', type=int, default=900,
+              help='seconds after which silent workers are restarted '
+                   '(serves via gunicorn)')
+def serve(ctx, port, workers, threads, reload_interval, access_log, timeout):
+    """Serve geomet-climate via wsgiref (for dev) or gunicorn workers"""
+
+    if workers is not None or threads is not None:
+        serve_gunicorn(port, workers or 1, threads or 1, reload_interval,
+                       access_log, timeout)
+        return
 
     from wsgiref.simple_server import make_server
     httpd = make_server('', port, application)
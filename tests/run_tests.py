@@ -18,29 +18,103 @@
 ###############################################################################
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+import copy
+import gc
+import gzip
 import io
 import json
+import multiprocessing
 import os
+import shutil
+import signal
+import tempfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+from click.testing import CliRunner
+import mappyfile
+import mapscript
+from osgeo import ogr
 import yaml
 from yaml import CLoader
 
 from geomet_climate.vrt import (create_vrt,
+                                generate as generate_vrt,
                                 generate_vrt_list)
 
 from geomet_climate.tileindex import (generate_vrt_list as tileindex_list,
                                       get_time_index_novrt,
                                       get_time_index_vrt,
-                                      create_dataset)
+                                      create_dataset,
+                                      generate as generate_tileindex,
+                                      get_consolidated_table,
+                                      get_dataset,
+                                      write_consolidated_tileindex)
 
-from geomet_climate.mapfile import (gen_web_metadata,
+from geomet_climate.mapfile import (PROJ4_CACHE,
+                                    dump_mapfile,
+                                    gen_web_metadata,
                                     gen_layer_metadataurl,
-                                    gen_layer)
+                                    gen_layer,
+                                    get_proj4,
+                                    load_proj4_cache,
+                                    save_proj4_cache)
+
+from geomet_climate.cache import LRUCache, ResponseCache
+from geomet_climate.capabilities import (compress as compress_capabilities,
+                                         compress_file,
+                                         generate as generate_capabilities)
+from geomet_climate.manifest import (get_fingerprint, load_manifest,
+                                     save_manifest)
+from geomet_climate.metrics import (Histogram, RequestTimer,
+                                    count_cache_lookup, flush_metrics,
+                                    render_metrics, reset_metrics,
+                                    set_metrics_dir)
+from geomet_climate.profiling import get_profile_name
+from geomet_climate.seed import prune as prune_cache, seed as seed_cache
+from geomet_climate.style import get_style_digest, load_style
+from geomet_climate.tiles import (InvalidTile, get_bbox, get_metatile,
+                                  validate_tile)
+
+from geomet_climate.timedimension import InvalidTimeFormat, TimeDimension
+from geomet_climate.wsgi import (MAPFILE_CACHE, get_build_mtime,
+                                 get_layer_mapfile, get_response_key,
+                                 is_not_modified, load_mapfile,
+                                 load_merged_mapfile, load_request,
+                                 negotiate_encoding, watch_build)
 
 THISDIR = os.path.dirname(os.path.realpath(__file__))
 
+# minimal per-layer mapfile, with a tileindex layer like generated ones
+LAYER_MAPFILE = '''MAP
+  NAME "{0}"
+  EXTENT -180 -90 180 90
+  SIZE 16 16
+  IMAGETYPE "png"
+  LAYER
+    NAME "{0}-tileindex"
+    TYPE POLYGON
+    STATUS OFF
+  END
+  LAYER
+    NAME "{0}"
+    TYPE POINT
+    STATUS ON
+    FEATURE
+      POINTS 0 0 END
+    END
+    CLASS
+      STYLE
+        COLOR 255 0 0
+        SIZE 4
+      END
+    END
+  END
+END
+'''
+
 
 def msg(test_id, test_description):
     """convenience function to print out test id and desc"""
@@ -154,6 +228,451 @@ class GeoMetClimateTest(unittest.TestCase):
         self.assertEqual(result['{}{}'.format(vrt_name, '_63.vrt')],
                          '2068-01-00T00:00:00')
 
+    def test_time_dimension(self):
+        """Resolve time values to bands of a time dimension"""
+        layer_name = 'CANGRD.ANO.PR_MONTHLY'
+        layer_info = self.cfg['layers'][layer_name]
+
+        result = TimeDimension.from_layer_info(layer_info)
+
+        self.assertEqual(len(result), 1380)
+        self.assertEqual(result.index('1900-01'), 0)
+        self.assertEqual(result.index('1929-05'), 352)
+        self.assertEqual(result.value(352), '1929-05')
+        self.assertEqual(result.timestamp(1379), '2014-12-00T00:00:00')
+        self.assertIsNone(result.index('2015-01'))
+        with self.assertRaises(InvalidTimeFormat):
+            result.index('1929')
+
+        result = TimeDimension.from_extent('2006/2100/P1Y')
+
+        self.assertEqual(len(result), 95)
+        self.assertEqual(result.index('2068'), 62)
+        self.assertEqual(list(result)[-1], '2100')
+        self.assertIsNone(result.index('2005'))
+        with self.assertRaises(ValueError):
+            result.index('foo')
+
+    def test_load_style(self):
+        """Load style classes once per process"""
+        style = 'mapserv/class/temp_anomalies.json'
+
+        result = load_style(style)
+
+        self.assertIsInstance(result, tuple)
+        self.assertIs(result, load_style(style))
+        self.assertTrue(all('style' in class_ for class_ in result))
+        with self.assertRaises(FileNotFoundError):
+            load_style('mapserv/class/foo.json')
+
+    def test_lru_cache(self):
+        """Evict least recently used items beyond the cache size"""
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_response_cache(self):
+        """Serve responses from memory, then disk, within the disk size"""
+        tmpdir = tempfile.mkdtemp()
+        cache = ResponseCache(1, tmpdir, 1000)
+
+        cache.set('aaaa', 'image/png', b'a' * 400)
+        cache.set('bbbb', 'image/png', b'b' * 400)
+        self.assertEqual(len(cache.memory), 1)
+
+        # evicted from memory, still on disk
+        self.assertEqual(cache.get('aaaa'), ('image/png', b'a' * 400))
+
+        cache.set('cccc', 'image/jpeg', b'c' * 400)
+        # items being written are not part of the cache
+        with io.open(cache.disk.get_path('ccccdd') + '.tmp', 'wb') as fh:
+            fh.write(b'd' * 400)
+        self.assertLessEqual(cache.disk.prune(), 1000)
+        self.assertLessEqual(cache.disk.get_size(), 1000)
+        self.assertTrue(os.path.exists(cache.disk.get_path('ccccdd') + '.tmp'))
+        self.assertEqual(cache.get('cccc'), ('image/jpeg', b'c' * 400))
+
+        # so is marking items as recently used
+        with patch('geomet_climate.cache.os.utime',
+                   side_effect=PermissionError):
+            self.assertEqual(ResponseCache(1, tmpdir, 1000).get('cccc'),
+                             ('image/jpeg', b'c' * 400))
+
+        # disk caching is best effort
+        cache = ResponseCache(1, cache.disk.get_path('cccc'), 1000)
+        cache.set('eeee', 'image/png', b'e' * 400)
+        self.assertEqual(cache.get('eeee'), ('image/png', b'e' * 400))
+
+        shutil.rmtree(tmpdir)
+
+    def test_get_response_key(self):
+        """Key responses by normalized parameters and mapfile builds"""
+        tmpdir = tempfile.mkdtemp()
+        mapfiles = []
+        for name in ['en', 'FOO', 'BAR']:
+            mapfiles.append(os.path.join(
+                tmpdir, 'geomet-climate-WMS-{}.map'.format(name)))
+            with io.open(mapfiles[-1], 'w') as fh:
+                fh.write(LAYER_MAPFILE.format(name))
+
+        key = get_response_key('service=wms&LAYERS=FOO,BAR', mapfiles)
+        self.assertEqual(
+            key, get_response_key('LAYERS=FOO,BAR&SERVICE=WMS', mapfiles))
+        self.assertNotEqual(
+            key, get_response_key('LAYERS=BAR,FOO&SERVICE=WMS', mapfiles))
+
+        # rebuilding a single per-layer mapfile changes the key
+        stat = os.stat(mapfiles[2])
+        os.utime(mapfiles[2], ns=(stat.st_atime_ns,
+                                  stat.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(
+            key, get_response_key('service=wms&LAYERS=FOO,BAR', mapfiles))
+
+        shutil.rmtree(tmpdir)
+
+    def test_load_request(self):
+        """Parse requests from their query string or POST body"""
+        def get_env(body, content_type, length=None, query_string=''):
+            return {
+                'REQUEST_METHOD': 'POST',
+                'QUERY_STRING': query_string,
+                'CONTENT_TYPE': content_type,
+                'CONTENT_LENGTH': str(len(body)) if length is None
+                else length,
+                'wsgi.input': io.BytesIO(body)
+            }
+
+        request, query_string = load_request({
+            'REQUEST_METHOD': 'GET',
+            'QUERY_STRING': 'SERVICE=WMS&LAYERS=FOO'
+        })
+        self.assertEqual(request.getValueByName('LAYERS'), 'FOO')
+        self.assertEqual(query_string, 'SERVICE=WMS&LAYERS=FOO')
+
+        # form-encoded body
+        body = 'SERVICE=WMS&REQUEST=GetMap&LAYERS=FOO%2CBAR'
+        request, query_string = load_request(get_env(
+            body.encode('utf-8'),
+            'application/x-www-form-urlencoded; charset=UTF-8'))
+        self.assertEqual(request.getValueByName('REQUEST'), 'GetMap')
+        self.assertEqual(request.getValueByName('LAYERS'), 'FOO,BAR')
+        self.assertEqual(query_string, body)
+
+        # XML body
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<GetCapabilities xmlns="http://www.opengis.net/wcs/2.0" '
+                'service="WCS"/>')
+        for content_type in ['application/xml', 'text/xml; charset=UTF-8',
+                             '']:
+            request, query_string = load_request(get_env(
+                body.encode('utf-8'), content_type, query_string='LANG=fr'))
+            self.assertEqual(request.type, mapscript.MS_POST_REQUEST)
+            self.assertEqual(request.postrequest, body)
+            # not cacheable by key-value parameters
+            self.assertEqual(query_string, '')
+
+        # malformed bodies are ignored
+        for env in [get_env(b'SERVICE=WMS', 'text/xml', 'foo'),
+                    get_env(b'SERVICE=WMS', 'text/xml', '-1'),
+                    get_env(b'SERVICE=WMS', 'text/xml', '0'),
+                    get_env(b'SERVICE=\xff\xfe',
+                            'application/x-www-form-urlencoded'),
+                    get_env(b'<\xff/>', 'text/xml')]:
+            self.assertEqual(load_request(env), (None, ''))
+
+        # with the query string still used
+        request, query_string = load_request(get_env(
+            b'\xff', 'text/xml', query_string='SERVICE=WMS'))
+        self.assertEqual(request.getValueByName('SERVICE'), 'WMS')
+        self.assertEqual(query_string, 'SERVICE=WMS')
+
+    def test_histogram(self):
+        """Expose cumulative histogram buckets by label values"""
+        histogram = Histogram('phase_seconds', 'Phases', buckets=(0.1, 1))
+        histogram.observe(0.05, phase='render')
+        histogram.observe(0.5, phase='render')
+        histogram.observe(5, phase='render')
+        histogram.observe(0.1, phase='mapfile')
+
+        lines = histogram.expose()
+        self.assertEqual(lines[1], '# TYPE phase_seconds histogram')
+        self.assertIn('phase_seconds_bucket{phase="mapfile",le="0.1"} 1',
+                      lines)
+        self.assertIn('phase_seconds_bucket{phase="render",le="0.1"} 1',
+                      lines)
+        self.assertIn('phase_seconds_bucket{phase="render",le="1"} 2', lines)
+        self.assertIn('phase_seconds_bucket{phase="render",le="+Inf"} 3',
+                      lines)
+        self.assertIn('phase_seconds_sum{phase="render"} 5.55', lines)
+        self.assertIn('phase_seconds_count{phase="render"} 3', lines)
+
+    def test_load_merged_mapfile(self):
+        """Merge per-layer mapfiles without altering the cached ones"""
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmpdir, 'mapfile'))
+        filepaths = {}
+        for name in ['FOO', 'BAR', 'BAZ']:
+            filepaths[name] = os.path.join(
+                tmpdir, 'mapfile', 'geomet-climate-WMS-{}.map'.format(name))
+            with io.open(filepaths[name], 'w') as fh:
+                fh.write(LAYER_MAPFILE.format(name))
+
+        with patch('geomet_climate.wsgi.BASEDIR', tmpdir), \
+                patch('geomet_climate.wsgi.MERGED_MAPFILE_CACHE',
+                      LRUCache(1)):
+            merged = load_merged_mapfile('WMS', ['FOO', 'BAR'])
+            self.assertEqual(merged.numlayers, 4)
+            self.assertIsNotNone(merged.getLayerByName('FOO'))
+            self.assertIsNotNone(merged.getLayerByName('BAR-tileindex'))
+            self.assertIsNone(load_merged_mapfile('WMS', ['FOO', 'QUX']))
+
+            # the cached per-layer mapfile still owns its layers
+            template = MAPFILE_CACHE.get(filepaths['FOO'])[1]
+            for i in range(template.numlayers):
+                self.assertEqual(template.getLayer(i).index, i)
+                self.assertEqual(template.getLayer(i).map.name, 'FOO')
+
+            # evict the merged mapfile, then serve a single layer
+            del merged
+            load_merged_mapfile('WMS', ['BAR', 'BAZ'])
+            gc.collect()
+
+            mapfile = load_mapfile(filepaths['FOO'])
+            self.assertEqual(mapfile.getLayerByName('FOO').index, 1)
+            self.assertTrue(mapfile.draw().getBytes())
+
+        shutil.rmtree(tmpdir)
+
+    def test_load_mapfile_threads(self):
+        """Parse and merge mapfiles once under concurrent requests"""
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmpdir, 'mapfile'))
+        filepaths = {}
+        for name in ['FOO', 'BAR', 'BAZ']:
+            filepaths[name] = os.path.join(
+                tmpdir, 'mapfile', 'geomet-climate-WMS-{}.map'.format(name))
+            with io.open(filepaths[name], 'w') as fh:
+                fh.write(LAYER_MAPFILE.format(name))
+
+        requests = [['FOO'], ['FOO', 'BAR'], ['BAR', 'BAZ'], ['BAZ']] * 50
+
+        def load(layers):
+            if len(layers) == 1:
+                mapfile = load_mapfile(filepaths[layers[0]])
+            else:
+                mapfile = load_merged_mapfile('WMS', layers)
+            # requests get their own copy
+            mapfile.name = 'request'
+            return [mapfile.getLayer(i).name
+                    for i in range(mapfile.numlayers)]
+
+        merged_cache = LRUCache(4)
+        with patch('geomet_climate.wsgi.BASEDIR', tmpdir), \
+                patch('geomet_climate.wsgi.MERGED_MAPFILE_CACHE',
+                      merged_cache), \
+                patch.object(MAPFILE_CACHE, 'set',
+                             wraps=MAPFILE_CACHE.set) as mapfile_set, \
+                patch.object(merged_cache, 'set',
+                             wraps=merged_cache.set) as merged_set:
+            with ThreadPoolExecutor(16) as executor:
+                results = list(executor.map(load, requests))
+
+            self.assertEqual(mapfile_set.call_count, 3)
+            self.assertEqual(merged_set.call_count, 2)
+
+        for layers, result in zip(requests, results):
+            self.assertEqual(sorted(result), sorted(
+                name for layer in layers
+                for name in [layer, '{}-tileindex'.format(layer)]))
+        for filepath in filepaths.values():
+            self.assertNotEqual(MAPFILE_CACHE.get(filepath)[1].name,
+                                'request')
+
+        shutil.rmtree(tmpdir)
+
+    def test_load_merged_mapfile_invalid_layers(self):
+        """Merge only per-layer mapfiles of actual layers"""
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmpdir, 'mapfile'))
+        # service mapfiles, and a mapfile not serving the layer it is named
+        # after
+        for name, layer in [('FOO', 'FOO'), ('en', 'FOO'), ('fr', 'FOO'),
+                            ('BAR', 'FOO')]:
+            filepath = os.path.join(
+                tmpdir, 'mapfile', 'geomet-climate-WMS-{}.map'.format(name))
+            with io.open(filepath, 'w') as fh:
+                fh.write(LAYER_MAPFILE.format(layer))
+
+        cache = LRUCache(4)
+        with patch('geomet_climate.wsgi.BASEDIR', tmpdir), \
+                patch('geomet_climate.wsgi.MERGED_MAPFILE_CACHE', cache):
+            self.assertIsNone(load_merged_mapfile('WMS', ['en', 'fr']))
+            self.assertIsNone(load_merged_mapfile('WMS', ['FOO', 'en']))
+            self.assertIsNone(load_merged_mapfile(
+                'WMS', ['FOO', '../mapfile/geomet-climate-WMS-fr']))
+            self.assertIsNone(load_merged_mapfile('WMS', ['FOO', 'BAR']))
+            self.assertEqual(len(cache), 0)
+
+            self.assertIsNone(get_layer_mapfile('WMS', 'en'))
+            self.assertIsNone(get_layer_mapfile(
+                'WMS', '{}/mapfile/geomet-climate-WMS-FOO'.format(tmpdir)))
+            self.assertTrue(get_layer_mapfile('WMS', 'FOO').endswith(
+                'geomet-climate-WMS-FOO.map'))
+
+        shutil.rmtree(tmpdir)
+
+    def test_validate_tile(self):
+        """Accept only tiles of the supported tile matrices"""
+        validate_tile('WebMercatorQuad', 0, 0, 0)
+        validate_tile('WorldCRS84Quad', 0, 1, 0)
+        validate_tile('WebMercatorQuad', 18, 2 ** 18 - 1, 2 ** 18 - 1)
+
+        for tile in [('Foo', 0, 0, 0),
+                     ('WebMercatorQuad', -1, 0, 0),
+                     ('WebMercatorQuad', 19, 0, 0),
+                     ('WebMercatorQuad', 0, 1, 0),
+                     ('WebMercatorQuad', 2, -1, 0),
+                     ('WorldCRS84Quad', 1, 4, 0),
+                     ('WorldCRS84Quad', 1, 0, 2)]:
+            with self.assertRaises(InvalidTile):
+                validate_tile(*tile)
+
+    def test_get_bbox(self):
+        """Compute the bounding box of tiles in their CRS"""
+        self.assertEqual(get_bbox('WorldCRS84Quad', 0, 0, 0),
+                         [-180, -90, 0, 90])
+        self.assertEqual(get_bbox('WorldCRS84Quad', 0, 0, 0, 2, 1),
+                         [-180, -90, 180, 90])
+        self.assertEqual(get_bbox('WorldCRS84Quad', 2, 1, 1),
+                         [-135, 0, -90, 45])
+        self.assertEqual(get_bbox('WebMercatorQuad', 1, 1, 0),
+                         [0, 0, 20037508.3427892, 20037508.3427892])
+        self.assertEqual(get_bbox('WebMercatorQuad', 1, 0, 0, 2, 2),
+                         [-20037508.3427892, -20037508.3427892,
+                          20037508.3427892, 20037508.3427892])
+
+    def test_get_metatile(self):
+        """Align metatiles on the tile matrix, clipped to its size"""
+        self.assertEqual(get_metatile('WebMercatorQuad', 5, 13, 6),
+                         (12, 4, 4, 4))
+        self.assertEqual(get_metatile('WebMercatorQuad', 5, 12, 7),
+                         (12, 4, 4, 4))
+        self.assertEqual(get_metatile('WebMercatorQuad', 1, 1, 1),
+                         (0, 0, 2, 2))
+        self.assertEqual(get_metatile('WorldCRS84Quad', 1, 3, 1),
+                         (0, 0, 4, 2))
+        self.assertEqual(get_metatile('WorldCRS84Quad', 3, 15, 7),
+                         (12, 4, 4, 4))
+
+    def test_get_profile_name(self):
+        """Name profiles by their normalized, filename safe request"""
+        self.assertEqual(
+            get_profile_name('', 'service=WMS&layers=CMIP5.TT&bbox=1,2'),
+            'BBOX=1,2_LAYERS=CMIP5.TT_SERVICE=WMS')
+        self.assertEqual(get_profile_name('/CMIP5.TT/-/3/2/2.png', ''),
+                         'CMIP5.TT_-_3_2_2.png')
+        self.assertEqual(get_profile_name('', 'time=../../etc/passwd'),
+                         'TIME=.._.._etc_passwd')
+        self.assertEqual(len(get_profile_name('', 'a=' + 'x' * 500)), 173)
+
+    def test_is_not_modified(self):
+        """Evaluate conditional requests against a cached document"""
+        document = {'etag': 'abc', 'last_modified': 1700000000,
+                    'max_age': None}
+        last_modified = formatdate(1700000000, usegmt=True)
+
+        self.assertFalse(is_not_modified({}, document))
+
+        for if_none_match in ['"abc"', 'W/"abc"', '"foo", "abc"',
+                              '"foo",W/"abc"', '*']:
+            self.assertTrue(is_not_modified(
+                {'HTTP_IF_NONE_MATCH': if_none_match}, document))
+        for if_none_match in ['"foo"', 'abc', '"abc-gzip"', '']:
+            self.assertFalse(is_not_modified(
+                {'HTTP_IF_NONE_MATCH': if_none_match}, document))
+
+        # each content encoding is a representation of its own
+        self.assertTrue(is_not_modified(
+            {'HTTP_IF_NONE_MATCH': '"abc-gzip"'}, document, 'gzip'))
+        self.assertFalse(is_not_modified(
+            {'HTTP_IF_NONE_MATCH': '"abc"'}, document, 'gzip'))
+
+        self.assertTrue(is_not_modified(
+            {'HTTP_IF_MODIFIED_SINCE': last_modified}, document))
+        self.assertTrue(is_not_modified(
+            {'HTTP_IF_MODIFIED_SINCE': formatdate(1700000060, usegmt=True)},
+            document))
+        self.assertFalse(is_not_modified(
+            {'HTTP_IF_MODIFIED_SINCE': formatdate(1699999999, usegmt=True)},
+            document))
+        self.assertFalse(is_not_modified(
+            {'HTTP_IF_MODIFIED_SINCE': 'foo'}, document))
+
+        # If-None-Match takes precedence over If-Modified-Since
+        self.assertFalse(is_not_modified(
+            {'HTTP_IF_NONE_MATCH': '"foo"',
+             'HTTP_IF_MODIFIED_SINCE': last_modified}, document))
+
+    def test_negotiate_encoding(self):
+        """Pick the preferred content encoding accepted by the client"""
+        encodings = ['br', 'gzip']
+
+        for accept_encoding, encoding in [
+                (None, None),
+                ('', None),
+                ('gzip', 'gzip'),
+                ('GZIP', 'gzip'),
+                ('gzip, br', 'br'),
+                ('gzip;q=1.0, br;q=0.5', 'br'),
+                ('gzip, br;q=0', 'gzip'),
+                ('gzip; Q=0, br; q=0', None),
+                ('gzip;level=1;q=0', None),
+                ('br;q=foo, gzip', 'gzip'),
+                ('*', 'br'),
+                ('*;q=0', None),
+                ('br;q=0, *', 'gzip'),
+                ('identity, deflate', None)]:
+            env = {}
+            if accept_encoding is not None:
+                env['HTTP_ACCEPT_ENCODING'] = accept_encoding
+            self.assertEqual(negotiate_encoding(env, encodings), encoding,
+                             accept_encoding)
+
+        # only encodings available for the document
+        self.assertEqual(negotiate_encoding(
+            {'HTTP_ACCEPT_ENCODING': 'br, gzip'}, ['gzip']), 'gzip')
+        self.assertIsNone(negotiate_encoding(
+            {'HTTP_ACCEPT_ENCODING': 'br, gzip'}, []))
+
+    def test_compress_file(self):
+        """Write precompressed variants only when they are worthwhile"""
+        tmpdir = tempfile.mkdtemp()
+        xml_file = os.path.join(tmpdir, 'capabilities.xml')
+        png_file = os.path.join(tmpdir, 'legend.png')
+        content = b'<Layer><Name>foo</Name></Layer>' * 1000
+
+        with io.open(xml_file, 'wb') as fh:
+            fh.write(content)
+        with io.open(png_file, 'wb') as fh:
+            fh.write(os.urandom(1000))
+
+        self.assertIn('gzip', compress_file(xml_file))
+        with gzip.open('{}.gz'.format(xml_file)) as fh:
+            self.assertEqual(fh.read(), content)
+
+        self.assertEqual(compress_file(png_file), [])
+        self.assertFalse(os.path.exists('{}.gz'.format(png_file)))
+
+        shutil.rmtree(tmpdir)
+
     def test_create_dataset_no_raster(self):
         """Should not create a GPKG (Vector layer)"""
         layer_name = 'CLIMATE.STATIONS'
@@ -204,6 +723,57 @@ class GeoMetClimateTest(unittest.TestCase):
 
         self.assertTrue(os.path.isfile(out_file))
 
+    def test_write_consolidated_tileindex(self):
+        """Should replace the records of a layer in a single GPKG"""
+        out_file = os.path.join(self.data_dir, 'tileindex.gpkg')
+        if os.path.isfile(out_file):
+            os.remove(out_file)
+
+        layers = {}
+        for layer_name in ['CMIP5.SIT.RCP45.YEAR.ANO_PCTL50',
+                           'CANGRD.ANO.TX_SUMMER']:
+            layer_info = self.cfg['layers'][layer_name]
+            records = get_dataset(layer_info, self.data_dir)[2]
+            layers[layer_name] = (layer_info['climate_model']['projection'],
+                                  layer_info['climate_model']['extent'],
+                                  records)
+
+        def count_records(layer_name):
+            table = get_consolidated_table(layers[layer_name][0])
+            sql = "SELECT * FROM {} WHERE layer = '{}'".format(
+                table, layer_name)
+            result = ds.ExecuteSQL(sql)
+            count = result.GetFeatureCount()
+            ds.ReleaseResultSet(result)
+            return count
+
+        write_consolidated_tileindex(out_file, layers)
+        # rewriting a layer replaces its records
+        write_consolidated_tileindex(out_file, {
+            'CANGRD.ANO.TX_SUMMER': layers['CANGRD.ANO.TX_SUMMER']
+        })
+
+        ds = ogr.Open(out_file)
+        for layer_name, (projection, extent, records) in layers.items():
+            self.assertEqual(count_records(layer_name), len(records))
+            # tables carry the projection of their layers
+            srs = ds.GetLayerByName(
+                get_consolidated_table(projection)).GetSpatialRef()
+            self.assertIsNotNone(srs)
+        ds = None
+
+        # layers removed from the configuration lose their records
+        write_consolidated_tileindex(out_file, {},
+                                     ['CANGRD.ANO.TX_SUMMER'])
+
+        ds = ogr.Open(out_file)
+        self.assertEqual(count_records('CMIP5.SIT.RCP45.YEAR.ANO_PCTL50'), 0)
+        self.assertEqual(count_records('CANGRD.ANO.TX_SUMMER'),
+                         len(layers['CANGRD.ANO.TX_SUMMER'][2]))
+        ds = None
+
+        os.remove(out_file)
+
     def test_gen_web_metadata(self):
         """test mapfile MAP.WEB.METADATA section creation (En)"""
         url = 'https://fake.url/geomet-climate'
@@ -279,6 +849,496 @@ class GeoMetClimateTest(unittest.TestCase):
         self.assertTrue(result[0]['metadata']['ows_layer_group_fr'] ==
                         ows_layer_group_fr)
 
+    def test_dump_mapfile(self):
+        """write combined mapfile one layer at a time (Fr)"""
+        mapfile = os.path.join(THISDIR,
+                               '../geomet_climate/resources/mapfile-base.json')
+        with io.open(mapfile) as fh:
+            m = json.load(fh, object_pairs_hook=OrderedDict)
+        m['web']['metadata'] = gen_web_metadata(m, self.cfg['metadata'],
+                                                'WMS', 'https://fake.url')
+
+        layers = []
+        for layer_name in ['CMIP5.TT.RCP26.SPRING.2021-2040_PCTL50',
+                           'CANGRD.TREND.TM_ANNUAL']:
+            layer_info = self.cfg['layers'][layer_name]
+            layers.extend(gen_layer(layer_name, layer_info, '/foo/bar/path',
+                                    service='WMS'))
+
+        fh = io.StringIO()
+        dump_mapfile(m, layers, fh, 'fr')
+
+        # the whole mapfile, translated in place, dumps the same
+        metadata = m['web']['metadata']
+        for key in list(metadata):
+            if key.endswith('_fr'):
+                metadata[key[:-3]] = metadata[key]
+        for layer in layers:
+            layer['metadata']['ows_title'] = \
+                layer['metadata']['ows_title_fr']
+            layer['metadata']['ows_layer_group'] = \
+                layer['metadata']['ows_layer_group_fr']
+        m['layers'] = layers
+
+        self.assertEqual(fh.getvalue(), mappyfile.dumps(m))
+
+    def test_get_fingerprint(self):
+        """Fingerprint a layer from its config, styles and data files"""
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            layer_info = copy.deepcopy(
+                self.cfg['layers']['CANGRD.ANO.TX_SUMMER'])
+            layer_info['styles'] = ['style.json']
+
+            os.makedirs(os.path.join(tmpdir, 'resources'))
+            style_path = os.path.join(tmpdir, 'resources', 'style.json')
+            with io.open(style_path, 'w') as fh:
+                fh.write('[{"style": []}]')
+
+            data_dir = os.path.join(tmpdir,
+                                    layer_info['climate_model']['basepath'],
+                                    layer_info['filepath'])
+            os.makedirs(data_dir)
+            data_path = os.path.join(data_dir, '{}_2017.tif'.format(
+                layer_info['filename']))
+            with io.open(data_path, 'wb') as fh:
+                fh.write(b'foo')
+            os.utime(data_path, (1000000000, 1000000000))
+
+            with patch('geomet_climate.style.THISDIR', tmpdir), \
+                    patch('geomet_climate.manifest.DATADIR', tmpdir):
+                get_style_digest.cache_clear()
+                fingerprints = [get_fingerprint(layer_info)]
+                self.assertEqual(get_fingerprint(layer_info),
+                                 fingerprints[0])
+
+                # layer configuration
+                layer_info['timestep'] = 'P2Y'
+                fingerprints.append(get_fingerprint(layer_info))
+
+                # style content
+                with io.open(style_path, 'w') as fh:
+                    fh.write('[{"style": [], "name": "foo"}]')
+                get_style_digest.cache_clear()
+                fingerprints.append(get_fingerprint(layer_info))
+
+                # data file mtime
+                os.utime(data_path, (1000000001, 1000000001))
+                fingerprints.append(get_fingerprint(layer_info))
+
+                # data file size
+                with io.open(data_path, 'wb') as fh:
+                    fh.write(b'foobar')
+                os.utime(data_path, (1000000001, 1000000001))
+                fingerprints.append(get_fingerprint(layer_info))
+
+            self.assertEqual(len(set(fingerprints)), 5)
+        finally:
+            get_style_digest.cache_clear()
+            shutil.rmtree(tmpdir)
+
+    def test_save_manifest(self):
+        """Save the build manifest atomically"""
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with patch('geomet_climate.manifest.MANIFEST_DIR', tmpdir):
+                self.assertEqual(load_manifest('vrt'), {})
+                save_manifest('vrt', {'foo': '1'})
+                self.assertEqual(load_manifest('vrt'), {'foo': '1'})
+
+                # a failed save leaves the previous manifest in place
+                with patch('geomet_climate.manifest.os.replace',
+                           side_effect=OSError):
+                    with self.assertRaises(OSError):
+                        save_manifest('vrt', {'foo': '2'})
+                self.assertEqual(load_manifest('vrt'), {'foo': '1'})
+                self.assertEqual(os.listdir(tmpdir), ['vrt.json'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_generate_incremental(self):
+        """Regenerate only changed layers, forget removed ones"""
+
+        tmpdir = tempfile.mkdtemp()
+        config = os.path.join(tmpdir, 'geomet-climate.yml')
+        layers = {key: self.cfg['layers'][key] for key in
+                  ['CANGRD.ANO.TX_SUMMER',
+                   'CMIP5.SIC.HISTO.SPRING.ANO_PCTL95']}
+
+        def run(layers_):
+            with io.open(config, 'w') as fh:
+                yaml.dump({'layers': layers_}, fh)
+            with patch('geomet_climate.vrt.generate_vrt_list') as gen:
+                result = CliRunner().invoke(generate_vrt, ['--incremental'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            return sorted(call[0][0]['filename']
+                          for call in gen.call_args_list)
+
+        try:
+            with patch('geomet_climate.vrt.CONFIG', config), \
+                    patch('geomet_climate.vrt.BASEDIR', tmpdir), \
+                    patch('geomet_climate.vrt.get_vrt_path',
+                          return_value=None), \
+                    patch('geomet_climate.manifest.MANIFEST_DIR',
+                          os.path.join(tmpdir, 'manifest')):
+                self.assertEqual(len(run(layers)), 2)
+                self.assertEqual(sorted(load_manifest('vrt')),
+                                 sorted(layers))
+
+                # unchanged layers are skipped
+                self.assertEqual(run(layers), [])
+
+                layers['CANGRD.ANO.TX_SUMMER'] = dict(
+                    layers['CANGRD.ANO.TX_SUMMER'], timestep='P2Y')
+                self.assertEqual(run(layers),
+                                 ['CANGRD_hist_JJA_anom_ps50km_TMAX'])
+
+                # removed layers are dropped from the manifest
+                layers.pop('CMIP5.SIC.HISTO.SPRING.ANO_PCTL95')
+                self.assertEqual(run(layers), [])
+                self.assertEqual(list(load_manifest('vrt')),
+                                 ['CANGRD.ANO.TX_SUMMER'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_get_proj4(self):
+        """Convert each distinct projection to PROJ.4 once"""
+
+        with patch.dict(PROJ4_CACHE, clear=True), \
+                patch('geomet_climate.mapfile.osr.SpatialReference') as srs:
+            srs.return_value.ExportToProj4.return_value = '+proj=longlat '
+
+            for wkt in ['GEOGCS["foo"]', 'GEOGCS["foo"]', 'GEOGCS["bar"]']:
+                self.assertEqual(get_proj4(wkt), '+proj=longlat')
+
+            self.assertEqual(srs.call_count, 2)
+            self.assertEqual(sorted(PROJ4_CACHE),
+                             ['GEOGCS["bar"]', 'GEOGCS["foo"]'])
+
+    def test_proj4_cache_manifest(self):
+        """Persist PROJ.4 conversions across builds, per GDAL/PROJ version"""
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with patch.dict(PROJ4_CACHE, clear=True), \
+                    patch('geomet_climate.manifest.MANIFEST_DIR', tmpdir), \
+                    patch('geomet_climate.mapfile.osr.GetPROJVersionMajor',
+                          return_value=9):
+                PROJ4_CACHE['GEOGCS["foo"]'] = '+proj=longlat'
+                save_proj4_cache()
+
+                PROJ4_CACHE.clear()
+                load_proj4_cache()
+                self.assertEqual(PROJ4_CACHE,
+                                 {'GEOGCS["foo"]': '+proj=longlat'})
+
+                # conversions by another PROJ version are not reused
+                PROJ4_CACHE.clear()
+                with patch('geomet_climate.mapfile.osr.GetPROJVersionMajor',
+                           return_value=8):
+                    load_proj4_cache()
+                self.assertEqual(PROJ4_CACHE, {})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_metrics_workers(self):
+        """Merge the metrics of several worker processes"""
+
+        tmpdir = tempfile.mkdtemp()
+
+        def worker(hits):
+            reset_metrics()
+            for i in range(hits):
+                count_cache_lookup('mapfile', True)
+            count_cache_lookup('mapfile', False)
+            timer = RequestTimer()
+            timer.set_labels('WMS', 'GetMap', 'CMIP5.TT.RCP26', 'en')
+            timer.observe()
+            flush_metrics()
+
+        try:
+            with patch('geomet_climate.metrics.METRICS', True):
+                set_metrics_dir(tmpdir)
+
+                # metrics of exited workers are kept
+                context = multiprocessing.get_context('fork')
+                for hits in [1, 2]:
+                    process = context.Process(target=worker, args=(hits,))
+                    process.start()
+                    process.join()
+                    self.assertEqual(process.exitcode, 0)
+
+                # the worker serving the scrape
+                reset_metrics()
+                count_cache_lookup('mapfile', True)
+
+                lines = render_metrics().splitlines()
+        finally:
+            set_metrics_dir(None)
+            reset_metrics()
+            shutil.rmtree(tmpdir)
+
+        self.assertIn('geomet_climate_cache_lookups_total'
+                      '{cache="mapfile",result="hit"} 4', lines)
+        self.assertIn('geomet_climate_cache_lookups_total'
+                      '{cache="mapfile",result="miss"} 2', lines)
+        self.assertIn('geomet_climate_request_phase_seconds_count'
+                      '{lang="en",layer_group="CMIP5",phase="total",'
+                      'request="GetMap",service="WMS"} 2', lines)
+        self.assertEqual(lines.count(
+            '# TYPE geomet_climate_cache_lookups_total counter'), 1)
+
+    def test_generate_tileindex_failure(self):
+        """Report a failed tileindex without aborting the other layers"""
+
+        tmpdir = tempfile.mkdtemp()
+        config = os.path.join(tmpdir, 'geomet-climate.yml')
+        layers = {key: self.cfg['layers'][key] for key in
+                  ['CANGRD.ANO.TX_SUMMER',
+                   'CMIP5.SIC.HISTO.SPRING.ANO_PCTL95']}
+        with io.open(config, 'w') as fh:
+            yaml.dump({'layers': layers}, fh)
+
+        def create_dataset_(layer_info, input_dir, output_dir, vacuum):
+            if layer_info['filename'].startswith('CMIP5'):
+                raise RuntimeError('corrupt file')
+            io.open(os.path.join(output_dir, layer_info['filename']),
+                    'w').close()
+
+        try:
+            with patch('geomet_climate.tileindex.CONFIG', config), \
+                    patch('geomet_climate.tileindex.BASEDIR', tmpdir), \
+                    patch('geomet_climate.tileindex.TILEINDEX_CONSOLIDATED',
+                          False), \
+                    patch('geomet_climate.tileindex.create_dataset',
+                          side_effect=create_dataset_), \
+                    patch('geomet_climate.manifest.MANIFEST_DIR',
+                          os.path.join(tmpdir, 'manifest')):
+                result = CliRunner().invoke(generate_tileindex, [])
+                manifest = load_manifest('tileindex')
+
+            self.assertEqual(result.exit_code, 1, result.output)
+            self.assertIn('Generated 1 of 2 tileindexes', result.output)
+            self.assertRegex(
+                result.output, r'CMIP5.SIC.HISTO.SPRING.ANO_PCTL95  '
+                r'FAILED \(RuntimeError: corrupt file\)')
+            self.assertRegex(result.output, r'CANGRD.ANO.TX_SUMMER  OK')
+            self.assertIn('1 tileindexes failed: '
+                          'CMIP5.SIC.HISTO.SPRING.ANO_PCTL95', result.output)
+
+            # the other layer is written, and only it is recorded
+            self.assertTrue(os.path.exists(os.path.join(
+                tmpdir, 'tileindex', 'CANGRD_hist_JJA_anom_ps50km_TMAX')))
+            self.assertEqual(list(manifest), ['CANGRD.ANO.TX_SUMMER'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_seed_cache(self):
+        """Seed the tile cache, resume seeding, then prune the cache"""
+
+        tmpdir = tempfile.mkdtemp()
+        cache_dir = os.path.join(tmpdir, 'cache')
+        config = os.path.join(tmpdir, 'geomet-climate.yml')
+        layer = 'CANGRD.ANO.TX_SUMMER'
+        with io.open(config, 'w') as fh:
+            yaml.dump({'layers': {layer: self.cfg['layers'][layer]}}, fh)
+
+        mapfile = os.path.join(tmpdir, 'mapfile',
+                               'geomet-climate-WMS-{}.map'.format(layer))
+        os.makedirs(os.path.dirname(mapfile))
+        io.open(mapfile, 'w').close()
+
+        def render_metatile(mapfile, layer, tile_matrix_set, zoom, x, y,
+                            time_, style):
+            x0, y0, columns, rows = get_metatile(tile_matrix_set, zoom, x, y)
+            return {(column, row): b'foo' for column in range(x0, x0 + columns)
+                    for row in range(y0, y0 + rows)}
+
+        def run(args, maxbytes=1073741824):
+            # a new cache per run, as in a new process
+            tile_cache = ResponseCache(16, cache_dir, maxbytes)
+            with patch('geomet_climate.seed.TILE_CACHE', tile_cache), \
+                    patch('geomet_climate.seed.render_metatile',
+                          side_effect=render_metatile) as render:
+                result = CliRunner().invoke(args[0], args[1:])
+            return result, render.call_count
+
+        try:
+            with patch('geomet_climate.seed.CONFIG', config), \
+                    patch('geomet_climate.seed.BASEDIR', tmpdir), \
+                    patch('geomet_climate.seed.RESPONSE_CACHE_DIR',
+                          cache_dir), \
+                    patch('geomet_climate.seed.load_mapfile'):
+                seed_args = [seed_cache, '--zoom=0-1',
+                             '--bbox=-180,-85,180,85']
+
+                # zoom 0 (1 tile) and zoom 1 (2x2 tiles, one metatile)
+                result, renders = run(seed_args)
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn('Seeded 2, skipped 0, failed 0', result.output)
+                self.assertEqual(renders, 2)
+
+                result, renders = run(seed_args + ['--resume'])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn('Seeded 0, skipped 2, failed 0', result.output)
+                self.assertEqual(renders, 0)
+
+                # a missing mapfile fails its metatiles, not the command
+                os.remove(mapfile)
+                result, renders = run(seed_args + ['--resume'])
+                self.assertEqual(result.exit_code, 1, result.output)
+                self.assertIn('Seeded 0, skipped 0, failed 2', result.output)
+                self.assertIn('2 metatiles failed', result.output)
+
+                result, renders = run(seed_args + ['--layer=FOO'])
+                self.assertEqual(result.exit_code, 1, result.output)
+                self.assertIn('Unknown layers: FOO', result.output)
+                self.assertEqual(renders, 0)
+
+                # 5 tiles of 13 bytes (content type and content)
+                result, _ = run([prune_cache])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn('Disk cache size: 65 bytes', result.output)
+
+                # evicted down to 90% of the cache size
+                result, _ = run([prune_cache], maxbytes=40)
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn('Disk cache size: 26 bytes', result.output)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_watch_build(self):
+        """Reload workers once per new build, after it settles"""
+
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmpdir, 'mapfile'))
+        mapfile = os.path.join(tmpdir, 'mapfile', 'geomet-climate-WMS-en.map')
+
+        def build(mtime):
+            io.open(mapfile, 'w').close()
+            os.utime(mapfile, (mtime, mtime))
+
+        class Stop(Exception):
+            pass
+
+        # state of the build at each poll: unchanged, new build being
+        # written (twice), settled (three polls), then stop watching
+        polls = [None, 200, 300, None, None, None]
+
+        def sleep(interval):
+            if not polls:
+                raise Stop()
+            mtime = polls.pop(0)
+            if mtime is not None:
+                build(mtime)
+
+        try:
+            with patch('geomet_climate.wsgi.BASEDIR', tmpdir):
+                self.assertIsNone(get_build_mtime())
+                build(100)
+                self.assertEqual(get_build_mtime(), 100)
+
+                with patch('geomet_climate.wsgi.time.sleep',
+                           side_effect=sleep), \
+                        patch('geomet_climate.wsgi.os.kill') as kill:
+                    with self.assertRaises(Stop):
+                        watch_build(30)
+
+            kill.assert_called_once_with(os.getpid(), signal.SIGHUP)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_generate_capabilities(self):
+        """Write every service and language document atomically"""
+
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmpdir, 'mapfile'))
+
+        mapscript_ = MagicMock(MS_SUCCESS=0)
+        mapscript_.mapObj.return_value.OWSDispatch.return_value = 0
+        mapscript_.msIO_getStdoutBufferBytes.return_value = b'<foo/>'
+
+        replaced = []
+
+        def replace(src, dst):
+            replaced.append((src, dst))
+            os.rename(src, dst)
+
+        try:
+            with patch('geomet_climate.capabilities.BASEDIR', tmpdir), \
+                    patch('geomet_climate.capabilities.mapscript',
+                          mapscript_):
+                with patch('geomet_climate.capabilities.os.replace',
+                           side_effect=replace):
+                    result = CliRunner().invoke(generate_capabilities,
+                                                ['--jobs=1'])
+                self.assertEqual(result.exit_code, 0, result.output)
+
+                filenames = sorted(os.listdir(os.path.join(tmpdir,
+                                                           'mapfile')))
+                self.assertEqual(filenames, [
+                    'geomet-climate-WCS-2.0.1-capabilities-en.xml',
+                    'geomet-climate-WCS-2.0.1-capabilities-fr.xml',
+                    'geomet-climate-WMS-1.3.0-capabilities-en.xml',
+                    'geomet-climate-WMS-1.3.0-capabilities-fr.xml'])
+
+                # written through a temporary file of the same directory
+                self.assertEqual(len(replaced), 4)
+                for src, dst in replaced:
+                    self.assertEqual(os.path.dirname(src),
+                                     os.path.dirname(dst))
+                    self.assertTrue(src.endswith('.tmp'))
+
+                # a failed write keeps the previous document
+                mapscript_.msIO_getStdoutBufferBytes.return_value = b'<bar/>'
+                with patch('geomet_climate.capabilities.os.replace',
+                           side_effect=OSError):
+                    result = CliRunner().invoke(generate_capabilities,
+                                                ['--jobs=1', '--service=WMS'])
+                self.assertNotEqual(result.exit_code, 0)
+                self.assertEqual(sorted(os.listdir(os.path.join(
+                    tmpdir, 'mapfile'))), filenames)
+                with io.open(os.path.join(tmpdir, 'mapfile', filenames[-1]),
+                             'rb') as fh:
+                    self.assertEqual(fh.read(), b'<foo/>')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_compress_capabilities(self):
+        """Precompress documents and legends only when worthwhile"""
+
+        tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmpdir, 'mapfile'))
+        os.makedirs(os.path.join(tmpdir, 'legends'))
+        xml_file = os.path.join(
+            tmpdir, 'mapfile', 'geomet-climate-WMS-1.3.0-capabilities-en.xml')
+        png_file = os.path.join(tmpdir, 'legends', 'foo_en.png')
+
+        with io.open(xml_file, 'wb') as fh:
+            fh.write(b'<Layer><Name>foo</Name></Layer>' * 1000)
+        with io.open(png_file, 'wb') as fh:
+            fh.write(os.urandom(1000))
+        # stale variant of a previous build
+        with io.open('{}.gz'.format(png_file), 'wb') as fh:
+            fh.write(b'foo')
+
+        try:
+            with patch('geomet_climate.capabilities.BASEDIR', tmpdir):
+                result = CliRunner().invoke(compress_capabilities, [])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertTrue(os.path.exists('{}.gz'.format(xml_file)))
+                self.assertFalse(os.path.exists('{}.gz'.format(png_file)))
+
+                # savings under MIN_SAVING are not kept
+                with patch('geomet_climate.capabilities.MIN_SAVING', 0.999):
+                    result = CliRunner().invoke(compress_capabilities, [])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertFalse(os.path.exists('{}.gz'.format(xml_file)))
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()